@@ -0,0 +1,355 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_ChangeDetect.py
+# Purpose:    サンプルスクリプト - 公開年度間の農地筆ポリゴンの変更抽出（polygon_uuid の索引）
+#               a)変換済みの都道府県のフィーチャクラス（Farmland）から、polygon_uuid ⇒ 指紋 の索引を作成
+#                 （指紋はジオメトリ 8 バイト + 属性 8 バイト。レコードそのものは保持しない）
+#               b)新しい公開年度の GeoJSON を1件ずつ読みながら索引と比べ、追加・変更のレコードだけを出力
+#                 （新しい公開年度で見つからなかった polygon_uuid を削除として出力）
+#               c)追加のレコードは last_polygon_uuid（ない場合は prev_last_polygon_uuid）で前の年度の筆と対応付け、
+#                 削除のレコードには、それを引き継いだ新しい筆の polygon_uuid を出力
+#               d)apply を指定した場合は、既存のフィーチャクラスの削除・変更のレコードを削除し、追加・変更のレコードを書き込む
+#                 （全件を読み込み直さずに、新しい公開年度へ更新する）
+#             公開年度ごとに変わるフィールド（issue_year）は比較しない
+#             属性の指紋は、新旧どちらの値も既存のフィーチャクラスのフィールドの型へ変換してから計算
+#               （2024 と 2024.0、NULL と ""、日付と日付の文字列のような型の違いだけでは変更にしない）
+#             ジオメトリの指紋は MP_Farmland_Precision.geometry_fingerprints（格子に丸めた頂点）で計算
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import sys
+import hashlib
+import datetime
+import itertools
+import traceback
+from collections import Counter
+from typing import Tuple,List,Dict
+from MP_Farmland_JsonToFeatureClass import FarmlandGeojsonToFeaturesEx, load_farmland_schema, geojson_to_wkb
+from MP_Farmland_Coerce import FarmlandBatchCoercer, coerce_column, to_pylist
+from MP_Farmland_Precision import geometry_fingerprints
+from MP_Farmland_Prefetch import list_inputs
+from MP_Farmland_Metrics import RunReport, stage, add_count
+
+KEY_FIELD = "polygon_uuid"
+#前の公開年度の筆を指すフィールド（先頭から順に、前の年度の索引にある値を使う）
+LINEAGE_KEYS = ("last_polygon_uuid", "prev_last_polygon_uuid")
+#公開年度ごとに変わるため比較しないフィールド
+RELEASE_FIELDS = ("issue_year",)
+CHANGES_FC = "Farmland_changes" #変更を出力するフィーチャクラス名
+CHANGE_FIELD = "change_type"    #"added" / "removed" / "modified"
+LINEAGE_FIELD = "lineage_uuid"  #追加：前の年度の筆、削除：引き継いだ新しい筆、変更：同じ polygon_uuid
+DEFAULT_GRID = 1e-7 #ジオメトリを比べるときに座標を丸める格子の間隔（緯度経度の場合は度。≒ 1cm）
+_BATCH_SIZE = 10000
+_IN_CHUNK = 500 #1回の IN 句に入れる polygon_uuid の数
+_SEEN = b"" #新しい公開年度で見つかった polygon_uuid の索引の値
+#フィーチャクラスのフィールドの型 ⇒ スキーマの型（属性の指紋を計算する前の型変換に使う）
+_FC_FIELD_TYPES = {
+    "String": "TEXT",
+    "SmallInteger": "SHORT",
+    "Integer": "LONG",
+    "BigInteger": "BIGINTEGER",
+    "Single": "FLOAT",
+    "Double": "DOUBLE",
+    "Date": "DATE",
+}
+
+def _attribute_fingerprint(values) -> bytes:
+    #属性値のタプルの指紋（型が同じになるように、どちらも _normalize_rows で変換した値を使う）
+    return hashlib.blake2b(repr(tuple(values)).encode('utf-8'), digest_size=8).digest()
+
+def _date_value(value):
+    #日付は "YYYY-MM-DD HH:MM:SS" の文字列にする（ISO 形式として読めない文字列は、前後の空白を除いたまま）
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        try:
+            value = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return text
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None, microsecond=0).isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day).isoformat(sep=" ")
+    return value
+
+def _featureclass_fields(fc :str, names :List[str]) -> List[Dict]:
+    '''
+    フィーチャクラスのフィールドの定義を、coerce_column のフィールド定義（{"name", "key", "type", "length"}）にして names の順で返す
+    '''
+    fields = dict((f.name, f) for f in arcpy.ListFields(fc))
+    return [{"name": name, "key": name, "type": _FC_FIELD_TYPES.get(fields[name].type, ""),
+             "length": fields[name].length or None} for name in names]
+
+def _normalize_rows(rows :List, fields :List[Dict]) -> List[Tuple]:
+    '''
+    属性値の行（fields の順）を、列ごとに同じ型変換（coerce_column）で揃えた行のリストにする関数
+      TEXT の NULL は ""、数値の NULL と変換できない値は None、日付は "YYYY-MM-DD HH:MM:SS" の文字列
+    '''
+    columns = []
+    for j, field in enumerate(fields):
+        typed, nulls, rejects, truncated = coerce_column([row[j] for row in rows], field)
+        if field["type"] == "TEXT":
+            columns.append(typed.tolist())
+        elif field["type"] == "DATE":
+            columns.append([_date_value(v) for v in to_pylist(typed, nulls)])
+        else:
+            columns.append(to_pylist(typed, nulls))
+    return list(zip(*columns)) if columns else [() for row in rows]
+
+def __where_in(fc :str, field :str, values :List[str]) -> str:
+    delimited = arcpy.AddFieldDelimiters(fc, field)
+    return u"{0} IN ({1})".format(delimited, u", ".join(u"'{0}'".format(str(v).replace("'", "''")) for v in values))
+
+def __chunks(values :List[str], size :int = _IN_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def __to_wkb(geometry):
+    try:
+        return geojson_to_wkb(geometry)
+    except Exception:
+        return None
+
+class FarmlandChangeIndex():
+    '''
+    既存のフィーチャクラスの polygon_uuid ⇒ 指紋（ジオメトリ 8 バイト + 属性 8 バイト）の索引
+    使い方）
+        index = FarmlandChangeIndex(compare_fields)
+        index.build(old_fc)                        # 属性値は old_fc のフィールドの型へ変換して比べる
+        fps = index.fingerprints(wkbs, rows)       # rows は compare_fields の順の値
+        change = index.match(uuid, fp)             # "added" / "modified" / "unchanged" / "duplicate"
+        removed = index.unseen()                   # 新しい公開年度で見つからなかった polygon_uuid
+    '''
+    def __init__(self, fields :List[str], grid :float = DEFAULT_GRID, key_field :str = KEY_FIELD):
+        self.fields = fields
+        self.grid = grid
+        self.key_field = key_field
+        self.entries = {}
+        self.field_defs = None #build で読み込んだフィーチャクラスのフィールド定義（指紋を計算する前の型変換に使う）
+        return
+    def __del__(self):
+        return
+
+    #public
+    def fingerprints(self, wkbs :List, rows :List) -> List[bytes]:
+        '''
+        WKB と属性値（fields の順）のバッチから、指紋のリストを返す
+        （build の後は、属性値を索引のフィーチャクラスのフィールドの型へ変換してから計算する）
+        '''
+        geoms = geometry_fingerprints(wkbs, self.grid)
+        if self.field_defs is not None:
+            rows = _normalize_rows(rows, self.field_defs)
+        return [(g or b"\0" * 8) + _attribute_fingerprint(row) for g, row in zip(geoms, rows)]
+
+    def build(self, fc :str) -> int:
+        '''
+        フィーチャクラスを読み込んで索引を作成し、件数を返す
+        '''
+        self.field_defs = _featureclass_fields(fc, self.fields)
+        with arcpy.da.SearchCursor(fc, ["SHAPE@WKB", self.key_field] + self.fields) as cursor:
+            while True:
+                batch = list(itertools.islice(cursor, _BATCH_SIZE))
+                if not batch:
+                    break
+                fps = self.fingerprints([row[0] for row in batch], [row[2:] for row in batch])
+                self.entries.update((row[1], fp) for row, fp in zip(batch, fps) if row[1])
+        return len(self.entries)
+
+    def match(self, key :str, fp :bytes) -> str:
+        '''
+        新しい公開年度のレコードを索引と比べて、変更の種類を返す（比べた polygon_uuid は見つかったものとして記録）
+        '''
+        old = self.entries.get(key)
+        if old is None:
+            return "added"
+        if old == _SEEN:
+            return "duplicate"
+        self.entries[key] = _SEEN
+        return "unchanged" if old == fp else "modified"
+
+    def lineage(self, uuids :List[str]) -> str:
+        '''
+        last_polygon_uuid などの値のうち、前の公開年度の索引にある最初の値を返す（ない場合は None）
+        '''
+        for uuid in uuids:
+            if uuid and uuid in self.entries:
+                return uuid
+        return None
+
+    def unseen(self) -> List[str]:
+        return [key for key, value in self.entries.items() if value != _SEEN]
+
+def exec_change_detection(old_fc :str, infolder :str, outfolder :str, apply :bool = False, grid :float = DEFAULT_GRID,
+                          ignore_fields :Tuple[str, ...] = RELEASE_FIELDS):
+    '''
+    公開年度間の変更抽出：
+      old_fc        : 前の公開年度を変換した都道府県のフィーチャクラス（例: 2023_02_filegdb\\2023_02_filegdb.gdb\\Farmland）
+      infolder      : 新しい公開年度の GeoJSON の都道府県フォルダ（または zip ファイル）
+      outfolder     : 出力フォルダ（"<出力フォルダ名>.gdb" に Farmland_changes を作成し、実行レポートを出力）
+      apply         : True の場合は、old_fc を新しい公開年度へ更新する（削除・変更のレコードを削除し、追加・変更のレコードを書き込む）
+      grid          : ジオメトリを比べるときに座標を丸める格子の間隔（座標系の単位）
+      ignore_fields : 比較しないフィールド（公開年度ごとに変わるフィールド）
+      ※apply で更新した場合も、変更のないレコードの ignore_fields の値（issue_year）は前の公開年度のまま
+    '''
+    report = None
+    try:
+        start = datetime.datetime.now()
+        arcpy.AddMessage(u"-- Strat: MP_Farmland_ChangeDetect --:{0}".format(start))
+        report = RunReport("MP_Farmland_ChangeDetect")
+
+        #a) 比較するフィールド（フィーチャクラスのフィールドのうち、polygon_uuid と公開年度ごとに変わるフィールド以外）
+        with stage("load_schema"):
+            schema = load_farmland_schema(infolder)
+        ignore = set(f.lower() for f in ignore_fields)
+        field_list = [f.name for f in arcpy.ListFields(old_fc) if f.type not in ["OID", "Geometry"]
+                          and f.name.lower() not in ["shape_area", "shape_length"]]
+        key_pos = field_list.index(KEY_FIELD)
+        compare_pos = [i for i, f in enumerate(field_list) if i != key_pos and f.lower() not in ignore]
+        lineage_pos = [field_list.index(f) for f in LINEAGE_KEYS if f in field_list]
+        arcpy.AddMessage(u"  Compare fields:{0}".format(u", ".join(field_list[i] for i in compare_pos)))
+
+        #b) 前の公開年度の索引
+        index = FarmlandChangeIndex([field_list[i] for i in compare_pos], grid)
+        with stage("build_index"):
+            index_count = index.build(old_fc)
+        arcpy.AddMessage(u"  Build index:{0} parcels".format(index_count))
+        add_count("index_rows", index_count)
+
+        #c) 変更を出力するフィーチャクラス（既存のフィーチャクラスと同じフィールド + 変更の種類 + 対応する筆）
+        foldername = u"{0}.gdb".format(os.path.basename(outfolder))
+        outws = os.path.join(outfolder, foldername)
+        changes_fc = os.path.join(outws, CHANGES_FC)
+        with stage("create_changes"):
+            if not arcpy.Exists(outws):
+                arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+            if arcpy.Exists(changes_fc):
+                arcpy.management.Delete(changes_fc)
+            arcpy.management.CreateFeatureclass(outws, CHANGES_FC, "POLYGON", template=old_fc,
+                                                spatial_reference=arcpy.Describe(old_fc).spatialReference)
+            arcpy.management.AddField(changes_fc, CHANGE_FIELD, "TEXT", field_length=16)
+            arcpy.management.AddField(changes_fc, LINEAGE_FIELD, "TEXT", field_length=72)
+
+        #d) 新しい公開年度を1件ずつ読みながら索引と比べ、追加・変更のレコードを書き込む
+        field_by_name = dict((field["name"], field) for field in schema["fields"])
+        coerce_fields = [field_by_name.get(field, {"name": field, "key": field, "type": ""}) for field in field_list]
+        convGeojson = FarmlandGeojsonToFeaturesEx()
+        counts = Counter()
+        modified = []
+        successors = {} #前の年度の筆 ⇒ 引き継いだ新しい筆
+        arcpy.AddMessage(u"  Compare new release:{0}".format(infolder))
+        with arcpy.da.InsertCursor(changes_fc, ["SHAPE@WKB"] + field_list + [CHANGE_FIELD, LINEAGE_FIELD]) as icursor:
+            for jsonfile in list_inputs(infolder, ".json"):
+                records = convGeojson.iter_records(jsonfile)
+                coercer = FarmlandBatchCoercer(coerce_fields, source=os.path.basename(jsonfile))
+                while True:
+                    with stage("parse"):
+                        batch = list(itertools.islice(records, _BATCH_SIZE))
+                    if not batch:
+                        break
+                    with stage("geometry"):
+                        wkbs = [__to_wkb(record["geometry"]) for record in batch]
+                    with stage("coerce"):
+                        columns = coercer.coerce(batch)
+                        rows = list(zip(*[to_pylist(typed, nulls) for typed, nulls in columns]))
+                    with stage("compare"):
+                        fps = index.fingerprints(wkbs, [[row[i] for i in compare_pos] for row in rows])
+                        changes = [index.match(row[key_pos], fp) if row[key_pos] else "no_key" for row, fp in zip(rows, fps)]
+                    with stage("write"):
+                        for wkb, row, change in zip(wkbs, rows, changes):
+                            counts[change] += 1
+                            if change == "added":
+                                lineage = index.lineage([row[i] for i in lineage_pos])
+                                if lineage:
+                                    successors.setdefault(lineage, row[key_pos])
+                            elif change == "modified":
+                                lineage = row[key_pos]
+                                modified.append(row[key_pos])
+                            else:
+                                continue
+                            icursor.insertRow((wkb,) + tuple(row) + (change, lineage))
+                    add_count("rows", len(batch))
+                add_count("rejects", coercer.close())
+                add_count("truncated", coercer.truncate_count)
+            #e) 新しい公開年度で見つからなかった筆を、前の年度のフィーチャクラスから削除として書き込む
+            removed = index.unseen()
+            counts["removed"] = len(removed)
+            with stage("removed"):
+                for keys in __chunks(removed):
+                    with arcpy.da.SearchCursor(old_fc, ["SHAPE@WKB"] + field_list, __where_in(old_fc, KEY_FIELD, keys)) as cursor:
+                        for row in cursor:
+                            icursor.insertRow(tuple(row) + ("removed", successors.get(row[1 + key_pos])))
+        del convGeojson
+        for change in ("added", "modified", "removed", "unchanged", "duplicate", "no_key"):
+            add_count(u"{0}_rows".format(change), counts[change])
+        arcpy.AddMessage(u"  Changes: {0} added, {1} modified, {2} removed, {3} unchanged（{4} added with lineage）".format(
+            counts["added"], counts["modified"], counts["removed"], counts["unchanged"], len(successors)))
+        if counts["duplicate"] or counts["no_key"]:
+            arcpy.AddWarning(u"  polygon_uuid が重複したレコード {0}件、ないレコード {1}件 は比較しませんでした".format(
+                counts["duplicate"], counts["no_key"]))
+        arcpy.AddMessage(u"  Output:{0}".format(changes_fc))
+
+        #f) apply：既存のフィーチャクラスを新しい公開年度へ更新（削除・変更を削除してから、追加・変更を書き込む）
+        if apply:
+            deleted = 0
+            with stage("apply_delete"):
+                for keys in __chunks(removed + modified):
+                    with arcpy.da.UpdateCursor(old_fc, [KEY_FIELD], __where_in(old_fc, KEY_FIELD, keys)) as ucursor:
+                        for row in ucursor:
+                            ucursor.deleteRow()
+                            deleted += 1
+            inserted = 0
+            with stage("apply_insert"):
+                with arcpy.da.InsertCursor(old_fc, ["SHAPE@WKB"] + field_list) as icursor:
+                    with arcpy.da.SearchCursor(changes_fc, ["SHAPE@WKB"] + field_list,
+                                               __where_in(changes_fc, CHANGE_FIELD, ["added", "modified"])) as cursor:
+                        for row in cursor:
+                            icursor.insertRow(row)
+                            inserted += 1
+            arcpy.AddMessage(u"  Apply to {0}: {1} rows deleted, {2} rows inserted".format(old_fc, deleted, inserted))
+
+        report.summarize()
+        report.write(outfolder)
+        fin = datetime.datetime.now()
+        arcpy.AddMessage(u"-- Finish: MP_Farmland_ChangeDetect --:{0}".format(fin))
+        arcpy.AddMessage(u"     Elapsed time:{0}".format(fin-start))
+    except:
+        arcpy.AddError(u"Exception:{0}".format(traceback.format_exc()))
+    finally:
+        #失敗した場合も親プロセスの計測を終了する（ArcGIS Pro のプロセスで、次に実行するツールに計測が残らないように）
+        if report is not None:
+            report.close()
+
+if __name__ == '__main__':
+    '''
+    コマンドプロンプトからの実行パラメータを設定の場合：
+      old_fc   : 前の公開年度を変換した都道府県のフィーチャクラス
+      infolder : 新しい公開年度の GeoJSON の都道府県フォルダ（または MAFF からダウンロードした zip ファイル）
+      outfolder: 出力フォルダ
+      例)
+        |-2024_02_changes
+            |-2024_02_changes.gdb
+            |   Farmland_changes # 追加・変更・削除のレコード（change_type, lineage_uuid）
+            |-farmland_run_report.json
+
+      options  : （省略可）apply を指定すると、old_fc を新しい公開年度へ更新する
+                           grid=<間隔> を指定すると、ジオメトリを比べるときに座標を丸める格子の間隔を変更する（既定は 1e-7）
+      例）python.exe MP_Farmland_ChangeDetect.py 2023_02_filegdb\\2023_02_filegdb.gdb\\Farmland 2024_02 2024_02_changes
+      例）python.exe MP_Farmland_ChangeDetect.py 2023_02_filegdb\\2023_02_filegdb.gdb\\Farmland 2024_02 2024_02_changes apply
+    '''
+    args = sys.argv
+    if len(args) >= 4:
+        old_fc = args[1]
+        infolder = args[2]
+        outfolder = args[3]
+        options = [a.lower() for a in args[4:]]
+        grid = DEFAULT_GRID
+        for option in options:
+            if option.startswith("grid="):
+                grid = float(option.split("=", 1)[1])
+        exec_change_detection(old_fc, infolder, outfolder, apply="apply" in options, grid=grid)
+    else:
+        print("Arguments error")
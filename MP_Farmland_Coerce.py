@@ -0,0 +1,208 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Coerce.py
+# Purpose:    サンプルスクリプト - 属性値の型変換（NumPy による列単位の一括変換）
+#               a)GeoJSON の properties をバッチ（既定 10000 件）ごとに列の配列にまとめる
+#               b)列ごとに NumPy でフィールドの型へ一括変換
+#                 （land_type / issue_year / edit_year は int32、point_lng / point_lat は float64、
+#                   local_government_cd は 0 埋めした固定長の文字列）
+#               c)変換できない値は NULL にして、リジェクト（ファイル, 行番号, polygon_uuid, フィールド, 値, 理由）を CSV に出力
+#                 TEXT の長さを超える値は、フィールドの長さで切り詰めて書き込み、元の値を同じ CSV に出力
+#             MP_Farmland_JsonToFeatureClass.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import csv
+import numpy as np
+from typing import Tuple,List,Dict
+
+#リジェクトを出力する CSV の接尾辞（"<中間出力名>_rejects.csv"）
+REJECTS_SUFFIX = u"_rejects.csv"
+#値に関係なく NumPy の型を固定するフィールド（スキーマの型より優先）
+COLUMN_DTYPES = {
+    "land_type": np.int32,
+    "issue_year": np.int32,
+    "edit_year": np.int32,
+    "point_lng": np.float64,
+    "point_lat": np.float64,
+}
+#0 埋めした固定長の数字の文字列にするフィールド：フィールド ⇒ 桁数
+FIXED_WIDTH_CODES = {
+    "local_government_cd": 6,
+}
+#スキーマの型 ⇒ NumPy の型（TEXT は固定長の文字列型にせず、str の object 型の配列のままにする）
+_FIELD_DTYPES = {
+    "SHORT": np.int16,
+    "LONG": np.int32,
+    "BIGINTEGER": np.int64,
+    "FLOAT": np.float32,
+    "DOUBLE": np.float64,
+}
+_REJECT_HEADER = ["source", "row", "polygon_uuid", "field", "value", "reason"]
+
+def __safe_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+_vec_safe_float = np.frompyfunc(__safe_float, 1, 1)
+_vec_str_len = np.frompyfunc(len, 1, 1)
+_vec_isdigit = np.frompyfunc(str.isdigit, 1, 1)
+
+def _to_float64(values :np.ndarray, nulls :np.ndarray) -> np.ndarray:
+    '''
+    object 型の配列を float64 に変換する（変換できない値は NaN）
+    まず配列全体を一括で変換し、文字列などが混ざっていて失敗した場合だけ値ごとに変換する
+    '''
+    filled = np.where(nulls, 0.0, values)
+    try:
+        return filled.astype(np.float64)
+    except (TypeError, ValueError):
+        return _vec_safe_float(filled).astype(np.float64)
+
+def __text_value(value) -> str:
+    #整数値の float は "22012.0" ではなく "22012" にする
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+_vec_text_value = np.frompyfunc(__text_value, 1, 1)
+
+def _to_text(values :np.ndarray, nulls :np.ndarray) -> np.ndarray:
+    '''
+    object 型の配列を、前後の空白を除いた str の object 型の配列に変換する（NULL は ""）
+    固定長の文字列型（<U 最大長）にすると、長い値が1件あるだけで列全体のメモリが最大長に比例して増えるため、object 型のままにする
+    '''
+    texts = np.empty(len(values), dtype=object)
+    texts[:] = u""
+    if (~nulls).any():
+        texts[~nulls] = _vec_text_value(values[~nulls])
+    return texts
+
+def coerce_column(values :List, field :Dict) -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, str]], List[Tuple[int, str]]]:
+    '''
+    1列分の値を、フィールドの型の NumPy 配列に変換する関数
+      (変換後の配列, NULL のマスク, [(リジェクトした行番号, 理由), ...], [(切り詰めた行番号, 理由), ...]) を返す
+      変換できない値は NULL にする（行は残す）
+      TEXT の長さを超える値は、NULL にせずにフィールドの長さで切り詰める
+    field : スキーマのフィールド定義（{"name", "key", "type", "length"}）
+    '''
+    key = field.get("key", field["name"])
+    obj = np.empty(len(values), dtype=object)
+    obj[:] = values
+    nulls = np.equal(obj, None)
+    rejects = []
+    truncated = []
+    dtype = COLUMN_DTYPES.get(key) or _FIELD_DTYPES.get(field["type"].upper())
+    if dtype is not None:
+        floats = _to_float64(obj, nulls)
+        bad = ~nulls & np.isnan(floats)
+        rejects += [(i, u"数値に変換できません") for i in np.flatnonzero(bad)]
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            with np.errstate(invalid="ignore"):
+                fraction = ~nulls & ~bad & (np.floor(floats) != floats)
+                overflow = ~nulls & ~bad & ~fraction & ((floats < info.min) | (floats > info.max))
+            rejects += [(i, u"整数ではありません") for i in np.flatnonzero(fraction)]
+            rejects += [(i, u"{0} の範囲外です".format(np.dtype(dtype).name)) for i in np.flatnonzero(overflow)]
+            bad |= fraction | overflow
+        nulls = nulls | bad
+        typed = np.where(nulls, 0, floats).astype(dtype)
+    elif field["type"].upper() == "TEXT":
+        #値は str の object 型の配列のまま扱い、長さと数字かどうかの判定だけを配列で行う
+        texts = _to_text(obj, nulls)
+        lengths = _vec_str_len(texts).astype(np.int64)
+        width = FIXED_WIDTH_CODES.get(key)
+        if width:
+            short = ~nulls & (lengths < width)
+            if short.any():
+                texts[short] = [t.zfill(width) for t in texts[short]]
+                lengths[short] = width
+            bad = ~nulls & ~(_vec_isdigit(texts).astype(bool) & (lengths == width))
+            rejects += [(i, u"{0}桁の数字ではありません".format(width)) for i in np.flatnonzero(bad)]
+            nulls = nulls | bad
+        else:
+            length = field.get("length") or 255
+            over = ~nulls & (lengths > length)
+            truncated += [(i, u"{0}文字を超えたため切り詰めました".format(length)) for i in np.flatnonzero(over)]
+            if over.any():
+                texts[over] = [t[:length] for t in texts[over]]
+        texts[nulls] = u""
+        typed = texts
+    else:
+        #DATE などは変換せずにそのまま渡す
+        typed = obj
+    rejects.sort()
+    return typed, nulls, rejects, truncated
+
+def to_pylist(typed :np.ndarray, nulls :np.ndarray) -> List:
+    '''
+    変換後の配列を、NULL を None にした Python のリストにする関数（InsertCursor 用）
+    '''
+    values = typed.tolist()
+    for i in np.flatnonzero(nulls):
+        values[i] = None
+    return values
+
+class FarmlandBatchCoercer():
+    '''
+    GeoJSON の properties のバッチを、スキーマのフィールドの型へ列ごとに一括変換するクラス
+    使い方）
+        coercer = FarmlandBatchCoercer(schema["fields"], source=jsonfile, rejects_file=csvfile)
+        columns = coercer.coerce(properties_list)   # [(配列, NULL のマスク), ...]
+        coercer.close()                              # リジェクト・切り詰めた値があれば CSV に書き出す
+    '''
+    def __init__(self, fields :List[Dict], source :str = u"", rejects_file :str = None, id_key :str = "polygon_uuid"):
+        self.fields = fields
+        self.id_key = id_key
+        self.source = source
+        self.rejects_file = rejects_file
+        self.row_count = 0
+        self.reject_count = 0
+        self.truncate_count = 0 #TEXT の長さを超えたため切り詰めた値の件数（CSV にはリジェクトと一緒に元の値を出力）
+        self.__rejects = []
+        return
+    def __del__(self):
+        return
+
+    #public
+    def coerce(self, properties :List[Dict]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        '''
+        properties（dict）のリストを列に分けて変換し、フィールドの順に (配列, NULL のマスク) のリストを返す
+        '''
+        columns = []
+        for field in self.fields:
+            get_key = field.get("key", field["name"])
+            values = [p.get(get_key) for p in properties]
+            typed, nulls, rejects, truncated = coerce_column(values, field)
+            for i, reason in sorted(rejects + truncated):
+                self.__rejects.append([self.source, self.row_count + int(i), properties[i].get(self.id_key), field["name"], values[i], reason])
+            self.reject_count += len(rejects)
+            self.truncate_count += len(truncated)
+            columns.append((typed, nulls))
+        self.row_count += len(properties)
+        return columns
+
+    def close(self) -> int:
+        '''
+        リジェクト・切り詰めた値があれば rejects_file に CSV（UTF-8 BOM 付き）で書き出し、リジェクトの件数を返す
+        （切り詰めた値の件数は truncate_count。どちらもない場合は、前回の実行で出力した CSV を削除する）
+        '''
+        if self.__rejects and self.rejects_file:
+            with open(self.rejects_file, "w", encoding="utf-8-sig", newline="") as fp:
+                writer = csv.writer(fp)
+                writer.writerow(_REJECT_HEADER)
+                writer.writerows(self.__rejects)
+        elif self.rejects_file and os.path.exists(self.rejects_file):
+            os.remove(self.rejects_file)
+        self.__rejects = []
+        return self.reject_count
+
+def rejects_path(outws :str) -> str:
+    '''
+    中間出力（市区町村FGDB / .arrow / .parquet）に対応するリジェクトの CSV のパスを返す関数
+    '''
+    return os.path.splitext(outws)[0] + REJECTS_SUFFIX
@@ -0,0 +1,240 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Columnar.py
+# Purpose:    サンプルスクリプト - 列指向フォーマット（Arrow IPC / GeoParquet）の読み書き
+#               a)変換の中間ファイル：市区町村FGDB の代わりに、ワーカーが WKB と属性を列指向のバッチで書き出す
+#                 （FGDB の作成・書込み・読込み・削除をせずに、親プロセスが1つの InsertCursor で都道府県のFGDB へ書き込む）
+#               b)成果物：都道府県のフィーチャクラスを GeoParquet（WKB のジオメトリ列 + "geo" メタデータ）で出力
+#             pyarrow（ArcGIS Pro の Python 環境に含まれています）がない場合は、中間ファイル・GeoParquet は利用できません
+#             GeoParquet の座標系（PROJJSON）は pyproj で作成する（pyproj がなく、座標系が WGS84 以外の場合は座標系を不明として出力）
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_Merge.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import json
+from typing import Tuple,List,Dict
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+#GeoParquet で "crs" を省略した場合の座標系（OGC:CRS84 = 経度・緯度の順の WGS84）に当たる WKID
+_DEFAULT_CRS_WKID = 4326
+
+ARROW_EXT = ".arrow"
+PARQUET_EXT = ".parquet"
+GEOMETRY_COLUMN = "geometry"
+_BATCH_SIZE = 10000
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(u"列指向フォーマット（Arrow IPC / GeoParquet）の読み書きには pyarrow が必要です")
+
+def _arrow_type(field_type :str):
+    return {
+        "TEXT": pa.string(),
+        "SHORT": pa.int16(),
+        "LONG": pa.int32(),
+        "BIGINTEGER": pa.int64(),
+        "FLOAT": pa.float32(),
+        "DOUBLE": pa.float64(),
+        "DATE": pa.timestamp("ms"),
+    }.get(field_type.upper(), pa.string())
+
+def _to_arrow_array(values :List, arrow_type):
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        #型が揃っていない値が混ざっている場合は、値ごとに変換する（変換できない値は NULL）
+        if pa.types.is_integer(arrow_type):
+            cast = int
+        elif pa.types.is_floating(arrow_type):
+            cast = float
+        elif pa.types.is_string(arrow_type):
+            cast = str
+        else:
+            cast = lambda v: v
+        converted = []
+        for v in values:
+            try:
+                converted.append(None if v is None else cast(v))
+            except (TypeError, ValueError):
+                converted.append(None)
+        return pa.array(converted, type=arrow_type, safe=False)
+
+def is_columnar(path :str) -> bool:
+    '''
+    パスが列指向フォーマット（.arrow / .parquet）のファイルかどうかを返す関数
+    '''
+    return os.path.splitext(path)[1].lower() in (ARROW_EXT, PARQUET_EXT)
+
+def projjson(wkid :int) -> Dict:
+    '''
+    WKID（EPSG コード）の座標系を PROJJSON の dict で返す関数（pyproj がない場合や、pyproj で作成できない場合は None）
+    '''
+    if pyproj is None or not wkid:
+        return None
+    try:
+        return pyproj.CRS.from_epsg(int(wkid)).to_json_dict()
+    except pyproj.exceptions.CRSError:
+        return None
+
+def geo_metadata(wkid :int, geometry_types :List[str] = None) -> Dict:
+    '''
+    GeoParquet の "geo" メタデータ（ジオメトリ列は WKB）を返す関数
+      - WGS84（4326）の場合は "crs" を省略（GeoParquet の既定の OGC:CRS84）
+      - それ以外の場合は PROJJSON。PROJJSON を作成できない場合や、座標系がない（wkid が 0）場合は null（座標系が不明）
+    '''
+    column = {"encoding": "WKB", "geometry_types": geometry_types or ["Polygon", "MultiPolygon"]}
+    if wkid != _DEFAULT_CRS_WKID:
+        column["crs"] = projjson(wkid)
+    return {"version": "1.0.0", "primary_column": GEOMETRY_COLUMN, "columns": {GEOMETRY_COLUMN: column}}
+
+def arrow_schema(fields :List[Dict], wkid :int):
+    '''
+    フィールド定義（{"name", "type"} のリスト）から、先頭にジオメトリ列（WKB）を持つ Arrow のスキーマを作成する関数
+    '''
+    _require_pyarrow()
+    columns = [pa.field(GEOMETRY_COLUMN, pa.binary())] + [pa.field(f["name"], _arrow_type(f["type"])) for f in fields]
+    return pa.schema(columns, metadata={b"geo": json.dumps(geo_metadata(wkid)).encode("utf-8")})
+
+class ColumnarBatchWriter():
+    '''
+    (WKB, 属性...) の行を受け取り、batch_size 件ごとに Arrow IPC / Parquet のファイルへ書き出すクラス
+    arcpy.da.InsertCursor と同じく insertRow で書き込めるので、変換処理の書込み先を差し替えて使う
+    型変換済みの列は write_columns で、行に組み直さずに書き込める
+    使い方）
+        with ColumnarBatchWriter(path, schema["fields"], schema["wkid"]) as writer:
+            writer.insertRow([wkb, value1, value2, ...])
+    '''
+    def __init__(self, path :str, fields :List[Dict], wkid :int = 0, batch_size :int = _BATCH_SIZE):
+        _require_pyarrow()
+        self.path = path
+        self.row_count = 0
+        self.__schema = arrow_schema(fields, wkid)
+        self.__batch_size = batch_size
+        self.__rows = []
+        if os.path.splitext(path)[1].lower() == PARQUET_EXT:
+            self.__writer = pq.ParquetWriter(path, self.__schema)
+        else:
+            self.__writer = pa.ipc.new_file(path, self.__schema)
+        return
+    def __del__(self):
+        return
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    #private
+    def __flush(self):
+        if not self.__rows:
+            return
+        columns = list(zip(*self.__rows))
+        arrays = [_to_arrow_array(list(values), field.type) for values, field in zip(columns, self.__schema)]
+        self.__writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.__schema))
+        self.__rows = []
+
+    #public
+    def insertRow(self, row):
+        self.__rows.append(row)
+        self.row_count += 1
+        if len(self.__rows) >= self.__batch_size:
+            self.__flush()
+
+    def write_columns(self, wkbs :List, columns :List):
+        '''
+        型変換済みの列（MP_Farmland_Coerce の (NumPy 配列, NULL のマスク) のリスト）をそのまま1バッチとして書き出す
+        （行に組み直さずに、NumPy 配列から Arrow の配列を作成する）
+        '''
+        self.__flush()
+        arrays = [pa.array(wkbs, type=pa.binary())]
+        for (typed, nulls), field in zip(columns, list(self.__schema)[1:]):
+            try:
+                arrays.append(pa.array(typed, mask=nulls, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                values = [None if null else v for v, null in zip(typed.tolist(), nulls.tolist())]
+                arrays.append(_to_arrow_array(values, field.type))
+        self.__writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.__schema))
+        self.row_count += len(wkbs)
+
+    def close(self):
+        if self.__writer is None:
+            return
+        self.__flush()
+        self.__writer.close()
+        self.__writer = None
+
+def read_columnar(path :str) -> Tuple[List[str], object]:
+    '''
+    Arrow IPC / Parquet のファイルを読み込み、(属性のフィールド名のリスト, (WKB, 属性...) の行のイテレーター) を返す関数
+    '''
+    _require_pyarrow()
+    if os.path.splitext(path)[1].lower() == PARQUET_EXT:
+        source = pa.OSFile(path, "r")
+        pfile = pq.ParquetFile(source)
+        names = pfile.schema_arrow.names
+        batches = pfile.iter_batches(batch_size=_BATCH_SIZE)
+    else:
+        source = pa.memory_map(path, "r")
+        reader = pa.ipc.open_file(source)
+        names = reader.schema.names
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    geom_index = names.index(GEOMETRY_COLUMN)
+    fields = [n for n in names if n != GEOMETRY_COLUMN]
+    order = [geom_index] + [i for i in range(len(names)) if i != geom_index]
+    def rows():
+        try:
+            for batch in batches:
+                columns = [batch.column(i).to_pylist() for i in order]
+                for row in zip(*columns):
+                    yield row
+        finally:
+            source.close() #読み終わったらすぐにファイルを閉じる（マージ後に削除するため）
+    return fields, rows()
+
+def read_columnar_keys(path :str, field :str) -> set:
+    '''
+    Arrow IPC / Parquet のファイルの1列だけを読み込み、値のセットを返す関数（列がない場合は空のセット）
+    '''
+    _require_pyarrow()
+    if os.path.splitext(path)[1].lower() == PARQUET_EXT:
+        if field not in pq.ParquetFile(path).schema_arrow.names:
+            return set()
+        column = pq.read_table(path, columns=[field]).column(0)
+    else:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            if field not in table.schema.names:
+                return set()
+            column = table.column(field)
+    return set(column.to_pylist())
+
+def export_featureclass(fc :str, path :str, batch_size :int = _BATCH_SIZE) -> int:
+    '''
+    フィーチャクラスを GeoParquet（.parquet）または Arrow IPC（.arrow）のファイルに出力し、出力した件数を返す関数
+    '''
+    import arcpy
+    _require_pyarrow()
+    type_names = {"String": "TEXT", "SmallInteger": "SHORT", "Integer": "LONG", "BigInteger": "BIGINTEGER",
+                  "Single": "FLOAT", "Double": "DOUBLE", "Date": "DATE"}
+    fields = [{"name": f.name, "type": type_names.get(f.type, "TEXT")} for f in arcpy.ListFields(fc)
+                  if f.type not in ["OID", "Geometry"] and f.name.lower() not in ["shape_area", "shape_length"]]
+    wkid = arcpy.Describe(fc).spatialReference.factoryCode
+    if wkid != _DEFAULT_CRS_WKID and projjson(wkid) is None:
+        arcpy.AddWarning(u"座標系（WKID:{0}）の PROJJSON を作成できないため、座標系を不明として出力します（pyproj が必要です）：{1}".format(
+            wkid, os.path.basename(path)))
+    with ColumnarBatchWriter(path, fields, wkid, batch_size) as writer:
+        with arcpy.da.SearchCursor(fc, ["SHAPE@WKB"] + [f["name"] for f in fields]) as scursor:
+            for row in scursor:
+                writer.insertRow((None if row[0] is None else bytes(row[0]),) + tuple(row[1:]))
+    return writer.row_count
@@ -0,0 +1,111 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_FolderScan.py
+# Purpose:    サンプルスクリプト - 入力・出力フォルダの確認用の、軽いフォルダの走査
+#               a)os.scandir でフォルダを走査し、条件に合う最初のエントリが見つかった時点で終了
+#                 （glob / os.listdir のように、フォルダ内のすべてのファイルを列挙しない）
+#               b)結果をフォルダのパスごとにキャッシュし、走査したフォルダの更新日時（mtime）が変わっていなければ再利用
+#                 （ツールのパラメータを変更するたびに、ネットワーク共有のフォルダを走査し直さない）
+#             標準ライブラリだけを使う（ツールボックスの読込み時に arcpy 以外の重いモジュールを読み込まない）
+#             Farmland_MP_Convert_toolbox.pyt , MP_Farmland_NationalBatch.py , MP_Farmland_Manifest.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+from typing import Tuple,List,Dict
+
+#差分変換の記録（MP_Farmland_Manifest）のファイル名（出力フォルダの確認で使うので、ツールボックスから読み込めるようにここで定義）
+MANIFEST_NAME = "farmland_manifest.json"
+
+#(処理, フォルダのパス, 条件) ⇒ (結果, [(走査したフォルダ, mtime), ...])
+_cache = {}
+
+def _mtime(path :str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _cached(key :Tuple, scan):
+    #キャッシュした結果を、走査したフォルダの mtime がすべて同じ場合だけ再利用する
+    entry = _cache.get(key)
+    if entry is not None and all(_mtime(path) == mtime for path, mtime in entry[1]):
+        return entry[0]
+    result, scanned = scan()
+    _cache[key] = (result, scanned)
+    return result
+
+def _first_file(folder :str, suffix :str):
+    #フォルダ直下で、拡張子が suffix の最初のファイル
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(suffix) and entry.is_file():
+                return entry.path
+    return None
+
+def find_first(folder :str, suffix :str, depth :int = 0) -> str:
+    '''
+    フォルダ内で拡張子が suffix（例：".json"）の最初のファイルのパスを返す関数（ない場合・フォルダがない場合は None）
+      depth : 0 の場合はフォルダ直下、1 の場合はサブフォルダ直下（例：都道府県フォルダ\\市区町村フォルダ\\*.shp）
+    '''
+    suffix = suffix.lower()
+    def scan():
+        scanned = [(folder, _mtime(folder))]
+        if not os.path.isdir(folder):
+            return None, scanned
+        if depth == 0:
+            return _first_file(folder, suffix), scanned
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name.lower().endswith(".gdb"):
+                    continue
+                #サブフォルダ内のファイルの追加・削除は、サブフォルダの mtime だけが変わる
+                scanned.append((entry.path, _mtime(entry.path)))
+                path = _first_file(entry.path, suffix)
+                if path:
+                    #見つかった場合は、親フォルダと見つかったサブフォルダの mtime だけで結果を確認できる
+                    return path, [scanned[0], scanned[-1]]
+        return None, scanned
+    return _cached(("find_first", folder, suffix, depth), scan)
+
+def is_empty(folder :str) -> bool:
+    '''
+    フォルダが空かどうかを返す関数（最初のエントリが見つかった時点で走査を終了する）
+    '''
+    def scan():
+        scanned = [(folder, _mtime(folder))]
+        if not os.path.isdir(folder):
+            return True, scanned
+        with os.scandir(folder) as entries:
+            return next(entries, None) is None, scanned
+    return _cached(("is_empty", folder), scan)
+
+def prefecture_format(folder :str) -> str:
+    '''
+    都道府県フォルダの形式を返す関数："json"（フォルダ直下に *.json がある）/ "shp"（サブフォルダに *.shp がある）/ None
+    '''
+    if find_first(folder, ".json"):
+        return "json"
+    if find_first(folder, ".shp", depth=1):
+        return "shp"
+    return None
+
+def has_prefecture_folder(rootfolder :str) -> bool:
+    '''
+    ルートフォルダ直下に、GeoJSON 形式またはシェープファイル形式の都道府県フォルダが1つでもあるかを返す関数
+    （最初に見つかった時点で走査を終了する。都道府県フォルダごとの走査の結果はキャッシュを使う）
+    '''
+    if not os.path.isdir(rootfolder):
+        return False
+    with os.scandir(rootfolder) as entries:
+        for entry in entries:
+            if entry.is_dir() and not entry.name.lower().endswith(".gdb") and prefecture_format(entry.path):
+                return True
+    return False
+
+def clear_cache():
+    '''
+    キャッシュをすべて削除する関数
+    '''
+    _cache.clear()
@@ -19,7 +19,104 @@ import datetime
 import traceback
 from typing import Tuple,List,Dict
 import json
+import re
+import itertools
+import io
+import struct
+import array
+import codecs
+import hashlib
 import chardet
+from MP_Farmland_Merge import merge_as_completed
+from MP_Farmland_Schedule import schedule_largest_first, run_scheduled_task, shard_count, PREDICT_BYTES_PER_SEC
+from MP_Farmland_Manifest import FarmlandManifest, prepare_incremental, manifest_recorder
+from MP_Farmland_Columnar import ColumnarBatchWriter, is_columnar, export_featureclass, ARROW_EXT, PARQUET_EXT
+from MP_Farmland_Coerce import FarmlandBatchCoercer, to_pylist, rejects_path
+from MP_Farmland_Metrics import RunReport, stage, add_count
+from MP_Farmland_Precision import GeometryReducer, parse_precision_args
+from MP_Farmland_Prefetch import FarmlandPrefetcher, list_inputs, input_size, open_input, DEFAULT_CACHE_BYTES
+
+#ストリーミング読込み用："features" 配列の開始と、配列要素間の区切り（空白とカンマ）
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+_FEATURES_SEPARATOR = re.compile(r'[\s,]*')
+#分割の境界：カンマに続く Feature の先頭（グループ1 が Feature の { の位置）
+_FEATURE_BOUNDARY = re.compile(rb',\s*(\{)\s*"type"\s*:\s*"Feature"\s*[,}]')
+
+#スキーマ（フィールド定義）の推定関連
+#  _SCHEMA_VERSION       : スキーマファイルの形式・推定ルールのバージョン（変更した場合は上げて、古いキャッシュを使わないようにする）
+#  _FIELD_TYPE_OVERRIDES : 値に関係なく型を固定するフィールド
+#  _TEXT_LENGTH_FLOORS   : TEXT の長さの下限（推定では広げるだけで、これより短くしない）
+#  _DEFAULT_TEXT_LENGTH  : _TEXT_LENGTH_FLOORS にないフィールドの TEXT の長さの下限（ArcGIS の既定値）
+#  _SAMPLE_RANGES        : スキーマを推定するときに、1ファイルを何個の範囲に分けてサンプリングするか
+#                          （各範囲の先頭から決まった件数だけをデコードし、ファイル全体はデコードしない）
+_SCHEMA_VERSION = 2
+_FIELD_TYPE_OVERRIDES = {
+    "local_government_cd": "TEXT", #先頭の 0 を残すため TEXT
+    "land_type": "LONG",
+    "issue_year": "LONG",
+    "edit_year": "LONG",
+}
+_TEXT_LENGTH_FLOORS = {
+    "history": 10000, #農地筆ポリゴンのhistory列はデフォルトの255では長さが足りない
+}
+_DEFAULT_TEXT_LENGTH = 255
+_SAMPLE_RANGES = 4
+_FIELD_TYPES = ("TEXT", "LONG", "DOUBLE", "SHORT", "FLOAT", "DATE")
+#複数のスキーマをまとめる場合に、型が異なるフィールドで使う型の優先順（後ろほど広い型。DATE と数値が混在する場合は TEXT）
+_FIELD_TYPE_WIDTH = {"SHORT": 0, "LONG": 1, "FLOAT": 2, "DOUBLE": 3, "DATE": 4, "TEXT": 5}
+#文字コードの判定で読み進める最大のバイト数と、判定できない場合の文字コード
+_ENCODING_SCAN_BYTES = 4 * 1024 * 1024
+_FALLBACK_ENCODING = 'cp932'
+#テンプレートのフィーチャクラスを作成する作業用のファイルジオデータベース名（出力フォルダに作成し、最後に削除）
+TEMPLATE_GDB = "_template.gdb"
+#マージ後に属性インデックスを作成するフィールド
+INDEX_FIELDS = ["local_government_cd", "polygon_uuid"]
+#このサイズを超える GeoJSON ファイルは、複数のプロセスに分割して変換する
+SHARD_SIZE = 256 * 1024 * 1024
+#属性値の型変換（MP_Farmland_Coerce）と書込みをまとめて行う件数
+_COERCE_BATCH_SIZE = 10000
+_LONG_RANGE = (-2**31, 2**31 - 1)
+
+#
+# GeoJSON の Polygon / MultiPolygon の座標配列から、直接 WKB（OGC Well-Known Binary, リトルエンディアン）を作成する
+# - arcpy.AsShape のように GeoJSON の dict を解釈し直したり、中間オブジェクトを作成したりしないので高速
+# - InsertCursor には SHAPE@WKB トークンで書き込む
+# - Z 値などの3番目以降の座標は無視する（農地筆ポリゴンは2次元）
+#
+_WKB_POLYGON_HEADER = struct.Struct('<BII')
+_WKB_COUNT = struct.Struct('<I')
+
+def __append_polygon_wkb(rings, out):
+    out.append(_WKB_POLYGON_HEADER.pack(1, 3, len(rings))) # 1:リトルエンディアン, 3:Polygon
+    for ring in rings:
+        out.append(_WKB_COUNT.pack(len(ring)))
+        if ring and len(ring[0]) == 2:
+            coords = array.array('d', itertools.chain.from_iterable(ring))
+        else:
+            coords = array.array('d', itertools.chain.from_iterable(pt[:2] for pt in ring))
+        out.append(coords.tobytes() if sys.byteorder == 'little' else __byteswap(coords))
+
+def __byteswap(coords):
+    coords.byteswap()
+    return coords.tobytes()
+
+def geojson_to_wkb(geometry):
+    '''
+    GeoJSON の geometry（dict）を WKB の bytes に変換する関数
+    Polygon / MultiPolygon 以外のジオメトリは arcpy.AsShape で変換する
+    '''
+    gtype = geometry["type"]
+    out = []
+    if gtype == "Polygon":
+        __append_polygon_wkb(geometry["coordinates"], out)
+    elif gtype == "MultiPolygon":
+        polygons = geometry["coordinates"]
+        out.append(_WKB_POLYGON_HEADER.pack(1, 6, len(polygons))) # 6:MultiPolygon
+        for rings in polygons:
+            __append_polygon_wkb(rings, out)
+    else:
+        return arcpy.AsShape(geometry).WKB
+    return b"".join(out)
 
 #
 # 次のような理由により、自前のGeoJSONからフィーチャクラスへの変換するクラスで対応する
@@ -30,39 +127,208 @@ import chardet
 # - GistにあったGeoJSON からFeatureClass へArcPyで変換する方法を参考にしながら実装
 #   https://gist.github.com/d-wasserman/070ec800584d18a22e1b5a636ca183b7
 # 
+class _ByteRange():
+    #入力ファイルの [start, end) のバイト位置の範囲だけを読むラッパー（end が None の場合はファイルの最後まで）
+    def __init__(self, fp, start=0, end=None):
+        if start > 0:
+            fp.seek(start)
+        self._fp = fp
+        self._remaining = None if end is None else max(0, end - start)
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self._fp.close()
+    def read(self, size=-1):
+        if self._remaining is None:
+            return self._fp.read(size)
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fp.read(size)
+        self._remaining -= len(data)
+        return data
+    def read1(self, size=-1):
+        return self.read(size)
+
+def feature_byte_ranges(jsonfile :str, count :int, window :int = 1024*1024) -> List[Tuple[int, int]]:
+    '''
+    GeoJSON ファイルを count 個の範囲に分割する、Feature の境界のバイト位置のリスト [(開始, 終了), ...] を返す関数
+    （1ファイルを複数のプロセスで分割して変換する場合に、親プロセスで1回だけ実行する）
+      - ファイルを count 等分した位置から、次の Feature の先頭（直前がカンマの {"type":"Feature"）を探す
+        （文字列の中の " はエスケープされるので、文字列の値の中は一致しない）
+      - デコードはせず、境界の付近だけを読む。最初の範囲は 0 から、ファイルの最後までの範囲の終了は None
+      - 境界が見つからない場合は、その前の範囲をファイルの最後までにして、残りの範囲は空（開始と終了が同じ）にする
+    '''
+    size = input_size(jsonfile)
+    bounds = [0]
+    with open_input(jsonfile) as fb:
+        for i in range(1, count):
+            target = max(bounds[-1] + 1, size * i // count)
+            found = size
+            if target < size:
+                fb.seek(target)
+                buf = b""
+                offset = target
+                while True:
+                    chunk = fb.read(window)
+                    buf += chunk
+                    m = _FEATURE_BOUNDARY.search(buf)
+                    if m is not None:
+                        found = offset + m.start(1)
+                        break
+                    if not chunk:
+                        break
+                    #境界がチャンクをまたぐ場合に備えて、末尾だけ残して読み進める
+                    keep = min(len(buf), 64)
+                    offset += len(buf) - keep
+                    buf = buf[-keep:]
+            bounds.append(found)
+    ranges = []
+    for start, end in zip(bounds, bounds[1:] + [size]):
+        if start >= size:
+            ranges.append((size, size)) #境界が見つからなかった範囲は空
+        else:
+            ranges.append((start, end if end < size else None))
+    return ranges
+
 class FarmlandGeojsonToFeaturesEx():
     def __init__(self):
         return
     def __del__(self):
         return
     #private
-    def __write_geojson_to_records(self, jsonfile):
-        #gjson_data = json.load(jsonfile, encoding='utf-8')
-        #日本語が属性に入っている場合にcp932 のエラーになるので、encoding を判別して読込するように変更
-        gjson_data= []
-        with open(jsonfile, 'rb') as fb:
-            chardic = []
-            b = fb.read()
-            chardic = chardet.detect(b)
-            with open(jsonfile, 'r', encoding=chardic['encoding']) as fp:
-                gjson_data = json.loads(fp.read())
-        #農地ピンデータがない場合'title': 'Queryの結果データがありませんでした。', 'status': 404,
-        if gjson_data.get("status") == 404:
-            return []
-        records = []
-        arcpy.AddMessage("Geojson being read by row...")
-        for feature in gjson_data["features"]:
-            try:
-                row = {}
-                row["geometry"] = feature["geometry"]
-                row["type"] = feature["geometry"]["type"]
-                feat_dict = feature["properties"]
-                for prop in feat_dict:
-                    row[prop] = feat_dict[prop]
-                records.append(row)
-            except:
-                pass
-        return records
+    #同じフォルダー（同じ公開年度・都道府県）の GeoJSON は文字コードが共通なので、フォルダー単位で判定結果を保持
+    _encoding_cache = {}
+
+    def __resolve_encoding(self, jsonfile, chunk_size=1024*1024, sample_size=64*1024, scan_limit=_ENCODING_SCAN_BYTES):
+        #日本語が属性に入っている場合にcp932 のエラーになるので、encoding を判別して読込する
+        #ファイル全体は読まずに（最大 scan_limit バイト）、次の順に判定し、判定した方法も返す
+        #  cache : 同じフォルダーで判定済みの文字コードを利用
+        #  bom   : UTF-8 の BOM 付き
+        #  ascii : scan_limit バイトまで ASCII のみ（判定結果はキャッシュしない）
+        #  utf-8 : 最初に ASCII 以外が現れた位置から sample_size バイトが UTF-8 として（厳密に）デコードできる
+        #  sample: 最初に ASCII 以外が現れた位置から sample_size バイトを chardet で判定（判定できない場合は cp932）
+        folder = os.path.dirname(os.path.abspath(jsonfile))
+        cached = FarmlandGeojsonToFeaturesEx._encoding_cache.get(folder)
+        encoding, method = 'utf-8', "utf-8"
+        with open_input(jsonfile) as fb:
+            head = fb.read(sample_size)
+            if cached:
+                #キャッシュした文字コードで先頭がデコードできることだけ確認（できない場合は判定し直す）
+                try:
+                    codecs.getincrementaldecoder(cached)('strict').decode(head)
+                    return cached, "cache"
+                except UnicodeDecodeError:
+                    pass
+            if head.startswith(codecs.BOM_UTF8):
+                encoding, method = 'utf-8-sig', "bom"
+            else:
+                #最初に ASCII 以外が現れる位置まで読み進める（scan_limit バイトまで）
+                non_ascii_pos = -1
+                offset = 0
+                chunk = head
+                while chunk and offset < scan_limit:
+                    if not chunk.isascii():
+                        non_ascii_pos = offset + next(i for i, c in enumerate(chunk) if c >= 0x80)
+                        break
+                    offset += len(chunk)
+                    chunk = fb.read(chunk_size)
+                if non_ascii_pos < 0:
+                    #ASCII のみ（404 のファイルなど）は文字コードを決められないのでキャッシュしない
+                    return 'utf-8', "ascii"
+                #直前は ASCII なので、文字の境界から sample_size バイトだけを厳密にデコードする
+                #（末尾で途中になった文字はエラーにしない）
+                fb.seek(non_ascii_pos)
+                window = fb.read(sample_size)
+                try:
+                    codecs.getincrementaldecoder('utf-8')('strict').decode(window)
+                except UnicodeDecodeError:
+                    #UTF-8 ではないので、最初に ASCII 以外が現れた位置から sample_size バイトだけを chardet で判定
+                    #（ASCII だけの先頭を含めると、判定が ASCII 側に引っ張られる）
+                    sample = window
+                    encoding = chardet.detect(sample)['encoding'] or _FALLBACK_ENCODING
+                    method = "sample"
+        FarmlandGeojsonToFeaturesEx._encoding_cache[folder] = encoding
+        return encoding, method
+
+    def __iter_geojson_features(self, jsonfile, encoding, byte_range=None, chunk_size=1024*1024):
+        #GeoJSON 全体を json.loads せずに、"features" 配列の要素（Feature）を1件ずつデコードして返すジェネレーター
+        #メモリ上に保持するのは読込み中のチャンクと、デコード中の Feature のみ
+        #byte_range : (開始, 終了) のバイト位置の範囲だけを読む（feature_byte_ranges で Feature の境界に分割した範囲）
+        #             開始が 0 以外の場合は Feature の先頭から、終了が None の場合はファイルの最後まで読む
+        decoder = json.JSONDecoder()
+        start, end = byte_range or (0, None)
+        with io.TextIOWrapper(_ByteRange(open_input(jsonfile), start, end), encoding=encoding) as fp:
+            buf = fp.read(chunk_size)
+            eof = len(buf) == 0
+            pos = 0
+            if start == 0:
+                #"features" 配列の開始位置まで読み進める
+                m = _FEATURES_START.search(buf)
+                while m is None and not eof:
+                    chunk = fp.read(chunk_size)
+                    eof = len(chunk) == 0
+                    buf += chunk
+                    m = _FEATURES_START.search(buf)
+                if m is None:
+                    #農地ピンデータがない場合'title': 'Queryの結果データがありませんでした。', 'status': 404,
+                    #のような features を持たない小さなJSONになるので、そのままデコードして確認
+                    gjson_data = json.loads(buf) if buf.strip() else {}
+                    if gjson_data.get("status") == 404:
+                        return
+                    for feature in gjson_data.get("features", []):
+                        yield feature
+                    return
+                pos = m.end()
+            while True:
+                pos = _FEATURES_SEPARATOR.match(buf, pos).end()
+                if pos >= len(buf):
+                    if eof:
+                        if end is not None:
+                            #範囲の終わり（次の範囲の Feature の先頭の直前）まで読んだ
+                            return
+                        raise ValueError(u"features 配列が閉じられていません: {0}".format(jsonfile))
+                    #処理済みの部分を捨ててから次のチャンクを読む
+                    buf = buf[pos:] + fp.read(chunk_size)
+                    eof = len(buf) == 0
+                    pos = 0
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    feature, obj_end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    #Feature がチャンクの境界をまたいでいる場合は、次のチャンクを足してデコードし直す
+                    if eof:
+                        raise
+                    chunk = fp.read(chunk_size)
+                    eof = len(chunk) == 0
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                pos = obj_end
+                yield feature
+
+    def __flatten_feature(self, feature):
+        #Feature を geometry と type と properties をフラットにした dict に変換（変換できない場合は None）
+        try:
+            row = {}
+            row["geometry"] = feature["geometry"]
+            row["type"] = feature["geometry"]["type"]
+            feat_dict = feature["properties"]
+            for prop in feat_dict:
+                row[prop] = feat_dict[prop]
+        except:
+            return None
+        return row
+
+    def __iter_geojson_records(self, jsonfile, encoding, byte_range=None):
+        #Feature を1件ずつ、geometry と type と properties をフラットにした dict に変換して返すジェネレーター
+        for feature in self.__iter_geojson_features(jsonfile, encoding, byte_range):
+            row = self.__flatten_feature(feature)
+            if row is not None:
+                yield row
 
     def __get_geom_crs_code(self, record_dict):
         #geometry にCRSがある場合にCRSのコードとして取得
@@ -76,8 +342,111 @@ class FarmlandGeojsonToFeaturesEx():
         crs_code = int(current.split(':')[1])
         return crs_code
 
+    def __get_arctype(self, gtype):
+        arctype = None
+        # GeoJSON Geometry : Point, MultiPoint, LineString, MultiLineString, Polygon, MultiPolygon
+        # https://docs.ogc.org/is/17-003r2/17-003r2.html#38
+        if gtype == "FeatureCollection":
+            arcpy.AddWarning(u"FeatureCollections は、 point,line, polygon のいずれかに分解されます")
+            arctype = "POINT" 
+        elif (gtype == "LineString") or (gtype == "MultiLineString"):
+            arctype = "POLYLINE" 
+        elif (gtype == "MultiPolygon"):
+            arctype = "POLYGON"
+        else:
+            arctype = str(gtype).upper() # POINT, POLYGON
+        return arctype
+
     #public
-    def geojson_to_features(self, jsonfile, output_fc, projection=arcpy.SpatialReference(4326)):
+    def resolve_encoding(self, jsonfile):
+        '''
+        GeoJSON ファイルの文字コードを判定し、(文字コード, 判定方法) を返す
+        （親プロセスで1回だけ判定して、各プロセスに渡すために使う）
+        '''
+        return self.__resolve_encoding(jsonfile)
+
+    def iter_records(self, jsonfile, encoding=None, byte_range=None):
+        '''
+        GeoJSON ファイルのレコード（geometry, type, properties をフラットにした dict）を1件ずつ返すジェネレーター
+          encoding   : 判定済みの文字コード（None の場合は判定する）
+          byte_range : feature_byte_ranges で分割した (開始, 終了) のバイト位置の範囲だけを読む（None の場合はファイル全体）
+        '''
+        if encoding is None:
+            encoding, enc_method = self.__resolve_encoding(jsonfile)
+        return self.__iter_geojson_records(jsonfile, encoding, byte_range)
+
+    def infer_schema(self, records, outws="", release=""):
+        '''
+        レコードのサンプルから、ジオメトリタイプ・座標系・フィールド定義（型と TEXT の長さ）を推定する
+          - 値がすべて整数のフィールドは LONG（LONG の範囲を超える場合は DOUBLE）、小数を含む場合は DOUBLE、文字列を含む場合は TEXT
+          - _FIELD_TYPE_OVERRIDES のフィールドは型を固定
+          - TEXT の長さはサンプル中の最大長の2倍（_TEXT_LENGTH_FLOORS / _DEFAULT_TEXT_LENGTH より短くしない）
+        records : レコード（dict）のイテラブル
+        outws   : フィールド名の検証（ValidateFieldName）に使うワークスペース
+        '''
+        geometry_type = None
+        wkid = 0
+        stats = {} #key -> [値の種類のセット, 文字列としての最大長]
+        count = 0
+        for record in records:
+            count += 1
+            if geometry_type is None:
+                geometry_type = self.__get_arctype(record["type"])
+            if wkid == 0:
+                wkid = self.__get_geom_crs_code(record)
+            for key in record:
+                if key == "geometry" or key == "type":
+                    continue
+                value = record[key]
+                stat = stats.setdefault(key, [set(), 0])
+                if value is None:
+                    continue
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    stat[0].add("str")
+                elif isinstance(value, int):
+                    stat[0].add("int" if _LONG_RANGE[0] <= value <= _LONG_RANGE[1] else "float")
+                else:
+                    stat[0].add("float")
+                stat[1] = max(stat[1], len(str(value)))
+        fields = []
+        for key in stats:
+            kinds, max_length = stats[key]
+            if key in _FIELD_TYPE_OVERRIDES:
+                field_type = _FIELD_TYPE_OVERRIDES[key]
+            elif "str" in kinds or len(kinds) == 0:
+                field_type = "TEXT"
+            elif "float" in kinds:
+                field_type = "DOUBLE"
+            else:
+                field_type = "LONG"
+            field = {"name": arcpy.ValidateFieldName(key, outws), "key": key, "type": field_type}
+            if field_type == "TEXT":
+                #変換前のツールと同じ長さを下限にして、サンプル中に長い値がある場合だけ広げる
+                field["length"] = max(_TEXT_LENGTH_FLOORS.get(key, _DEFAULT_TEXT_LENGTH), max_length * 2)
+            fields.append(field)
+        return {
+            "version": _SCHEMA_VERSION,
+            "release": release,
+            "sample_count": count,
+            "geometry_type": geometry_type,
+            "wkid": wkid,
+            "fields": fields,
+        }
+
+    def geojson_to_features(self, jsonfile, output_fc, projection=arcpy.SpatialReference(4326), schema=None, sample_size=1000,
+                            rejects_file=None, batch_size=_COERCE_BATCH_SIZE, precision=None, encoding=None, byte_range=None):
+        '''
+        GeoJSON ファイルをフィーチャクラスに変換する
+          schema      : load_farmland_schema / infer_schema で作成したスキーマ（None の場合はファイル先頭の sample_size 件から推定）
+          byte_range  : feature_byte_ranges で分割した (開始, 終了) のバイト位置の範囲だけを読んで変換する
+                        （1ファイルを複数のプロセスで分割して変換する場合。ファイル全体はデコードしない）
+          rejects_file: 型変換できなかった値（NULL にして書き込む）を出力する CSV（None の場合は件数の警告のみ）
+          batch_size  : 属性値を列ごとに一括で型変換して書き込む件数
+          precision   : 座標の丸めと頂点の削減の設定（MP_Farmland_Precision.precision_options。None の場合は行わない）
+                        WKB で書き込むジオメトリ（ポリゴン、列指向フォーマット）が対象
+          encoding    : 親プロセスで resolve_encoding により判定した文字コード（None の場合はここで判定する）
+          ※output_fc が .arrow / .parquet のファイルの場合は、フィーチャクラスの代わりに列指向フォーマットで書き出す
+        '''
 
         blResult = True
     
@@ -86,76 +455,122 @@ class FarmlandGeojsonToFeaturesEx():
             name = os.path.split(output_fc)[1]
             
             arcpy.AddMessage(u"{0} への 変換を開始します".format(name))
-            arcpy.AddMessage(u"    GeoJSON のレコード読込み中...")
-            records = self.__write_geojson_to_records(jsonfile)
-            arcpy.AddMessage(u"    GeoJSON の読み込み終わり")
-            if len(records) == 0:
+            #GeoJSON は1件ずつ読込みながら、batch_size 件ごとに書き込む（ファイル全体をメモリに保持しない）
+            enc_start = datetime.datetime.now()
+            if encoding is None:
+                with stage("encoding"):
+                    encoding, enc_method = self.__resolve_encoding(jsonfile)
+            else:
+                enc_method = u"親プロセスで判定"
+            if byte_range is None:
+                add_count("bytes_read", input_size(jsonfile))
+            else:
+                add_count("bytes_read", (byte_range[1] if byte_range[1] is not None else input_size(jsonfile)) - byte_range[0])
+            arcpy.AddMessage(u"    文字コード：{0}（判定方法：{1}、{2:.3f} 秒）".format(
+                encoding, enc_method, (datetime.datetime.now() - enc_start).total_seconds()))
+            #geometry を持たない Feature は読み飛ばす
+            features = (f for f in self.__iter_geojson_features(jsonfile, encoding, byte_range) if isinstance(f.get("geometry"), dict))
+            if schema is None:
+                #スキーマの指定がない場合は、先頭の sample_size 件だけ保持して推定する
+                with stage("parse"):
+                    head = list(itertools.islice(features, sample_size))
+                features = itertools.chain(head, features)
+                with stage("infer_schema"):
+                    schema = self.infer_schema((self.__flatten_feature(f) for f in head), path)
+            with stage("parse"):
+                first_feature = next(features, None)
+            if first_feature is None:
                 arcpy.AddWarning(u"レコードが 0件 のため変換処理を終了します");
                 return True
+            features = itertools.chain([first_feature], features)
+            record_dict = self.__flatten_feature(first_feature)
 
-            gtype = records[0]["type"]
-            arctype = None
-            # GeoJSON Geometry : Point, MultiPoint, LineString, MultiLineString, Polygon, MultiPolygon
-            # https://docs.ogc.org/is/17-003r2/17-003r2.html#38
-            if gtype == "FeatureCollection":
-                arcpy.AddWarning(u"FeatureCollections は、 point,line, polygon のいずれかに分解されます")
-                arctype = "POINT" 
-            elif (gtype == "LineString") or (gtype == "MultiLineString"):
-                arctype = "POLYLINE" 
-            elif (gtype == "MultiPolygon"):
-                arctype = "POLYGON"
-            else:
-                arctype = str(gtype).upper() # POINT, POLYGON
-            record_dict = records[0]
+            arctype = schema["geometry_type"] or self.__get_arctype(record_dict["type"])
             #農地筆ポリゴンのGeoJSON は crs code があるようなので追加
-            crs_code = self.__get_geom_crs_code(record_dict)
+            crs_code = schema["wkid"] or self.__get_geom_crs_code(record_dict)
             if crs_code > 0:
                 projection = arcpy.SpatialReference(crs_code)
-            if not arcpy.Exists(output_fc):
-                arcpy.AddMessage(u"    フィーチャクラス の新規作成...{}".format(arctype))
-                arcpy.management.CreateFeatureclass(path, name, arctype, spatial_reference=projection)
+            columnar = is_columnar(output_fc)
+            if columnar:
+                #列指向フォーマットの中間ファイルは、スキーマのフィールドをそのまま列にする
+                field_list = [field["name"] for field in schema["fields"]]
+            else:
+                with stage("create_fields"):
+                    if not arcpy.Exists(output_fc):
+                        arcpy.AddMessage(u"    フィーチャクラス の新規作成...{}".format(arctype))
+                        arcpy.management.CreateFeatureclass(path, name, arctype, spatial_reference=projection)
 
-            for key in record_dict:
-                if key == "geometry":
-                    continue
-                if key == "type":
-                    continue
-                element = record_dict[key]
-                field_type = "TEXT"
-                field_length = 255
-                #農地筆ポリゴンのhistory列はデフォルトの255では長さが足りないのでlengthを増やす
-                if key == "history":
-                    field_length = 10000
-                #農地筆ポリゴンの"local_government_cd" は TEXT になってほしいので追加
-                if key != "local_government_cd": 
-                    try:
-                        num_element = float(element)
-                        #"land_type", "issue_year", "edit_year" は LONG になってほしいので追加
-                        if ((key != "land_type") or (key != "issue_year") or (key != "edit_year")):
-                            if isinstance(num_element, float):
-                                field_type = "DOUBLE" 
-                        if isinstance(element, int):
-                            field_type = "LONG" 
-                    except:
-                        pass
-                arcpy.AddField_management(in_table=output_fc, field_name=arcpy.ValidateFieldName(key, path), field_type=field_type, field_length=field_length)
-            field_list = [f.name for f in arcpy.ListFields((output_fc)) if f.type not in ["OID", "Geometry"]
-                              and f.name.lower() not in ["shape_area", "shape_length"]]
-            fields = ["SHAPE@"] + field_list
-            arcpy.AddMessage(u"    フィーチャクラス にレコードを書き込み中...")
-            with arcpy.da.InsertCursor(output_fc, fields) as icursor:
-                for record in records:
-                    new_row = []
-                    for field in fields:
-                        if field == "SHAPE@":
+                    #スキーマのフィールドのうち、まだ存在しないものだけを追加
+                    exist_fields = [f.name.lower() for f in arcpy.ListFields(output_fc)]
+                    for field in schema["fields"]:
+                        if field["name"].lower() in exist_fields:
+                            continue
+                        arcpy.AddField_management(in_table=output_fc, field_name=field["name"], field_type=field["type"], field_length=field.get("length"))
+                field_list = [f.name for f in arcpy.ListFields((output_fc)) if f.type not in ["OID", "Geometry"]
+                                  and f.name.lower() not in ["shape_area", "shape_length"]]
+            #フィールド名 ⇒ GeoJSON の properties のキー を事前に対応付けておく（ValidateFieldName で名前が変わる場合がある）
+            #（スキーマにないフィールドは型変換せずにそのまま書き込む）
+            field_by_name = dict((field["name"], field) for field in schema["fields"])
+            coerce_fields = [field_by_name.get(field, {"name": field, "key": field, "type": ""}) for field in field_list]
+            #ポリゴンは arcpy.AsShape を使わずに、座標配列から直接 WKB を作成して SHAPE@WKB で書き込む
+            if arctype == "POLYGON":
+                fields = ["SHAPE@WKB"] + field_list
+                to_shape = geojson_to_wkb
+            elif columnar:
+                fields = ["SHAPE@WKB"] + field_list
+                to_shape = lambda geometry: arcpy.AsShape(geometry).WKB
+            else:
+                fields = ["SHAPE@"] + field_list
+                to_shape = arcpy.AsShape
+            arcpy.AddMessage(u"    GeoJSON を読込みながら フィーチャクラス にレコードを書き込み中...")
+            if columnar:
+                writer = ColumnarBatchWriter(output_fc, schema["fields"], crs_code)
+            else:
+                writer = arcpy.da.InsertCursor(output_fc, fields)
+            #属性値は batch_size 件ごとに列にまとめて、NumPy でフィールドの型へ一括変換してから書き込む
+            coercer = FarmlandBatchCoercer(coerce_fields, source=os.path.basename(jsonfile), rejects_file=rejects_file)
+            #座標の丸めと頂点の削減は、バッチの WKB をまとめて行う
+            reducer = GeometryReducer(**precision) if precision else None
+            #（読込み・デコード、ジオメトリの作成、型変換、書込みの処理時間はバッチごとに計測）
+            with writer as icursor:
+                while True:
+                    with stage("parse"):
+                        batch = list(itertools.islice(features, batch_size))
+                    if not batch:
+                        break
+                    with stage("geometry"):
+                        geoms = []
+                        for feature in batch:
                             try:
-                                geom = arcpy.AsShape(record.setdefault("geometry", None))
+                                geom = to_shape(feature["geometry"])
                             except:
                                 geom = None
-                            new_row.append(geom)
+                            geoms.append(geom)
+                    if reducer:
+                        with stage("precision"):
+                            geoms = reducer.reduce(geoms)
+                    with stage("coerce"):
+                        columns = coercer.coerce([feature.get("properties") or {} for feature in batch])
+                    with stage("write"):
+                        if columnar:
+                            icursor.write_columns(geoms, columns)
                         else:
-                            new_row.append(record.setdefault(str(field), None))
-                    icursor.insertRow(new_row)
+                            for row in zip(geoms, *[to_pylist(typed, nulls) for typed, nulls in columns]):
+                                icursor.insertRow(row)
+                    add_count("rows", len(batch))
+            reject_count = coercer.close()
+            add_count("rejects", reject_count)
+            add_count("truncated", coercer.truncate_count)
+            if reducer:
+                arcpy.AddMessage(reducer.summary())
+                add_count("vertices_in", reducer.vertices_in)
+                add_count("vertices_out", reducer.vertices_out)
+                add_count("wkb_bytes_in", reducer.bytes_in)
+                add_count("wkb_bytes_out", reducer.bytes_out)
+            if reject_count > 0:
+                arcpy.AddWarning(u"    型変換できない値 {0}件 を NULL にしました：{1}".format(reject_count, rejects_file or name))
+            if coercer.truncate_count > 0:
+                arcpy.AddWarning(u"    フィールドの長さを超えた値 {0}件 を切り詰めました：{1}".format(coercer.truncate_count, rejects_file or name))
 
             arcpy.AddMessage(u"{0} への 変換完了".format(name))
         except arcpy.ExecuteError:
@@ -171,52 +586,239 @@ class FarmlandGeojsonToFeaturesEx():
 # 
 # 補助関数の定義
 # 
+#フィールドのエイリアス名の定義（テンプレートのフィーチャクラス作成時と __alter_field_alias で利用）
+_FIELD_ALIASES = [
+    ["polygon_uuid", r"筆ポリゴン"],
+    ["land_type", r"耕地の種類"],
+    ["issue_year", r"公開年度"],
+    ["edit_year", r"調製年度"],
+    ["history", r"履歴"],
+    ["last_polygon_uuid", r"前年筆ポリゴンID"],
+    ["prev_last_polygon_uuid", r"前前年筆ポリゴンID"],
+    ["local_government_cd", r"地方公共団体コード"],
+    ["point_lng", r"重心点座標（経度）"],
+    ["point_lat", r"重心点座標（緯度）"],
+    ["old_polygon_id", r"筆ポリゴンID（旧ID 付与ルール）"]
+]
+#land_typeフィールド用のコード値ドメインの定義
+_LAND_TYPE_DOMAIN = {
+    "name": "land_type_CD",
+    "description": r"耕地の種類",
+    "field": "land_type",
+    "codes": {100: r"田", 200: r"畑"},
+}
+
 def __alter_field_alias(fc):
     '''
     フィールドのエイリアス名を設定する関数
     '''
-    fieldsParams = [
-        ["polygon_uuid", r"筆ポリゴン"],
-        ["land_type", r"耕地の種類"],
-        ["issue_year", r"公開年度"],
-        ["edit_year", r"調製年度"],
-        ["history", r"履歴"],
-        ["last_polygon_uuid", r"前年筆ポリゴンID"],
-        ["prev_last_polygon_uuid", r"前前年筆ポリゴンID"],
-        ["local_government_cd", r"地方公共団体コード"],
-        ["point_lng", r"重心点座標（経度）"],
-        ["point_lat", r"重心点座標（緯度）"],
-        ["old_polygon_id", r"筆ポリゴンID（旧ID 付与ルール）"]
-    ]
     #"old_polygon_id"は2021年度公開の筆ポリゴンファイルのみのためfield_nameが存在している場合のみ処理
     field_names = [f.name for f in arcpy.ListFields(fc)]
-    for p in fieldsParams:
+    for p in _FIELD_ALIASES:
         field_name = p[0]
         alias_name = p[1]
         if field_name in field_names:
             arcpy.management.AlterField(fc, field=field_name, new_field_alias=alias_name)
 
-def __assign_domain(ws, fc):
+def __create_land_type_domain(ws):
     '''
-    land_typeフィールド用に、コード値ドメインを作成して設定する関数
+    land_typeフィールド用のコード値ドメインをワークスペースに作成する関数（作成済みの場合は何もしない）
     '''
-    domName = "land_type_CD"
-    domDesc = r"耕地の種類"
-    field_name = "land_type"
+    domName = _LAND_TYPE_DOMAIN["name"]
+    if domName in [d.name for d in arcpy.da.ListDomains(ws)]:
+        return domName
     #コード値ドメインの作成
-    arcpy.management.CreateDomain(ws, domName, domain_description=domDesc, field_type="LONG", domain_type="CODED")
+    arcpy.management.CreateDomain(ws, domName, domain_description=_LAND_TYPE_DOMAIN["description"], field_type="LONG", domain_type="CODED")
     #ドメインにコード値を追加
-    domDict = {100: r"田", 200: r"畑"}
+    domDict = _LAND_TYPE_DOMAIN["codes"]
     for code in domDict:
         arcpy.management.AddCodedValueToDomain(ws, domName, code, domDict[code])
+    return domName
+
+def __assign_domain(ws, fc):
+    '''
+    land_typeフィールド用に、コード値ドメインを作成して設定する関数
+    '''
+    domName = __create_land_type_domain(ws)
     #フィールドにドメインを適用
-    arcpy.management.AssignDomainToField(fc, field_name, domName)
+    arcpy.management.AssignDomainToField(fc, _LAND_TYPE_DOMAIN["field"], domName)
+
+def create_template_featureclass(ws :str, fcname :str, schema :Dict) -> str:
+    '''
+    スキーマから、フィールド・エイリアス・ドメインを設定済みのテンプレートのフィーチャクラスを作成する関数
+    フィールドは AddFields で一度に追加する（AddField をフィールドの数だけ実行しない）
+    各プロセスはこのフィーチャクラスを Copy して、市区町村のフィーチャクラスを作成する
+    
+    ws     : テンプレートを作成するファイルジオデータベース
+    fcname : テンプレートのフィーチャクラス名
+    schema : load_farmland_schema で作成したスキーマ
+    '''
+    aliases = dict(_FIELD_ALIASES)
+    template_fc = os.path.join(ws, fcname)
+    if schema["wkid"]:
+        projection = arcpy.SpatialReference(schema["wkid"])
+    else:
+        #GeoJSON に座標系がない場合は、GeoJSON（RFC 7946）の既定の WGS84 にする
+        arcpy.AddWarning(u"GeoJSON に座標系の指定がないため、WGS84（4326）として作成します")
+        projection = arcpy.SpatialReference(4326)
+    arcpy.management.CreateFeatureclass(ws, fcname, schema["geometry_type"] or "POLYGON", spatial_reference=projection)
+    domName = __create_land_type_domain(ws)
+    field_description = []
+    for field in schema["fields"]:
+        # [フィールド名, 型, エイリアス, 長さ, 既定値, ドメイン]
+        domain = domName if (field["key"] == _LAND_TYPE_DOMAIN["field"] and field["type"] == "LONG") else ""
+        field_description.append([field["name"], field["type"], aliases.get(field["key"], ""), field.get("length"), None, domain])
+    arcpy.management.AddFields(template_fc, field_description)
+    return template_fc
+
+def __sample_records(convGeojson, jsonfile :str, k :int, ranges :int = _SAMPLE_RANGES) -> List[Dict]:
+    '''
+    1ファイルから k 件程度のレコードをサンプリングする関数
+    feature_byte_ranges でファイルを ranges 個の範囲に分け、各範囲の先頭から k / ranges 件ずつデコードする
+    （読むのは各範囲の先頭付近だけなので、ファイルが大きくても読込みとデコードの量は k 件程度で変わらない）
+    '''
+    encoding, enc_method = convGeojson.resolve_encoding(jsonfile)
+    per_range = max(1, -(-k // ranges))
+    samples = []
+    for byte_range in feature_byte_ranges(jsonfile, ranges) if ranges > 1 else [None]:
+        if byte_range is not None and byte_range[0] == byte_range[1]:
+            continue #境界が見つからなかった（空の）範囲
+        samples += itertools.islice(convGeojson.iter_records(jsonfile, encoding, byte_range), per_range)
+    return samples
+
+def __inputs_digest(infiles :List[str], sample_size :int) -> str:
+    '''
+    入力ファイルの一覧（ファイル名とサイズ）とサンプリングの件数のハッシュを返す関数（スキーマのキャッシュのキー）
+    都道府県ごとに市区町村のファイル名が異なるので、同じ公開年度でも都道府県ごとに別のキャッシュになる
+    '''
+    h = hashlib.sha1()
+    h.update(u"sample\t{0}\t{1}\n".format(sample_size, _SAMPLE_RANGES).encode("utf-8"))
+    for f in sorted(infiles, key=os.path.basename):
+        h.update(u"{0}\t{1}\n".format(os.path.basename(f), input_size(f)).encode("utf-8"))
+    return h.hexdigest()
+
+def __is_valid_schema(schema, release :str, digest :str) -> bool:
+    '''
+    キャッシュから読み込んだスキーマが、この入力に対して再利用できるかを確認する関数
+    （バージョン・公開年度・入力ファイルのハッシュが一致し、フィールド定義が正しい形式であること）
+    '''
+    if not isinstance(schema, dict) or schema.get("version") != _SCHEMA_VERSION:
+        return False
+    if schema.get("release") != release or schema.get("inputs") != digest:
+        return False
+    if not isinstance(schema.get("wkid"), int) or not isinstance(schema.get("fields"), list) or not schema["fields"]:
+        return False
+    names = set()
+    for field in schema["fields"]:
+        if not isinstance(field, dict) or not field.get("name") or not field.get("key") or field.get("type") not in _FIELD_TYPES:
+            return False
+        if field["name"].lower() in names:
+            return False
+        names.add(field["name"].lower())
+        if field["type"] == "TEXT":
+            length = field.get("length")
+            if not isinstance(length, int) or length < _TEXT_LENGTH_FLOORS.get(field["key"], _DEFAULT_TEXT_LENGTH):
+                return False
+    return True
+
+def load_farmland_schema(infolder :str, schema_folder :str = None, sample_size :int = 10000, local_copy=None) -> Dict:
+    '''
+    公開年度ごとのスキーマ（フィールド定義）をキャッシュから読み込む関数
+    キャッシュがない（またはバージョンが異なる）場合は、フォルダー内のすべての GeoJSON ファイルから
+    合計 sample_size 件程度のレコードを（各ファイルを _SAMPLE_RANGES 個の範囲に分けて、範囲ごとの先頭から）
+    サンプリングしてスキーマを推定し、キャッシュに保存する（ファイル全体はデコードしない）
+    
+    infolder      : 市区町村別の GeoJSON ファイルが入った都道府県フォルダ（例: 2024_02）、またはその zip ファイル（例: 2024_02.zip）
+    schema_folder : スキーマファイルの保存先（省略時は infolder の親フォルダ）
+                      ファイル名は farmland_schema_<公開年度>_<入力ファイルとサンプリングの件数のハッシュ>.json
+                      （例: farmland_schema_2024_3f2a9c01b7d4.json）
+                      （同じ親フォルダーに複数の都道府県がある場合も、都道府県ごとに別のファイルになる）
+    local_copy    : 入力ファイル ⇒ 先読みしたローカルのコピーのパス を返す関数（FarmlandPrefetcher.local_copy）
+                      サンプリングはコピーから読む（None を返す入力と、local_copy が None の場合は入力ファイルから読む）
+    '''
+    infiles = list_inputs(infolder, ".json")
+    #フォルダ名・ファイル名の先頭（2024_02, 2024_022012.json）から公開年度を取得
+    m = re.match(r"(\d{4})_", os.path.basename(os.path.normpath(infolder))) or (re.match(r"(\d{4})_", os.path.basename(infiles[0])) if infiles else None)
+    release = m.group(1) if m else os.path.basename(os.path.normpath(infolder))
+    if schema_folder is None:
+        schema_folder = os.path.dirname(os.path.abspath(infolder))
+    digest = __inputs_digest(infiles, sample_size)
+    schema_file = os.path.join(schema_folder, u"farmland_schema_{0}_{1}.json".format(release, digest[:12]))
+    if os.path.exists(schema_file):
+        try:
+            with open(schema_file, 'r', encoding='utf-8') as fp:
+                schema = json.load(fp)
+        except (OSError, ValueError):
+            schema = None
+        if __is_valid_schema(schema, release, digest):
+            arcpy.AddMessage(u"  Use cached schema:{0}".format(schema_file))
+            return schema
+        arcpy.AddWarning(u"キャッシュのスキーマが入力と一致しないため、推定し直します：{0}".format(schema_file))
+    #ファイルごとに、複数の範囲の先頭から同じ件数ずつサンプリング（ファイルの先頭だけに偏らないようにする）
+    per_file = max(1, -(-sample_size // max(len(infiles), 1)))
+    arcpy.AddMessage(u"  Infer schema from {0} files ({1} features/file in {2} ranges)".format(len(infiles), per_file, _SAMPLE_RANGES))
+    convGeojson = FarmlandGeojsonToFeaturesEx()
+    samples = itertools.chain.from_iterable(
+        __sample_records(convGeojson, (local_copy(f) if local_copy else None) or f, per_file) for f in infiles)
+    schema = convGeojson.infer_schema(samples, release=release)
+    schema["inputs"] = digest
+    del convGeojson
+    try:
+        with open(schema_file, 'w', encoding='utf-8') as fp:
+            json.dump(schema, fp, ensure_ascii=False, indent=2)
+        arcpy.AddMessage(u"  Save schema:{0}".format(schema_file))
+    except OSError:
+        #保存先に書き込めない場合でも、推定したスキーマはこの実行で利用する
+        arcpy.AddWarning(u"スキーマファイルを保存できませんでした：{0}".format(schema_file))
+    return schema
+
+def union_schemas(schemas :List[Dict]) -> Dict:
+    '''
+    複数の都道府県のスキーマを、すべての都道府県のフィールドが入る1つのスキーマにまとめる関数
+    （全国で1つの FGDB にマージする場合に、全都道府県で共通のテンプレートを作成するため）
+      - フィールドは最初に現れた順。型が異なる場合は広い方の型（_FIELD_TYPE_WIDTH）、TEXT の長さは最大の長さ
+      - ジオメトリタイプまたは座標系が異なる場合は、1つのフィーチャクラスにできないので ValueError
+    '''
+    geometry_types = set(s["geometry_type"] for s in schemas if s.get("geometry_type"))
+    wkids = set(s["wkid"] for s in schemas if s.get("wkid"))
+    if len(geometry_types) > 1 or len(wkids) > 1:
+        raise ValueError(u"ジオメトリタイプまたは座標系が異なる都道府県があるため、1つのフィーチャクラスにまとめられません：{0} {1}".format(
+            sorted(geometry_types), sorted(wkids)))
+    fields = {}
+    for schema in schemas:
+        for field in schema["fields"]:
+            merged = fields.get(field["key"])
+            if merged is None:
+                fields[field["key"]] = dict(field)
+                continue
+            if merged["type"] != field["type"]:
+                types = set([merged["type"], field["type"]])
+                if "DATE" in types or field["type"] == "TEXT" or merged["type"] == "TEXT":
+                    widest = "TEXT"
+                else:
+                    widest = max(types, key=lambda t: _FIELD_TYPE_WIDTH[t])
+                merged["type"] = _FIELD_TYPE_OVERRIDES.get(field["key"], widest)
+            if merged["type"] == "TEXT":
+                merged["length"] = max(merged.get("length") or 0, field.get("length") or 0,
+                                       _TEXT_LENGTH_FLOORS.get(field["key"], _DEFAULT_TEXT_LENGTH))
+            else:
+                merged.pop("length", None)
+    releases = sorted(set(str(s.get("release", "")) for s in schemas))
+    return {
+        "version": _SCHEMA_VERSION,
+        "release": u",".join(releases),
+        "sample_count": sum(s.get("sample_count", 0) for s in schemas),
+        "geometry_type": geometry_types.pop() if geometry_types else None,
+        "wkid": wkids.pop() if wkids else 0,
+        "fields": list(fields.values()),
+    }
 
 # 
 # マルチプロセスでの処理関連
 # - Python3.3 で追加された pool.starmap は複数の引数に対応しているため、ラッパー関数（ multi_run_batch_convert ）は廃止
 # 
-def batch_convert(in_jsonfile :str, outws :str) -> str:
+def batch_convert(in_jsonfile :str, outws :str, schema :Dict = None, template_fc :str = None,
+                  precision :Dict = None, encoding :str = None, byte_range :Tuple[int, int] = None) -> str:
     '''
     1プロセスで実行する処理:
       1) FGDBへの書込みは仕様で複数プロセスで書込みできないため
@@ -224,93 +826,236 @@ def batch_convert(in_jsonfile :str, outws :str) -> str:
     
     in_jsonfile : 市区町村のGeoJSONファイルへのパス
     outws       : 出力するgdb
+    schema      : 親プロセスで load_farmland_schema により作成したスキーマ（全プロセスで共通のフィールド定義にする）
+    template_fc : 親プロセスで create_template_featureclass により作成したテンプレート（Copy して出力先のフィーチャクラスにする）
+    precision   : 座標の丸めと頂点の削減の設定（None の場合は行わない）
+    encoding    : 親プロセスで判定した GeoJSON ファイルの文字コード（None の場合は各プロセスで判定する）
+    byte_range  : 親プロセスで feature_byte_ranges により分割した、このプロセスで読むバイト位置の範囲（None の場合はファイル全体）
+    ※outws が .arrow / .parquet の場合は、gdb を作成せずに列指向フォーマットの中間ファイルへ出力する
     '''
-    if not arcpy.Exists(outws):
-        outfolder = u"{0}".format(os.path.dirname(outws))
-        foldername= u"{0}".format(os.path.basename(outws))
-        arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+    if is_columnar(outws):
+        convGeojson = FarmlandGeojsonToFeaturesEx()
+        blResult = convGeojson.geojson_to_features(in_jsonfile, outws, schema=schema,
+                                                   rejects_file=rejects_path(outws), precision=precision, encoding=encoding, byte_range=byte_range)
+        del convGeojson
+        if not blResult:
+            raise RuntimeError(u"変換に失敗しました：{0}".format(in_jsonfile))
+        return u"    変換済：{0}".format(outws)
+    with stage("create_gdb"):
+        if not arcpy.Exists(outws):
+            outfolder = u"{0}".format(os.path.dirname(outws))
+            foldername= u"{0}".format(os.path.basename(outws))
+            arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
     filename = os.path.basename(in_jsonfile)
     in_json_file = os.path.splitext(filename)[0]
     newfc = u"c_{0}".format(in_json_file) #数値で始まるファイル名はそのまま変換できないので接頭にc_を入れる
     #独自のFarmlandGeojsonToFeaturesEx クラスで変換
     #arcpy.conversion.JSONToFeatures(in_jsonfile, os.path.join(outws, newfc))
+    if template_fc:
+        #フィールド・エイリアス・ドメインが設定済みのテンプレートを複製（1回のツール実行でスキーマが揃う）
+        with stage("copy_template"):
+            arcpy.management.Copy(template_fc, os.path.join(outws, newfc))
     convGeojson = FarmlandGeojsonToFeaturesEx()
-    convGeojson.geojson_to_features(in_jsonfile, os.path.join(outws, newfc))
+    blResult = convGeojson.geojson_to_features(in_jsonfile, os.path.join(outws, newfc), schema=schema,
+                                               rejects_file=rejects_path(outws), precision=precision, encoding=encoding, byte_range=byte_range)
     del convGeojson
+    if not blResult:
+        #変換に失敗した市区町村はマージせず、マニフェストにも記録しない（次回の実行で再変換する）
+        raise RuntimeError(u"変換に失敗しました：{0}".format(in_jsonfile))
     return u"    変換済：{0}".format(outws)
 
-def exec_batch_convert(infolder :str, outfolder :str, cpu_cnt :int):
+def build_file_tasks(in_jsonfile :str, outfolder :str, schema :Dict, template_fc :str, shard_size :int, max_shards :int,
+                     intermediate :str = "fgdb", precision :Dict = None, local_path :str = None) -> Tuple[List[Tuple], Dict[str, str]]:
+    '''
+    1つの GeoJSON ファイルを変換するタスクを作成する関数：
+      (batch_convert, 引数のタプル, 入力サイズ) のリストと、出力する gdb ⇒ 入力ファイル の dict を返す
+      local_path : 入力ファイルを先読みしたローカルのコピー（文字コードの判定と分割の境界の検出はこちらを読み、タスクにもこちらを渡す）
+      ※大きなファイルは Feature の境界のバイト位置で分割して、複数のプロセスで別々の gdb へ変換する
+    '''
+    ext = {"fgdb": ".gdb", "arrow": ARROW_EXT, "parquet": PARQUET_EXT}[intermediate]
+    path = local_path or in_jsonfile
+    filename = os.path.basename(in_jsonfile)
+    size = input_size(path)
+    encoding, enc_method = FarmlandGeojsonToFeaturesEx().resolve_encoding(path)
+    count = shard_count(size, shard_size, max_shards)
+    ranges = feature_byte_ranges(path, count) if count > 1 else [None]
+    tasks = []
+    gdb_inputs = {}
+    for index, byte_range in enumerate(ranges):
+        suffix = u"" if count == 1 else u"_s{0}of{1}".format(index + 1, count)
+        gdbname = u"{0}{1}{2}".format(os.path.splitext(filename)[0], suffix, ext)
+        outws = os.path.join(outfolder, gdbname) # 出力する市区町村ファイルジオデータベース
+        task_size = size if byte_range is None else (byte_range[1] if byte_range[1] is not None else size) - byte_range[0]
+        tasks.append((batch_convert, (path, outws, schema, template_fc, precision, encoding, byte_range), task_size))
+        gdb_inputs[outws] = in_jsonfile
+    return tasks, gdb_inputs
+
+def build_convert_tasks(infiles :List[str], outfolder :str, schema :Dict, template_fc :str, shard_size :int, max_shards :int,
+                        intermediate :str = "fgdb", precision :Dict = None) -> Tuple[List[Tuple], Dict[str, str]]:
+    '''
+    各プロセスに渡すパラメータをリスト化する関数：
+      (batch_convert, 引数のタプル, 入力サイズ) のリストと、出力する gdb ⇒ 入力ファイル の dict を返す
+      （exec_batch_convert と MP_Farmland_NationalBatch.py から利用）
+      intermediate : 市区町村ごとの出力形式（"fgdb" / "arrow" / "parquet"）
+      precision    : 座標の丸めと頂点の削減の設定（None の場合は行わない）
+      ※文字コードの判定と、分割する場合の Feature の境界のバイト位置の検出は、ここで（親プロセスで）ファイルごとに1回だけ行い、
+        タスクに渡す（各プロセスは担当する範囲だけを読む）
+    '''
+    tasks=[]
+    gdb_inputs = {} #出力する gdb ⇒ 入力ファイル（マージ後にマニフェストへ記録するため）
+    for param1 in infiles: #市区町村のGeoJSONファイル
+        file_tasks, file_inputs = build_file_tasks(param1, outfolder, schema, template_fc, shard_size, max_shards, intermediate, precision)
+        tasks += file_tasks
+        gdb_inputs.update(file_inputs)
+    return tasks, gdb_inputs
+
+def exec_batch_convert(infolder :str, outfolder :str, cpu_cnt :int, schema_folder :str = None, sample_size :int = 10000, shard_size :int = SHARD_SIZE,
+                       intermediate :str = "fgdb", geoparquet :bool = False, precision :Dict = None, spatial_sort :bool = True,
+                       query_check :bool = False, prefetch :int = 0):
     '''
     マルチプロセスでの処理：
+      infolder      : 市区町村別の GeoJSON ファイルが入った都道府県フォルダ、または MAFF からダウンロードした zip ファイル（展開せずに読む）
+      schema_folder : 公開年度ごとのスキーマファイルの保存先（省略時は infolder の親フォルダ）
+      sample_size   : スキーマを推定するときにサンプリングするレコード数
+      shard_size    : このサイズ（バイト）を超える GeoJSON ファイルは、複数のプロセスに分割して変換する（0 以下で分割しない）
+      intermediate  : 市区町村ごとの中間出力の形式
+                        "fgdb"（市区町村FGDB）/ "arrow"（Arrow IPC）/ "parquet"（Parquet）※arrow, parquet は pyarrow が必要
+      geoparquet    : True の場合は、都道府県のフィーチャクラスを GeoParquet（"<出力フォルダ名>.parquet"）でも出力する
+      precision     : 座標の丸めと頂点の削減の設定（MP_Farmland_Precision.precision_options。None の場合は行わない）
+                        ファイルごとの頂点数と WKB のバイト数の削減量をメッセージと実行レポートに出力する
+      spatial_sort  : True の場合は、市区町村ごとに重心（point_lng / point_lat）のヒルベルト曲線上の順に並べ替えてマージする
+      query_check   : True の場合は、インデックスの作成前と作成後に同じ空間検索・属性検索を実行して処理時間を出力する
+      prefetch      : 0 より大きい場合は、このサイズ（バイト）を上限に、入力ファイルをローカルの一時フォルダへ先読みする
+                        （ネットワーク共有・クラウド同期フォルダの入力を、ワーカーが直接読まないようにする）
+      ※outfolder に farmland_manifest.json と都道府県のFGDB がある場合は、新しいファイルと内容が変わったファイルだけを変換する
+      ※段階ごとの処理時間・件数・メモリ使用量を、outfolder の farmland_run_report.json / .csv に出力する
     '''
+    report = None
     try:
         start = datetime.datetime.now()
         arcpy.AddMessage(u"-- Strat: MP_Farmland_JsonToFeatureClass --:{0}".format(start))
+        report = RunReport("MP_Farmland_JsonToFeatureClass")
         
-        #a) 各プロセス用の pythonw.exe を設定
-        python_path = sys.exec_prefix
-        multiprocessing.set_executable(os.path.join(python_path,'pythonw.exe'))
-        #multiprocessing.set_executable(os.path.join(python_path,'python.exe')) #CMDプロンプトの画面が起動するので'pythonw.exe'を使う
+        #a) 各プロセス用の pythonw.exe を設定（Windows のみ。Linux などでベンチマークを実行する場合は現在の Python のまま）
+        if os.name == "nt":
+            python_path = sys.exec_prefix
+            multiprocessing.set_executable(os.path.join(python_path,'pythonw.exe'))
+            #multiprocessing.set_executable(os.path.join(python_path,'python.exe')) #CMDプロンプトの画面が起動するので'pythonw.exe'を使う
         
-        #b) 各プロセスに渡すパラメータをリスト化
-        arcpy.AddMessage(u"  Convert each GeoJSON files : multiprocessing")
-        arcpy.env.workspace = infolder
-        infiles = arcpy.ListFiles("*.json")
-        params=[]
-        for infile in infiles:
-            param1 = os.path.join(infolder,infile) #市区町村のGeoJSONファイル
-            filename = os.path.basename(infile)
-            gdbname = u"{0}.gdb".format(os.path.splitext(filename)[0])
-            param2 = os.path.join(outfolder,gdbname) # 出力する市区町村ファイルジオデータベース
-            params.append((param1, param2))
-        if len(infiles) < cpu_cnt: # 処理ファイル数がCPUコアより少ない場合無駄なプロセスを起動不要
-            cpu_cnt = len(infiles)
-        pool = multiprocessing.Pool(cpu_cnt) # cpu数分プロセス作成
-        results = pool.starmap(batch_convert, params) # 割り当てプロセスで順次実行される（Python3.3で追加されたstarmapは複数の引数に対応）
-        pool.close()
-        pool.join()
-        
-        # 各プロセスでの処理結果を出力
-        for r in results:
-            arcpy.AddMessage(u"{0}".format(r))
-        
-        #c) 各プロセスで変換されたフィーチャクラスを都道府県のFGDBへマージしたものを作成（"Farmland"）
-        arcpy.env.workspace = outfolder
-        outwss = arcpy.ListWorkspaces("*","FileGDB")
+        #b) 変換済みの記録（マニフェスト）と比べて、変換するファイルを決める
         foldername = "{0}.gdb".format(os.path.basename(outfolder))
         fcname = "Farmland" #マージ後のフィーチャクラス名
-        arcpy.AddMessage(u"  Merge to FeatureClass:{1} in FGDB:{0} ".format(foldername, fcname))
-        arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
         prefws = os.path.join(outfolder, foldername)
-        for outws in outwss:
-            arcpy.env.workspace = outws
-            fc = arcpy.ListFeatureClasses()[0] #農地筆は1ファイルしかないので固定
-            arcpy.AddMessage(u"    merge: {0} ⇒ {1}".format(fc, fcname))
-            if arcpy.Exists(os.path.join(prefws, fcname)):
-                outfc = os.path.join(prefws, fcname)
-                arcpy.management.Append(fc, outfc)
-            else:
-                arcpy.conversion.FeatureClassToFeatureClass(fc, prefws, fcname)
+        outfc = os.path.join(prefws, fcname)
+        infiles = list_inputs(infolder, ".json")
+        manifest = FarmlandManifest(outfolder)
+        incremental = manifest.exists() and arcpy.Exists(outfc)
+        if incremental:
+            with stage("incremental"):
+                infiles = prepare_incremental(manifest, infiles, outfc, "local_government_cd")
         
-        # フィールドエイリアスを設定
-        arcpy.AddMessage(u"  Alter Fields to FeatureClass:{0}".format(fcname))
-        __alter_field_alias(os.path.join(prefws, fcname))
+        #c) 先読みする場合は、変換するファイルのローカルへのコピーをサイズの大きい順に始める
+        #   文字コードの判定・分割の境界の検出・スキーマのサンプリングはコピーを読む（遅いストレージから読むのは1ファイル1回だけ）
+        #   ファイル単位のタスクは、コピーが終わったファイルから分割したタスクに置き換えてワーカーへ渡す
+        #   （置き換えはワーカーへ渡すときに行うので、schema と template_fc は d) で用意したものを使う）
+        max_shards = cpu_cnt #1ファイルを分割する最大数
+        gdb_inputs = {} #出力する gdb ⇒ 入力ファイル（マージ後にマニフェストへ記録するため）
+        def expand_tasks(source, path):
+            tasks, outputs = build_file_tasks(source, outfolder, schema, template_fc, shard_size, max_shards, intermediate, precision, path)
+            gdb_inputs.update(outputs)
+            return [(func, args, size, size / float(PREDICT_BYTES_PER_SEC)) for func, args, size in tasks]
+        prefetcher = FarmlandPrefetcher(prefetch) if prefetch > 0 and infiles else None
+        if prefetcher:
+            file_tasks = prefetcher.prefetch(schedule_largest_first([(batch_convert, (f,), input_size(f)) for f in infiles]), expand_tasks)
+        try:
+            #d) 全プロセスで共通のスキーマ（公開年度ごとにキャッシュ）と、テンプレートのフィーチャクラスを用意
+            with stage("load_schema"):
+                schema = load_farmland_schema(infolder, schema_folder, sample_size, prefetcher.local_copy if prefetcher else None)
+            templatews = os.path.join(outfolder, TEMPLATE_GDB)
+            with stage("create_template"):
+                if arcpy.Exists(templatews):
+                    arcpy.management.Delete(templatews) #前回の実行が途中で終わった場合
+                arcpy.AddMessage(u"  Create template FeatureClass in FGDB:{0}".format(TEMPLATE_GDB))
+                arcpy.management.CreateFileGDB(outfolder, TEMPLATE_GDB, "CURRENT")
+                template_fc = create_template_featureclass(templatews, "Farmland", schema)
+            
+            #各プロセスに渡すパラメータをリスト化
+            arcpy.AddMessage(u"  Convert each GeoJSON files : multiprocessing")
+            if prefetcher:
+                params = file_tasks
+                task_count = sum(shard_count(input_size(f), shard_size, max_shards) for f in infiles)
+            else:
+                tasks, gdb_inputs = build_convert_tasks(infiles, outfolder, schema, template_fc, shard_size, max_shards, intermediate, precision)
+                #サイズの大きい順に処理する
+                params = schedule_largest_first(tasks)
+                task_count = len(params)
+            if task_count < cpu_cnt: # 処理ファイル数がCPUコアより少ない場合無駄なプロセスを起動不要
+                cpu_cnt = task_count
+            
+            #e) 都道府県のFGDBとマージ先のフィーチャクラス（"Farmland"）を作成（差分変換の場合は既存のものに追加）
+            #   エイリアスとドメインはテンプレートに設定済みなので、マージ先もテンプレートの複製から作成する
+            if not incremental:
+                arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+                arcpy.management.Copy(template_fc, outfc)
+                manifest.save() #途中で止まった場合も、次回は差分変換で続きから再開できるようにする
+            
+            #f) 変換が終わった市区町村から順に、マージ先へ書き込んで市区町村のFGDBを削除（変換とマージを並行して実行）
+            #   マージ先への書き込みは親プロセスだけが1つの InsertCursor で行う（インデックスは最後に作成）
+            #   マージしたファイルは、マージ先への書込みを確定した後にマニフェストに記録する（途中で止まっても、次回はその続きから変換）
+            arcpy.AddMessage(u"  Convert and merge to FeatureClass:{1} in FGDB:{0} ".format(foldername, fcname))
+            conv_start = datetime.datetime.now()
+            row_count, merge_elapsed, pending_deletes = 0, datetime.timedelta(0), []
+            if task_count:
+                #先読みする場合は、ローカルへのコピーが終わったファイルから順にワーカーへ渡す（マニフェストのハッシュもコピー時に計算）
+                on_merged = manifest_recorder(manifest, gdb_inputs, prefetcher.digest if prefetcher else None)
+                pool = multiprocessing.Pool(cpu_cnt) # cpu数分プロセス作成
+                results = pool.imap_unordered(run_scheduled_task, params, chunksize=1) # 大きい順に1件ずつ割り当て、変換が終わったものから順に結果を受け取る
+                results = report.collect(results) #ワーカーの計測結果を集める
+                if prefetcher:
+                    results = prefetcher.track(results, gdb_inputs) #変換が終わったファイルは、キャッシュから削除できるようにする
+                row_count, merge_elapsed, pending_deletes = merge_as_completed(results, outfc, INDEX_FIELDS,
+                                                                               key_field="local_government_cd", on_merged=on_merged,
+                                                                               spatial_sort=spatial_sort, query_check=query_check)
+                pool.close()
+                pool.join()
+        finally:
+            if prefetcher:
+                #途中で失敗した場合も、先読みのキャッシュフォルダは削除する
+                arcpy.AddMessage(u"  {0}".format(prefetcher.summary()))
+                prefetcher.close()
+        conv_elapsed = datetime.datetime.now() - conv_start
         
-        # コード値ドメインを設定
-        arcpy.AddMessage(u"  Assign land_type_CD domain to FeatureClass:{0}".format(fcname))
-        __assign_domain(prefws, os.path.join(prefws, fcname))
+        #g) 後片付け 削除できなかった市区町村のFGDBとテンプレートのFGDBを削除
+        with stage("delete"):
+            for outws in pending_deletes:
+                arcpy.AddMessage(u"    Delete FGDB:{0}".format(outws))
+                if is_columnar(outws):
+                    os.remove(outws)
+                else:
+                    arcpy.management.Delete(outws)
+            arcpy.management.Delete(templatews)
         
-        #d) マージが終わったので後片付け 各市区町村のFGDBを削除
-        arcpy.AddMessage(u"  Delete temp FileGDBs")
-        for outws in outwss:
-            arcpy.AddMessage(u"    Delete FGDB:{0}".format(outws))
-            arcpy.management.Delete(outws)
+        #h) 成果物として GeoParquet を出力（分析環境で FGDB より高速に読み込めるように）
+        if geoparquet:
+            parquet_path = os.path.join(outfolder, u"{0}{1}".format(os.path.basename(outfolder), PARQUET_EXT))
+            arcpy.AddMessage(u"  Export GeoParquet:{0}".format(os.path.basename(parquet_path)))
+            with stage("export_geoparquet"):
+                export_featureclass(outfc, parquet_path)
         
+        arcpy.AddMessage(u"  Convert and merge time:{0}".format(conv_elapsed))
+        arcpy.AddMessage(u"  Merge time (writer)   :{0} ({1} rows)".format(merge_elapsed, row_count))
+        #i) 段階ごとの集計表と実行レポート
+        report.summarize()
+        report.write(outfolder)
         fin = datetime.datetime.now()
         arcpy.AddMessage(u"-- Finish: MP_Farmland_JsonToFeatureClass --:{0}".format(fin))
         arcpy.AddMessage(u"     Elapsed time:{0}".format(fin-start))
     except:
-        arcpy.AddError(u"Exception:{0}".format(sys.exc_info()[2]))
+        arcpy.AddError(u"Exception:{0}".format(traceback.format_exc()))
+    finally:
+        #失敗した場合も親プロセスの計測を終了する（ArcGIS Pro のプロセスで、次に実行するツールに計測が残らないように）
+        if report is not None:
+            report.close()
 
 if __name__ == '__main__':
     '''
@@ -337,12 +1082,31 @@ if __name__ == '__main__':
             |   Farmland # フィーチャクラス名
       
       cpu_cnt : マルチプロセスでの処理時に起動するプロセス数
+      options : （省略可）arrow / parquet を指定すると、市区町村FGDB の代わりに列指向フォーマットの中間ファイルを使う
+                           geoparquet を指定すると、都道府県のフィーチャクラスを GeoParquet でも出力する
+                           grid=<間隔> を指定すると、座標を格子に丸めて重複・一直線上の頂点を削除する（例：grid=1e-7）
+                           tolerance=<許容距離> を指定すると、Douglas-Peucker 法で頂点を削減する（例：tolerance=5e-7）
+                           querycheck を指定すると、インデックスの作成前と作成後のクエリ速度を出力する
+                           unsorted を指定すると、マージで空間的な並べ替えを行わない（クエリ速度の比較用）
+                           prefetch を指定すると、入力ファイルをローカルへ先読みする（prefetch=<MB> でキャッシュの上限を指定）
+      ※infolder には MAFF からダウンロードした zip ファイル（例：2024_02.zip）も指定できる（展開せずに読む）
+      例）python.exe MP_Farmland_JsonToFeatureClass.py 2024_02 2024_02_filegdb 4 arrow geoparquet
+      例）python.exe MP_Farmland_JsonToFeatureClass.py 2024_02 2024_02_filegdb 4 grid=1e-7
+      例）python.exe MP_Farmland_JsonToFeatureClass.py \\nas\maff\2024_02.zip 2024_02_filegdb 4 prefetch=2048
     '''
     args = sys.argv
-    if len(args) == 4:
+    if len(args) >= 4:
         infolder = args[1]
         outfolder = args[2]
         cpu_cnt = int(args[3])
-        exec_batch_convert(infolder, outfolder, cpu_cnt)
+        options = [a.lower() for a in args[4:]]
+        intermediate = "arrow" if "arrow" in options else "parquet" if "parquet" in options else "fgdb"
+        prefetch = DEFAULT_CACHE_BYTES if "prefetch" in options else 0
+        for option in options:
+            if option.startswith("prefetch="):
+                prefetch = int(float(option.split("=", 1)[1]) * 1024 * 1024)
+        exec_batch_convert(infolder, outfolder, cpu_cnt, intermediate=intermediate, geoparquet="geoparquet" in options,
+                           precision=parse_precision_args(options), spatial_sort="unsorted" not in options,
+                           query_check="querycheck" in options, prefetch=prefetch)
     else:
         print("Arguments error")
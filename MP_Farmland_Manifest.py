@@ -0,0 +1,188 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Manifest.py
+# Purpose:    サンプルスクリプト - 差分変換（変換済みの市区町村の記録）用のマニフェスト
+#               a)出力フォルダに farmland_manifest.json を作成し、変換済みの入力ごとに
+#                 パス・サイズ・更新日時・内容のハッシュ・市区町村FGDB・件数・自治体コードを記録
+#               b)再実行時は、新しい入力と内容が変わった入力だけを変換対象にする
+#                 （サイズと更新日時が同じ場合はハッシュを計算しない）
+#               c)内容が変わった入力・なくなった入力は、記録した自治体コードで都道府県のフィーチャクラスから削除
+#             入力は zip 内の GeoJSON（"<zipファイル>/<zip内のファイル名>"）でもよい
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_ShapefileToFeatureClass.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import json
+import hashlib
+import datetime
+from typing import Tuple,List,Dict
+from MP_Farmland_Prefetch import split_archive, input_stat, open_input
+from MP_Farmland_FolderScan import MANIFEST_NAME
+
+_MANIFEST_VERSION = 1
+#シェープファイルの市区町村フォルダで、ハッシュの計算対象にするファイル
+_SHAPEFILE_EXTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+def __input_files(path :str) -> List[str]:
+    #ファイル（zip 内のファイルを含む）の場合はそのファイル、フォルダの場合はフォルダ直下のシェープファイル関連のファイル
+    if os.path.isfile(path) or split_archive(path)[0]:
+        return [path]
+    return sorted(os.path.join(path, f) for f in os.listdir(path)
+                      if os.path.splitext(f)[1].lower() in _SHAPEFILE_EXTS)
+
+def input_signature(path :str) -> Tuple[int, float]:
+    '''
+    入力（GeoJSON ファイル、またはシェープファイルの市区町村フォルダ）の (サイズ, 更新日時) を返す関数
+    '''
+    size = 0
+    mtime = 0.0
+    for f in __input_files(path):
+        st_size, st_mtime = input_stat(f)
+        size += st_size
+        mtime = max(mtime, st_mtime)
+    return size, mtime
+
+def input_hash(path :str, chunk_size :int = 1024*1024) -> str:
+    '''
+    入力（GeoJSON ファイル、またはシェープファイルの市区町村フォルダ）の内容の SHA-1 を返す関数
+    '''
+    h = hashlib.sha1()
+    for f in __input_files(path):
+        h.update(os.path.basename(f).encode('utf-8'))
+        with open_input(f) as fb:
+            for chunk in iter(lambda: fb.read(chunk_size), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+class FarmlandManifest():
+    '''
+    出力フォルダの farmland_manifest.json を読み書きするクラス
+    entries は入力の名前（GeoJSON のファイル名、または市区町村フォルダ名）をキーにした dict
+    '''
+    def __init__(self, outfolder :str):
+        self.path = os.path.join(outfolder, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                data = json.load(fp)
+            if data.get("version") == _MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+        return
+    def __del__(self):
+        return
+
+    #public
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        '''
+        マニフェストを保存する（途中で失敗しても、そこまでの記録が残るように、更新のたびに呼び出す）
+        '''
+        data = {"version": _MANIFEST_VERSION, "entries": self.entries}
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def classify(self, inputs :List[str]) -> Tuple[List[str], List[str], List[str]]:
+        '''
+        入力を、(新規・変更あり の入力, 変更なし の入力, なくなった入力の名前) に分類する
+        サイズと更新日時が記録と同じ場合は変更なし、異なる場合はハッシュを比較する
+        '''
+        changed = []
+        unchanged = []
+        names = set()
+        for path in inputs:
+            name = os.path.basename(path)
+            names.add(name)
+            entry = self.entries.get(name)
+            if entry is None:
+                changed.append(path)
+                continue
+            size, mtime = input_signature(path)
+            if entry["size"] == size and entry["mtime"] == mtime:
+                unchanged.append(path)
+            elif entry["size"] == size and entry["hash"] == input_hash(path):
+                #内容は同じ（コピーし直しなどで更新日時だけ変わった）
+                entry["mtime"] = mtime
+                unchanged.append(path)
+            else:
+                changed.append(path)
+        removed = [name for name in self.entries if name not in names]
+        return changed, unchanged, removed
+
+    def record(self, path :str, gdbname :str, row_count :int, codes :List[str], digest :str = None):
+        '''
+        変換とマージが終わった入力を記録する（gdbname は変換に使った市区町村FGDB の名前）
+        digest は計算済みの input_hash（先読みでコピーしながら計算した場合。None の場合は入力を読んで計算する）
+        '''
+        size, mtime = input_signature(path)
+        self.entries[os.path.basename(path)] = {
+            "path": path,
+            "size": size,
+            "mtime": mtime,
+            "hash": digest or input_hash(path),
+            "gdb": gdbname,
+            "row_count": row_count,
+            "codes": sorted(codes),
+            "converted": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def remove(self, name :str):
+        self.entries.pop(name, None)
+        self.save()
+
+def delete_rows_by_codes(fc :str, field :str, codes :List[str]) -> int:
+    '''
+    フィーチャクラスから、field の値が codes のいずれかのレコードを削除し、削除した件数を返す関数
+    '''
+    if not codes:
+        return 0
+    delimited = arcpy.AddFieldDelimiters(fc, field)
+    values = u", ".join(u"'{0}'".format(str(c).replace("'", "''")) for c in codes)
+    count = 0
+    with arcpy.da.UpdateCursor(fc, ["OID@"], u"{0} IN ({1})".format(delimited, values)) as ucursor:
+        for row in ucursor:
+            ucursor.deleteRow()
+            count += 1
+    return count
+
+def prepare_incremental(manifest :FarmlandManifest, infiles :List[str], outfc :str, code_field :str) -> List[str]:
+    '''
+    差分変換の準備：内容が変わった入力・なくなった入力のレコードを都道府県のフィーチャクラスから削除し、
+    変換する入力（新しい入力と内容が変わった入力）のリストを返す関数
+    '''
+    changed, unchanged, removed = manifest.classify(infiles)
+    arcpy.AddMessage(u"  Incremental: {0} changed/new, {1} unchanged, {2} removed".format(len(changed), len(unchanged), len(removed)))
+    stale = removed + [os.path.basename(p) for p in changed if os.path.basename(p) in manifest.entries]
+    for name in stale:
+        count = delete_rows_by_codes(outfc, code_field, manifest.entries[name]["codes"])
+        arcpy.AddMessage(u"    Delete {0} rows of {1}".format(count, name))
+        manifest.remove(name)
+    return changed
+
+def manifest_recorder(manifest :FarmlandManifest, gdb_inputs :Dict[str, str], digest=None):
+    '''
+    merge_as_completed の on_merged に渡す関数を返す関数
+    1つの入力を分割して変換した場合は、すべての分割のマージが終わってから件数と自治体コードを合計して記録する
+    digest : 入力 ⇒ 計算済みのハッシュ を返す関数（FarmlandPrefetcher.digest。None の場合は記録時に計算する）
+    ※先読みする場合は、gdb_inputs にはワーカーへ渡すときに1つの入力の分割がまとめて追加されるので、分割の数は最初のマージで数える
+    '''
+    remaining = {}
+    merged = {}
+    def on_merged(outws, count, codes):
+        path = gdb_inputs[outws]
+        if path not in remaining:
+            remaining[path] = sum(1 for p in list(gdb_inputs.values()) if p == path)
+        total, all_codes = merged.get(path, (0, set()))
+        merged[path] = (total + count, all_codes | set(codes))
+        remaining[path] -= 1
+        if remaining[path] == 0:
+            gdbname = u"{0}.gdb".format(os.path.splitext(os.path.basename(path))[0])
+            manifest.record(path, gdbname, merged[path][0], merged[path][1], digest(path) if digest else None)
+    return on_merged
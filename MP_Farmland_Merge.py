@@ -0,0 +1,536 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Merge.py
+# Purpose:    サンプルスクリプト - 市区町村FGDB のフィーチャクラスを、都道府県FGDB 内のフィーチャクラスに統合する処理
+#               a)統合先の空間インデックス・属性インデックスを削除
+#               b)すべての市区町村のフィーチャクラスを、1つの InsertCursor で統合先に書き込み
+#                 （フィーチャクラスごとに Append のツールを実行しない）
+#                 市区町村ごとに、重心（point_lng / point_lat）のヒルベルト曲線上の順に並べ替えてから書き込み
+#                 （空間的に近いフィーチャが近いページに入るようにする）
+#                 並べ替えは (ヒルベルト曲線上の位置, OID) だけをメモリに持ち、ジオメトリは並べ替えた順に OID で分けて読み込む
+#               c)空間インデックス・属性インデックスを最後に1回だけ作成
+#                 （query_check を指定した場合は、作成前と作成後で同じ空間検索・属性検索の処理時間を比べる）
+#               ※merge_as_completed では、変換が終わった市区町村から順に b) を行い、変換とマージを並行して実行
+#                 統合先に前からある同じ自治体コードの行は、書き込む前に削除（途中で止まった実行の行を重複させない）
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_ShapefileToFeatureClass.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import time
+import itertools
+import struct
+import datetime
+import numpy as np
+from typing import Tuple,List,Dict
+from MP_Farmland_Columnar import is_columnar, read_columnar, read_columnar_keys
+from MP_Farmland_Manifest import delete_rows_by_codes
+from MP_Farmland_Metrics import stage, add_count
+
+#空間的な並べ替えに使う重心のフィールド（ない場合・NULL の場合は、フィーチャクラスは SHAPE@XY、列指向フォーマットの中間ファイルは WKB の最初の頂点を使う）
+CENTROID_FIELDS = ("point_lng", "point_lat")
+#ヒルベルト曲線の次数（市区町村の範囲を 2**次数 × 2**次数 の格子に分ける）
+_HILBERT_ORDER = 16
+#並べ替えた順にジオメトリを読み込むときに、1回の検索（OID の IN 句）で読み込む件数
+_FETCH_CHUNK = 1000
+#OID で読み込み直せない行（列指向フォーマットの中間ファイル）を、メモリ上で並べ替える最大の件数（超える場合は並べ替えずに書き込む）
+SORT_MAX_ROWS = 500000
+#クエリ速度の確認で使う検索の数（市区町村ごとに1件サンプリングした中から等間隔に選ぶ）と、空間検索の範囲の大きさ（全体の範囲に対する割合）
+_QUERY_SAMPLES = 10
+_QUERY_WINDOW = 0.01
+
+def hilbert_keys(x :np.ndarray, y :np.ndarray, order :int = _HILBERT_ORDER) -> np.ndarray:
+    '''
+    座標の配列を、その範囲を 2**order の格子に分けたヒルベルト曲線上の位置（int64）にする関数
+    （NaN の座標は最後に並ぶように、最大の位置にする）
+    '''
+    n = 1 << order
+    valid = ~(np.isnan(x) | np.isnan(y))
+    keys = np.full(len(x), n * n, dtype=np.int64)
+    if not valid.any():
+        return keys
+    vx, vy = x[valid], y[valid]
+    span = max(vx.max() - vx.min(), vy.max() - vy.min()) or 1.0
+    xi = np.minimum(((vx - vx.min()) / span * n).astype(np.int64), n - 1)
+    yi = np.minimum(((vy - vy.min()) / span * n).astype(np.int64), n - 1)
+    d = np.zeros(len(xi), dtype=np.int64)
+    s = n >> 1
+    while s:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        #象限に合わせて回転・反転
+        flip = ~ry & rx
+        xi = np.where(flip, n - 1 - xi, xi)
+        yi = np.where(flip, n - 1 - yi, yi)
+        xi, yi = np.where(ry, xi, yi), np.where(ry, yi, xi)
+        s >>= 1
+    keys[valid] = d
+    return keys
+
+def _first_vertex(wkb) -> Tuple[float, float]:
+    #Polygon / MultiPolygon（リトルエンディアン）の WKB の最初の頂点
+    if not wkb or wkb[0] != 1:
+        return np.nan, np.nan
+    gtype = struct.unpack_from('<I', wkb, 1)[0]
+    offset = {3: 13, 6: 22}.get(gtype)
+    if offset is None or len(wkb) < offset + 16:
+        return np.nan, np.nan
+    return struct.unpack_from('<dd', wkb, offset)
+
+def _centroids(rows :List, x_pos :int, y_pos :int) -> Tuple[np.ndarray, np.ndarray]:
+    #行の重心（x_pos / y_pos の値、ない場合は WKB の最初の頂点）の配列
+    if x_pos is not None and y_pos is not None:
+        x = np.array([np.nan if r[x_pos] is None else r[x_pos] for r in rows], dtype=np.float64)
+        y = np.array([np.nan if r[y_pos] is None else r[y_pos] for r in rows], dtype=np.float64)
+    else:
+        x = np.full(len(rows), np.nan)
+        y = np.full(len(rows), np.nan)
+    missing = np.flatnonzero(np.isnan(x) | np.isnan(y))
+    for i in missing:
+        x[i], y[i] = _first_vertex(rows[i][0])
+    return x, y
+
+class FarmlandConsolidator():
+    '''
+    市区町村のフィーチャクラスを、1つの InsertCursor で統合先のフィーチャクラスへ書き込むクラス
+    使い方）
+        with FarmlandConsolidator(outfc, ["local_government_cd"]) as merger:
+            for fc in fcs:
+                merger.append(fc)
+    spatial_sort : True の場合は、フィーチャクラス（市区町村）ごとに重心のヒルベルト曲線上の順に並べ替えて書き込む
+                   （フィーチャクラスは (位置, OID) だけを読み込んで並べ替え、ジオメトリは _FETCH_CHUNK 件ずつ OID で読み込む
+                     append_rows の行は SORT_MAX_ROWS 件までメモリ上で並べ替え、超える場合は並べ替えない）
+    query_check  : True の場合は、インデックスの作成前と作成後に同じ検索を実行して、処理時間を比べる
+    '''
+    def __init__(self, out_fc :str, index_fields :List[str] = None, key_field :str = None, spatial_sort :bool = True, query_check :bool = False):
+        self.out_fc = out_fc
+        self.index_fields = index_fields or []
+        self.key_field = key_field #append のたびに、このフィールドの値の一覧を last_keys に集める（自治体コードなど）
+        self.spatial_sort = spatial_sort
+        self.query_check = query_check
+        self.last_keys = set()
+        self.existing_keys = set() #open の時点で統合先にあった key_field の値（前回までの実行で書き込んだ市区町村）
+        self.row_count = 0
+        self.elapsed = datetime.timedelta(0)
+        self.__icursor = None
+        self.__fields = []
+        self.__spatial_reference = None
+        self.__samples = [] #クエリ速度の確認用：市区町村ごとに1件の (x, y, {インデックスのフィールド: 値})
+        self.__bounds = None
+        return
+    def __del__(self):
+        return
+    def __enter__(self):
+        self.open()
+        return self
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    #private
+    def __attribute_fields(self, fc):
+        return [f.name for f in arcpy.ListFields(fc) if f.type not in ["OID", "Geometry"]
+                    and f.name.lower() not in ["shape_area", "shape_length"]]
+
+    def __drop_indexes(self):
+        #書込み中にインデックスを更新し続けないように、統合先のインデックスを削除しておく
+        try:
+            arcpy.management.RemoveSpatialIndex(self.out_fc)
+        except arcpy.ExecuteError:
+            pass #空間インデックスがない場合
+        names = [self.__index_name(f) for f in self.index_fields]
+        exist_names = [i.name for i in arcpy.ListIndexes(self.out_fc)]
+        drop_names = [n for n in names if n in exist_names]
+        if drop_names:
+            arcpy.management.RemoveIndex(self.out_fc, drop_names)
+
+    def __build_indexes(self):
+        arcpy.AddMessage(u"    Add spatial index: {0}".format(os.path.basename(self.out_fc)))
+        arcpy.management.AddSpatialIndex(self.out_fc)
+        field_names = [f.lower() for f in self.__fields]
+        for field in self.index_fields:
+            if field.lower() not in field_names:
+                continue
+            arcpy.AddMessage(u"    Add attribute index: {0}".format(field))
+            arcpy.management.AddIndex(self.out_fc, [field], self.__index_name(field))
+
+    def __index_name(self, field):
+        return u"idx_{0}".format(field)
+
+    def __centroid_positions(self, positions :List[int]) -> Tuple[int, int]:
+        #重心のフィールドの行の位置（統合先にない場合は None）
+        names = [f.lower() for f in self.__fields]
+        return [positions[names.index(f)] if f in names else None for f in CENTROID_FIELDS]
+
+    def __sort_rows(self, rows, positions :List[int]):
+        #行を SORT_MAX_ROWS 件までメモリに読み込み、重心のヒルベルト曲線上の順に並べ替えて返す
+        #（SORT_MAX_ROWS 件を超える場合は、読み込んだ順のまま返す）
+        x_pos, y_pos = self.__centroid_positions(positions)
+        with stage("merge_read"):
+            head = list(itertools.islice(rows, SORT_MAX_ROWS + 1))
+        if len(head) > SORT_MAX_ROWS:
+            arcpy.AddMessage(u"    {0}件を超えるため、並べ替えずに書き込みます".format(SORT_MAX_ROWS))
+            return itertools.chain(head, rows)
+        if head:
+            with stage("merge_sort"):
+                x, y = _centroids(head, x_pos, y_pos)
+                self.__sample(x, y, lambda i: head[i], positions)
+                if self.spatial_sort:
+                    head = [head[i] for i in np.argsort(hilbert_keys(x, y), kind="stable")]
+        return head
+
+    def __sorted_featureclass_rows(self, in_fc :str, read_fields :List[str], positions :List[int]):
+        #フィーチャクラスの行を、重心のヒルベルト曲線上の順に返すジェネレーター
+        #1回目の読込みでは OID と重心（とクエリ速度の確認用のインデックスのフィールド）だけを読み込んで並べ替え、
+        #2回目の読込みで _FETCH_CHUNK 件ずつ OID の IN 句で検索して、並べ替えた順に返す（ジオメトリを全件メモリに持たない）
+        x_pos, y_pos = self.__centroid_positions(positions)
+        if x_pos is not None and y_pos is not None:
+            key_fields = ["OID@", read_fields[x_pos - 1], read_fields[y_pos - 1]]
+        else:
+            key_fields = ["OID@", "SHAPE@XY"]
+        sample_fields = [f for f in self.index_fields if f in read_fields] if self.query_check else []
+        with stage("merge_read"):
+            with arcpy.da.SearchCursor(in_fc, key_fields + sample_fields, spatial_reference=self.__spatial_reference) as scursor:
+                keys = [row if len(key_fields) == 3 else (row[0],) + tuple(row[1] or (None, None)) + tuple(row[2:]) for row in scursor]
+        if not keys:
+            return
+        with stage("merge_sort"):
+            oids = np.array([k[0] for k in keys], dtype=np.int64)
+            x = np.array([np.nan if k[1] is None else k[1] for k in keys], dtype=np.float64)
+            y = np.array([np.nan if k[2] is None else k[2] for k in keys], dtype=np.float64)
+            missing = np.flatnonzero(np.isnan(x) | np.isnan(y))
+            if len(missing) and len(key_fields) == 3:
+                self.__fill_centroids(in_fc, oids, x, y, missing)
+            if sample_fields:
+                sample_positions = [(sample_fields.index(f) + 3) if f in sample_fields else None for f in self.__fields]
+                self.__sample(x, y, lambda i: keys[i], sample_positions)
+            del keys
+        if not self.spatial_sort:
+            #クエリ速度の確認だけの場合は、読み込んだ順のまま書き込む
+            with arcpy.da.SearchCursor(in_fc, ["SHAPE@WKB"] + read_fields, spatial_reference=self.__spatial_reference) as scursor:
+                for row in scursor:
+                    yield row
+            return
+        with stage("merge_sort"):
+            order = oids[np.argsort(hilbert_keys(x, y), kind="stable")]
+        oid_field = arcpy.Describe(in_fc).OIDFieldName
+        for start in range(0, len(order), _FETCH_CHUNK):
+            chunk = order[start:start + _FETCH_CHUNK].tolist()
+            where = u"{0} IN ({1})".format(arcpy.AddFieldDelimiters(in_fc, oid_field), u", ".join(str(oid) for oid in chunk))
+            with stage("merge_read"):
+                with arcpy.da.SearchCursor(in_fc, ["OID@", "SHAPE@WKB"] + read_fields, where,
+                                           spatial_reference=self.__spatial_reference) as scursor:
+                    fetched = dict((row[0], row[1:]) for row in scursor)
+            for oid in chunk:
+                row = fetched.pop(oid, None)
+                if row is not None:
+                    yield row
+
+    def __fill_centroids(self, in_fc :str, oids :np.ndarray, x :np.ndarray, y :np.ndarray, missing :np.ndarray):
+        #重心のフィールドが NULL の行（missing は行番号）の x, y を、SHAPE@XY（ジオメトリの重心）で埋める
+        #_FETCH_CHUNK 件以下の場合は OID の IN 句で検索し、多い場合は全件を1回読み込んで NULL の行だけ使う
+        rows = dict((int(oids[i]), i) for i in missing)
+        where = None
+        if len(rows) <= _FETCH_CHUNK:
+            oid_field = arcpy.AddFieldDelimiters(in_fc, arcpy.Describe(in_fc).OIDFieldName)
+            where = u"{0} IN ({1})".format(oid_field, u", ".join(str(oid) for oid in rows))
+        with stage("merge_read"):
+            with arcpy.da.SearchCursor(in_fc, ["OID@", "SHAPE@XY"], where, spatial_reference=self.__spatial_reference) as scursor:
+                for oid, xy in scursor:
+                    i = rows.get(oid)
+                    if i is not None and xy:
+                        x[i], y[i] = xy
+
+    def __write_rows(self, rows, positions :List[int], key_pos :int = None) -> Tuple[int, set]:
+        #行を統合先へ書き込み、(件数, key_pos の値のセット) を返す
+        #positions は統合先のフィールドごとの行の位置
+        identity = positions == list(range(1, len(self.__fields) + 1))
+        count = 0
+        keys = set()
+        with stage("merge_append"):
+            for row in rows:
+                if identity:
+                    self.__icursor.insertRow(row)
+                else:
+                    self.__icursor.insertRow([row[0]] + [None if p is None else row[p] for p in positions])
+                count += 1
+                if key_pos is not None:
+                    keys.add(row[key_pos])
+        return count, keys
+
+    def __sample(self, x :np.ndarray, y :np.ndarray, get_row, positions :List[int]):
+        #クエリ速度の確認用に、中央の行の重心とインデックスのフィールドの値を記録し、全体の範囲を広げる
+        #get_row は行番号から行を返す関数、positions は統合先のフィールドごとのその行の位置
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if not valid.any():
+            return
+        bounds = (x[valid].min(), y[valid].min(), x[valid].max(), y[valid].max())
+        if self.__bounds is None:
+            self.__bounds = bounds
+        else:
+            self.__bounds = (min(self.__bounds[0], bounds[0]), min(self.__bounds[1], bounds[1]),
+                             max(self.__bounds[2], bounds[2]), max(self.__bounds[3], bounds[3]))
+        i = int(np.flatnonzero(valid)[len(np.flatnonzero(valid)) // 2])
+        names = [f.lower() for f in self.__fields]
+        values = {}
+        for field in self.index_fields:
+            if field.lower() in names:
+                p = positions[names.index(field.lower())]
+                if p is not None and get_row(i)[p] is not None:
+                    values[field] = get_row(i)[p]
+        self.__samples.append((float(x[i]), float(y[i]), values))
+
+    def __run_queries(self) -> List[Tuple[str, float, int]]:
+        #サンプルの重心の周りの空間検索と、インデックスのフィールドの値の属性検索を実行し、[(検索, 秒, 件数), ...] を返す
+        samples = self.__samples
+        if len(samples) > _QUERY_SAMPLES:
+            samples = [samples[int(i * len(samples) / _QUERY_SAMPLES)] for i in range(_QUERY_SAMPLES)]
+        results = []
+        if self.__bounds is not None:
+            half = max(self.__bounds[2] - self.__bounds[0], self.__bounds[3] - self.__bounds[1]) * _QUERY_WINDOW / 2 or 1e-6
+            start, count = time.perf_counter(), 0
+            for x, y, values in samples:
+                window = arcpy.Extent(x - half, y - half, x + half, y + half).polygon
+                with arcpy.da.SearchCursor(self.out_fc, ["OID@"], spatial_filter=window) as scursor:
+                    count += sum(1 for row in scursor)
+            results.append((u"spatial ({0} windows)".format(len(samples)), time.perf_counter() - start, count))
+        for field in self.index_fields:
+            values = [v[field] for x, y, v in samples if field in v]
+            if not values:
+                continue
+            delimited = arcpy.AddFieldDelimiters(self.out_fc, field)
+            start, count = time.perf_counter(), 0
+            for value in values:
+                where = u"{0} = '{1}'".format(delimited, value.replace("'", "''")) if isinstance(value, str) else u"{0} = {1}".format(delimited, value)
+                with arcpy.da.SearchCursor(self.out_fc, ["OID@"], where_clause=where) as scursor:
+                    count += sum(1 for row in scursor)
+            results.append((u"{0} ({1} values)".format(field, len(values)), time.perf_counter() - start, count))
+        return results
+
+    def __report_queries(self, before :List, after :List):
+        arcpy.AddMessage(u"    Query check ({0}): before / after index build".format(
+            u"spatially sorted" if self.spatial_sort else u"unsorted"))
+        arcpy.AddMessage(u"      {0:<32} {1:>10} {2:>10} {3:>8} {4:>8}".format("query", "before", "after", "speedup", "rows"))
+        for (name, t0, count), (name, t1, count1) in zip(before, after):
+            arcpy.AddMessage(u"      {0:<32} {1:>10.4f} {2:>10.4f} {3:>7.1f}x {4:>8}".format(name, t0, t1, t0 / t1 if t1 > 0 else 0.0, count1))
+
+    #public
+    def open(self):
+        '''
+        インデックスを削除して、統合先への InsertCursor を開く
+        '''
+        start = datetime.datetime.now()
+        with stage("merge_drop_index"):
+            self.__drop_indexes()
+        self.__fields = self.__attribute_fields(self.out_fc)
+        self.__spatial_reference = arcpy.Describe(self.out_fc).spatialReference
+        if self.key_field and self.key_field.lower() in [f.lower() for f in self.__fields]:
+            with stage("merge_existing_keys"):
+                self.existing_keys = featureclass_keys(self.out_fc, self.key_field)
+        self.__icursor = arcpy.da.InsertCursor(self.out_fc, ["SHAPE@WKB"] + self.__fields)
+        self.elapsed += datetime.datetime.now() - start
+
+    def delete_existing(self, keys) -> int:
+        '''
+        open の時点で統合先にあった行のうち、key_field の値が keys のいずれかの行を削除し、削除した件数を返す
+        （前回の実行が途中で止まり、マニフェストに記録されずに残った市区町村の行を、書き込み直す前に削除する）
+        削除する行がある場合だけ、InsertCursor を閉じて削除してから開き直す
+        '''
+        stale = self.existing_keys & set(keys)
+        if not stale:
+            return 0
+        start = datetime.datetime.now()
+        del self.__icursor
+        self.__icursor = None
+        with stage("merge_delete_existing"):
+            count = delete_rows_by_codes(self.out_fc, self.key_field, sorted(stale))
+        self.existing_keys -= stale
+        self.__icursor = arcpy.da.InsertCursor(self.out_fc, ["SHAPE@WKB"] + self.__fields)
+        self.elapsed += datetime.datetime.now() - start
+        add_count("merge_deleted_rows", count)
+        return count
+
+    def append(self, in_fc :str) -> int:
+        '''
+        1つのフィーチャクラスのレコードを統合先へ書き込み、書き込んだ件数を返す
+        統合先にあって in_fc にないフィールドは NULL にする
+        '''
+        start = datetime.datetime.now()
+        in_names = [f.lower() for f in self.__attribute_fields(in_fc)]
+        read_fields = [f for f in self.__fields if f.lower() in in_names]
+        key_pos = read_fields.index(self.key_field) + 1 if self.key_field in read_fields else None
+        positions = [read_fields.index(f) + 1 if f in read_fields else None for f in self.__fields]
+        #統合先と座標系が異なる場合も、SearchCursor で統合先の座標系に変換してから書き込む
+        if self.spatial_sort or self.query_check:
+            count, self.last_keys = self.__write_rows(self.__sorted_featureclass_rows(in_fc, read_fields, positions), positions, key_pos)
+        else:
+            with arcpy.da.SearchCursor(in_fc, ["SHAPE@WKB"] + read_fields, spatial_reference=self.__spatial_reference) as scursor:
+                count, self.last_keys = self.__write_rows(scursor, positions, key_pos)
+        self.row_count += count
+        self.elapsed += datetime.datetime.now() - start
+        add_count("merged_rows", count)
+        return count
+
+    def append_rows(self, fields :List[str], rows) -> int:
+        '''
+        (WKB, 属性...) の行を統合先へ書き込み、書き込んだ件数を返す（列指向フォーマットの中間ファイルから読み込んだ行など）
+        fields は行の属性のフィールド名。WKB は統合先と同じ座標系であること
+        '''
+        start = datetime.datetime.now()
+        names = [f.lower() for f in fields]
+        positions = [names.index(f.lower()) + 1 if f.lower() in names else None for f in self.__fields]
+        key_pos = names.index(self.key_field.lower()) + 1 if self.key_field and self.key_field.lower() in names else None
+        if self.spatial_sort or self.query_check:
+            rows = self.__sort_rows(rows, positions)
+        count, self.last_keys = self.__write_rows(rows, positions, key_pos)
+        self.row_count += count
+        self.elapsed += datetime.datetime.now() - start
+        add_count("merged_rows", count)
+        return count
+
+    def close(self):
+        '''
+        InsertCursor を閉じて、インデックスを作成し直す
+        （query_check の場合は、インデックスの作成前と作成後に同じ検索を実行して処理時間を出力する）
+        '''
+        if self.__icursor is None:
+            return
+        start = datetime.datetime.now()
+        del self.__icursor
+        self.__icursor = None
+        if self.query_check:
+            with stage("query_check"):
+                before = self.__run_queries()
+        with stage("merge_build_index"):
+            self.__build_indexes()
+        self.elapsed += datetime.datetime.now() - start
+        if self.query_check:
+            with stage("query_check"):
+                after = self.__run_queries()
+            self.__report_queries(before, after)
+
+def featureclass_keys(fc :str, field :str) -> set:
+    '''
+    フィーチャクラスの field の値のセットを返す関数（NULL は除く）
+    '''
+    with arcpy.da.SearchCursor(fc, [field]) as cursor:
+        return set(row[0] for row in cursor if row[0] is not None)
+
+def list_featureclass(ws :str) -> str:
+    '''
+    市区町村FGDB 内のフィーチャクラス（農地筆は1ファイルしかないので先頭）を返す関数。ない場合は None
+    '''
+    #市区町村FGDB は後で削除するので、ワークスペースの設定を元に戻しておく
+    prev_workspace = arcpy.env.workspace
+    arcpy.env.workspace = ws
+    fcs = arcpy.ListFeatureClasses()
+    arcpy.env.workspace = prev_workspace
+    if not fcs:
+        return None
+    return os.path.join(ws, fcs[0])
+
+def consolidate_featureclasses(in_fcs :List[str], out_fc :str, index_fields :List[str] = None,
+                               spatial_sort :bool = True, query_check :bool = False) -> Tuple[int, datetime.timedelta]:
+    '''
+    市区町村のフィーチャクラスを1回の読み込みで統合先へ書き込み、(書き込んだ件数, 統合にかかった時間) を返す関数
+    '''
+    fcname = os.path.basename(out_fc)
+    with FarmlandConsolidator(out_fc, index_fields, spatial_sort=spatial_sort, query_check=query_check) as merger:
+        for fc in in_fcs:
+            count = merger.append(fc)
+            arcpy.AddMessage(u"    merge: {0} ⇒ {1} ({2} rows)".format(os.path.basename(fc), fcname, count))
+    return merger.row_count, merger.elapsed
+
+def __delete_existing(merger :FarmlandConsolidator, keys, outws :str):
+    #統合先に前からある同じ自治体コードの行を、書き込む前に削除する（マニフェストに記録されていない入力の場合も）
+    count = merger.delete_existing(keys)
+    if count:
+        arcpy.AddMessage(u"    Delete {0} existing rows of {1} ({2})".format(count, os.path.basename(outws), u", ".join(sorted(map(str, keys)))))
+
+def merge_as_completed(results, out_fc :str, index_fields :List[str] = None, create_out_fc = None,
+                       key_field :str = None, on_merged = None, spatial_sort :bool = True,
+                       query_check :bool = False) -> Tuple[int, datetime.timedelta, List[str]]:
+    '''
+    変換が終わった市区町村から順に統合先へ書き込み、市区町村FGDB を削除する関数（変換とマージを並行して実行）
+    統合先への書込みはこの関数（親プロセス）だけが行うので、FGDB へ書き込むのは常に1プロセス
+    
+    results       : (市区町村FGDB または 列指向フォーマットの中間ファイル, 処理結果のメッセージ, 成功したか) を終わった順に返すイテレーター
+                      （pool.imap_unordered(run_scheduled_task, ...) の戻り値）
+                      失敗した市区町村FGDB はマージせずに削除する
+    out_fc        : 統合先のフィーチャクラス
+    index_fields  : 最後に属性インデックスを作成するフィールド
+    create_out_fc : 統合先がない場合に、最初の市区町村のフィーチャクラスを受け取って統合先を作成する関数
+    key_field     : on_merged に渡す値の一覧を集めるフィールド（自治体コードなど）
+                      統合先に前からある行のうち、書き込む市区町村と同じ値の行は、書き込む前に削除する
+                      （前回の実行が途中で止まって記録されなかった市区町村を、重複して書き込まないようにする）
+    on_merged     : マージした市区町村ごとに (市区町村FGDB, 件数, key_field の値のセット) で呼び出す関数
+                      統合先への書込みを確定（カーソルを閉じてインデックスを作成）した後にまとめて呼び出す
+                      （close が失敗した場合は呼び出さないので、マニフェストに書込みを確定していない市区町村が記録されない）
+    spatial_sort  : 市区町村ごとに、重心のヒルベルト曲線上の順に並べ替えて書き込む
+    query_check   : インデックスの作成前と作成後に同じ検索を実行して、処理時間を出力する
+    戻り値        : (書き込んだ件数, 統合にかかった時間, 削除できなかった市区町村FGDB の一覧)
+    '''
+    fcname = os.path.basename(out_fc)
+    merger = None
+    pending_deletes = []
+    merged = [] #統合先への書込みを確定した後に on_merged へ渡す (市区町村FGDB, 件数, key_field の値のセット)
+    try:
+        for outws, message, ok in results:
+            if not ok:
+                arcpy.AddWarning(u"{0}".format(message))
+            else:
+                arcpy.AddMessage(u"{0}".format(message))
+            if is_columnar(outws):
+                #列指向フォーマットの中間ファイル（.arrow / .parquet）：統合先は作成済みであること
+                if ok and os.path.exists(outws):
+                    if merger is None:
+                        merger = FarmlandConsolidator(out_fc, index_fields, key_field, spatial_sort, query_check)
+                        merger.open()
+                    if merger.existing_keys:
+                        __delete_existing(merger, read_columnar_keys(outws, key_field), outws)
+                    count = merger.append_rows(*read_columnar(outws))
+                    arcpy.AddMessage(u"    merge: {0} ⇒ {1} ({2} rows)".format(os.path.basename(outws), fcname, count))
+                    merged.append((outws, count, merger.last_keys))
+                elif ok:
+                    merged.append((outws, 0, set()))
+                try:
+                    with stage("delete"):
+                        if os.path.exists(outws):
+                            os.remove(outws)
+                except OSError:
+                    pending_deletes.append(outws)
+                continue
+            fc = list_featureclass(outws) if ok else None
+            if fc:
+                if merger is None:
+                    if not arcpy.Exists(out_fc):
+                        create_out_fc(fc)
+                    merger = FarmlandConsolidator(out_fc, index_fields, key_field, spatial_sort, query_check)
+                    merger.open()
+                if merger.existing_keys:
+                    __delete_existing(merger, featureclass_keys(fc, key_field), outws)
+                count = merger.append(fc)
+                arcpy.AddMessage(u"    merge: {0} ⇒ {1} ({2} rows)".format(os.path.basename(fc), fcname, count))
+                merged.append((outws, count, merger.last_keys))
+            elif ok:
+                merged.append((outws, 0, set()))
+            try:
+                with stage("delete"):
+                    if arcpy.Exists(outws):
+                        arcpy.management.Delete(outws)
+            except arcpy.ExecuteError:
+                #ワーカープロセスがまだロックを持っている場合は、プールの終了後に削除する
+                pending_deletes.append(outws)
+    finally:
+        if merger is not None:
+            merger.close()
+        #close で書込みが確定した後に記録する（途中で例外になった場合も、確定した分は記録して次回は続きから変換する）
+        if on_merged:
+            for outws, count, keys in merged:
+                on_merged(outws, count, keys)
+    if merger is None:
+        return 0, datetime.timedelta(0), pending_deletes
+    return merger.row_count, merger.elapsed, pending_deletes
@@ -0,0 +1,262 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Metrics.py
+# Purpose:    サンプルスクリプト - 処理の段階ごとの計測と実行レポート
+#               a)ワーカープロセス：タスクごとに、段階（文字コード判定・読込み・WKB 作成・型変換・書込みなど）の
+#                 処理時間と、カウンター（読み込んだバイト数・件数など）、ピークのメモリ使用量（RSS）を計測
+#               b)親プロセス：ワーカーから返された計測結果に、プールの待ち時間を加えて集計し、
+#                 実行レポート（JSON / CSV）の出力と、集計表の arcpy.AddMessage を行う
+#             計測の呼び出し（stage / add_count）は、計測中のタスクがない場合は何もしないので、
+#             ツールボックス（.pyt）・コマンドラインのどちらから実行しても、そのまま動作します
+#             MP_Farmland_Schedule.py , MP_Farmland_JsonToFeatureClass.py , MP_Farmland_ShapefileToFeatureClass.py ,
+#             MP_Farmland_Merge.py , MP_Farmland_NationalBatch.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import csv
+import json
+import time
+import datetime
+import contextlib
+from typing import Tuple,List,Dict
+
+#実行レポートのファイル名（出力フォルダに "<名前>.json" と "<名前>.csv" を出力）
+REPORT_NAME = "farmland_run_report"
+
+_current = None #このプロセスで計測中のタスク（TaskMetrics）
+
+def peak_rss_bytes() -> int:
+    '''
+    このプロセスのピークのメモリ使用量（RSS / Windows はピークのワーキングセット）をバイトで返す関数（取得できない場合は 0）
+    '''
+    try:
+        if os.name == "nt":
+            import ctypes
+            from ctypes import wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return 0
+            return int(counters.PeakWorkingSetSize)
+        import resource
+        #Linux は KB、macOS はバイト
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(rss) if os.uname().sysname == "Darwin" else int(rss) * 1024
+    except Exception:
+        return 0
+
+class TaskMetrics():
+    '''
+    1タスク分の計測結果（段階ごとの処理時間と呼出し回数、カウンター）を保持するクラス
+    '''
+    def __init__(self, name :str):
+        self.name = name
+        self.started = time.time()
+        self.stages = {} #段階 ⇒ [秒, 回数]
+        self.counters = {}
+        return
+    def __del__(self):
+        return
+
+    #public
+    @contextlib.contextmanager
+    def stage(self, name :str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - start
+            entry[1] += 1
+
+    def count(self, name :str, value :int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict:
+        '''
+        プロセス間で受け渡せるように、dict にして返す（ピークのメモリ使用量とプロセス ID を含む）
+        '''
+        return {
+            "task": self.name,
+            "pid": os.getpid(),
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "peak_rss": peak_rss_bytes(),
+            "stages": dict((k, {"seconds": v[0], "calls": v[1]}) for k, v in self.stages.items()),
+            "counters": dict(self.counters),
+        }
+
+def begin_task(name :str) -> TaskMetrics:
+    '''
+    このプロセスでタスクの計測を開始する関数（以降の stage / add_count はこのタスクに記録）
+    '''
+    global _current
+    _current = TaskMetrics(name)
+    return _current
+
+def end_task() -> Dict:
+    '''
+    計測中のタスクを終了して、計測結果の dict を返す関数（計測中のタスクがない場合は None）
+    '''
+    global _current
+    metrics, _current = _current, None
+    return None if metrics is None else metrics.to_dict()
+
+def stage(name :str):
+    '''
+    計測中のタスクに、with ブロックの処理時間を段階として記録する（計測中のタスクがない場合は何もしない）
+    使い方）
+        with stage("json_decode"):
+            ...
+    '''
+    if _current is None:
+        return contextlib.nullcontext()
+    return _current.stage(name)
+
+def add_count(name :str, value :int = 1):
+    '''
+    計測中のタスクのカウンターに値を加える（計測中のタスクがない場合は何もしない）
+    '''
+    if _current is not None:
+        _current.count(name, value)
+
+class RunReport():
+    '''
+    ワーカーと親プロセスの計測結果を集めて、実行レポートを出力するクラス
+    使い方）
+        report = RunReport("MP_Farmland_JsonToFeatureClass")
+        results = report.collect(pool.imap_unordered(run_scheduled_task, params, chunksize=1))
+        ...（results は (出力, メッセージ, 成功したか) を返す。計測結果は report に集まる）
+        report.summarize()
+        report.write(outfolder)
+        ...
+        report.close() #失敗した場合も呼び出す（finally）
+    '''
+    def __init__(self, title :str):
+        self.title = title
+        self.started = time.time()
+        self.tasks = []
+        self.parent = begin_task(u"(parent)") #親プロセスのマージなどは、このタスクとして記録
+        return
+    def __del__(self):
+        return
+
+    #public
+    def add(self, metrics :Dict, submitted :float = None, ok :bool = True):
+        '''
+        ワーカーの計測結果を加える（submitted はプールに渡した時刻。ワーカーが開始するまでを待ち時間とする）
+        '''
+        if not metrics:
+            return
+        metrics = dict(metrics)
+        metrics["ok"] = ok
+        metrics["queue_wait"] = max(0.0, metrics["started"] - submitted) if submitted else 0.0
+        self.tasks.append(metrics)
+
+    def collect(self, results, submitted :float = None):
+        '''
+        (出力, メッセージ, 成功したか, 計測結果) を返すイテレーターから計測結果を取り出して、
+        (出力, メッセージ, 成功したか) を返すジェネレーター（merge_as_completed にそのまま渡せる）
+        submitted を省略した場合は、collect を呼び出した時刻（imap_unordered でまとめて渡した時刻）とする
+        '''
+        submitted = submitted or time.time()
+        for result in results:
+            self.add(result[3] if len(result) > 3 else None, submitted, result[2])
+            yield result[:3]
+
+    def totals(self) -> Dict[str, Dict]:
+        '''
+        ワーカーの段階ごとの合計（秒, 回数）を返す
+        '''
+        totals = {}
+        for task in self.tasks:
+            for name, value in task["stages"].items():
+                entry = totals.setdefault(name, {"seconds": 0.0, "calls": 0})
+                entry["seconds"] += value["seconds"]
+                entry["calls"] += value["calls"]
+        return totals
+
+    def to_dict(self) -> Dict:
+        counters = {}
+        for task in self.tasks:
+            for name, value in task["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+        peak_by_pid = {}
+        for task in self.tasks:
+            peak_by_pid[task["pid"]] = max(peak_by_pid.get(task["pid"], 0), task["peak_rss"])
+        elapsed = time.time() - self.started
+        return {
+            "title": self.title,
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "elapsed": elapsed,
+            "task_count": len(self.tasks),
+            "failed_count": sum(1 for t in self.tasks if not t["ok"]),
+            "stages": self.totals(),
+            "counters": counters,
+            "rows_per_sec": counters.get("rows", 0) / elapsed if elapsed > 0 else 0,
+            "queue_wait": sum(t["queue_wait"] for t in self.tasks),
+            "peak_rss_by_pid": dict((str(k), v) for k, v in peak_by_pid.items()),
+            "parent": self.parent.to_dict(),
+            "tasks": self.tasks,
+        }
+
+    def summarize(self):
+        '''
+        段階ごとの処理時間の集計表と、件数・スループット・メモリ使用量を arcpy.AddMessage で出力する
+        '''
+        report = self.to_dict()
+        arcpy.AddMessage(u"  Run report: {0} tasks ({1} failed)".format(report["task_count"], report["failed_count"]))
+        arcpy.AddMessage(u"    {0:<28} {1:>10} {2:>8} {3:>6}".format("stage", "seconds", "calls", "%"))
+        stages = list(report["stages"].items()) + [(u"(parent) " + k, v) for k, v in report["parent"]["stages"].items()]
+        total = sum(v["seconds"] for k, v in stages) or 1.0
+        for name, value in sorted(stages, key=lambda s: s[1]["seconds"], reverse=True):
+            arcpy.AddMessage(u"    {0:<28} {1:>10.2f} {2:>8} {3:>6.1f}".format(name, value["seconds"], value["calls"], 100.0 * value["seconds"] / total))
+        counters = sorted(report["counters"].items()) + [(u"(parent) " + k, v) for k, v in sorted(report["parent"]["counters"].items())]
+        for name, value in counters:
+            arcpy.AddMessage(u"    {0:<28} {1:>10}".format(name, value))
+        arcpy.AddMessage(u"    {0:<28} {1:>10.1f}".format("rows/sec (wall)", report["rows_per_sec"]))
+        arcpy.AddMessage(u"    {0:<28} {1:>10.2f} sec (total)".format("pool queue wait", report["queue_wait"]))
+        peaks = list(report["peak_rss_by_pid"].values())
+        if peaks:
+            arcpy.AddMessage(u"    {0:<28} {1:>10.1f} MB (max), {2:.1f} MB (parent)".format("peak RSS per worker",
+                max(peaks) / 1024.0 / 1024.0, report["parent"]["peak_rss"] / 1024.0 / 1024.0))
+
+    def close(self):
+        '''
+        親プロセスの計測を終了する（以降の stage / add_count は記録しない）
+        '''
+        global _current
+        if _current is self.parent:
+            _current = None
+
+    def write(self, outfolder :str, name :str = REPORT_NAME) -> Tuple[str, str]:
+        '''
+        実行レポートを "<name>.json"（全体）と "<name>.csv"（タスクごとに1行）で出力し、2つのパスを返す
+        '''
+        report = self.to_dict()
+        json_path = os.path.join(outfolder, name + ".json")
+        with open(json_path, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=1)
+        stage_names = sorted(report["stages"])
+        counter_names = sorted(report["counters"])
+        csv_path = os.path.join(outfolder, name + ".csv")
+        with open(csv_path, "w", encoding="utf-8-sig", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["task", "ok", "pid", "queue_wait", "elapsed", "peak_rss_mb"] + stage_names + counter_names)
+            for task in report["tasks"]:
+                writer.writerow([task["task"], task["ok"], task["pid"], round(task["queue_wait"], 3), round(task["elapsed"], 3),
+                                 round(task["peak_rss"] / 1024.0 / 1024.0, 1)] +
+                                [round(task["stages"].get(s, {}).get("seconds", 0.0), 3) for s in stage_names] +
+                                [task["counters"].get(c, 0) for c in counter_names])
+        arcpy.AddMessage(u"  Run report: {0}".format(json_path))
+        return json_path, csv_path
@@ -0,0 +1,295 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_NationalBatch.py
+# Purpose:    サンプルスクリプト - 全国（複数の都道府県フォルダ）の農地筆ポリゴンを、1つのプロセスプールで変換する
+#               a)ルートフォルダ直下の都道府県フォルダを列挙し、形式（GeoJSON / シェープファイル）を判定
+#               b)全都道府県の市区町村をまとめて、サイズの大きい順に1つのプールへ割り当て
+#                 （都道府県ごとにプールの起動・pythonw.exe の起動・arcpy のインポートを繰り返さない）
+#               c)都道府県ごとに FGDB を作成する場合：
+#                   ある都道府県の市区町村がすべて変換し終わったら、その都道府県のマージをプールの1タスクとして実行
+#                   （都道府県ごとに FGDB が別なので、異なる都道府県のマージは並行して実行できる）
+#                 全国で1つの FGDB を作成する場合：
+#                   FGDB へ書き込めるのは1プロセスだけなので、変換が終わった市区町村から順に親プロセスがマージ
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import sys
+import glob
+import time
+import queue
+import multiprocessing
+import datetime
+import traceback
+from collections import deque
+from typing import Tuple,List,Dict
+import MP_Farmland_JsonToFeatureClass as json_conv
+import MP_Farmland_ShapefileToFeatureClass as shp_conv
+from MP_Farmland_Merge import list_featureclass, consolidate_featureclasses, merge_as_completed
+from MP_Farmland_Schedule import schedule_largest_first, run_scheduled_task
+from MP_Farmland_Metrics import RunReport, begin_task, end_task, stage
+from MP_Farmland_FolderScan import prefecture_format
+
+_FCNAME = "Farmland" #マージ後のフィーチャクラス名
+_SHP_INDEX_FIELDS = ["CITYCODE"]
+
+def list_prefecture_folders(rootfolder :str) -> List[Tuple[str, str]]:
+    '''
+    ルートフォルダ直下の都道府県フォルダを (フォルダのパス, 形式) のリストで返す関数
+      形式は "json"（フォルダ直下に *.json がある）または "shp"（サブフォルダに *.shp がある）
+    '''
+    prefs = []
+    for name in sorted(os.listdir(rootfolder)):
+        path = os.path.join(rootfolder, name)
+        if not os.path.isdir(path) or name.lower().endswith(".gdb"):
+            continue
+        #形式の判定は、最初の *.json / *.shp が見つかった時点で走査を終了する
+        fmt = prefecture_format(path)
+        if fmt:
+            prefs.append((path, fmt))
+    return prefs
+
+def merge_prefecture(outpref :str, results :List[Tuple[str, bool]], template_fc :str = None, index_fields :List[str] = None) -> Tuple[str, str, bool, Dict]:
+    '''
+    1プロセスで実行する処理：
+      1都道府県の市区町村FGDB を、都道府県のFGDB のフィーチャクラス（"Farmland"）に統合して、市区町村FGDB を削除する
+      （他の都道府県のマージとは別の FGDB に書き込むので、並行して実行できる）
+      run_scheduled_task と同じく (都道府県のFGDB, 処理結果のメッセージ, 成功したか, 計測結果) を返す
+
+    outpref     : 都道府県の出力フォルダ（"<フォルダ名>.gdb" を作成）
+    results     : (市区町村FGDB, 変換に成功したか) のリスト（失敗した市区町村FGDB はマージせずに削除）
+    template_fc : マージ先の作成に使うテンプレート（None の場合は最初の市区町村のフィーチャクラスから作成）
+    '''
+    foldername = u"{0}.gdb".format(os.path.basename(outpref))
+    prefws = os.path.join(outpref, foldername)
+    begin_task(foldername)
+    try:
+        fcs = [fc for fc in (list_featureclass(ws) for ws, ok in results if ok and arcpy.Exists(ws)) if fc]
+        arcpy.management.CreateFileGDB(outpref, foldername, "CURRENT")
+        outfc = os.path.join(prefws, _FCNAME)
+        if template_fc:
+            arcpy.management.Copy(template_fc, outfc)
+        elif fcs:
+            arcpy.management.CreateFeatureclass(prefws, _FCNAME, template=fcs[0], spatial_reference=fcs[0])
+        row_count, elapsed = 0, datetime.timedelta(0)
+        if fcs:
+            row_count, elapsed = consolidate_featureclasses(fcs, outfc, index_fields)
+        with stage("delete"):
+            for ws, ok in results:
+                if arcpy.Exists(ws):
+                    arcpy.management.Delete(ws)
+            if template_fc:
+                arcpy.management.Delete(os.path.dirname(template_fc))
+        return prefws, u"    マージ済：{0} ({1} rows, {2})".format(prefws, row_count, elapsed), True, end_task()
+    except Exception:
+        return prefws, u"    Error：{0}\n{1}".format(prefws, traceback.format_exc()), False, end_task()
+
+def __prepare_prefecture(infolder :str, fmt :str, outpref :str, cpu_cnt :int, schema :Dict = None, national :bool = False) -> Dict:
+    '''
+    1都道府県分の変換タスクを作成する（GeoJSON の場合はスキーマとテンプレートも作成）
+      schema   : GeoJSON の場合に使うスキーマ（None の場合は都道府県ごとに load_farmland_schema で作成）
+      national : 全国で1つの FGDB にマージする場合は、シェープファイルの都道府県のテンプレートは作成しない
+                 （全都道府県の DBF のフィールド定義をまとめて、全国のフィーチャクラスを作成するため）
+    '''
+    os.makedirs(outpref, exist_ok=True)
+    pref = {"name": os.path.basename(infolder), "format": fmt, "outfolder": outpref, "template_fc": None}
+    if fmt == "json":
+        if schema is None:
+            schema = json_conv.load_farmland_schema(infolder)
+        arcpy.management.CreateFileGDB(outpref, json_conv.TEMPLATE_GDB, "CURRENT")
+        pref["template_fc"] = json_conv.create_template_featureclass(os.path.join(outpref, json_conv.TEMPLATE_GDB), _FCNAME, schema)
+        infiles = sorted(glob.glob(os.path.join(infolder, "*.json")))
+        pref["tasks"], gdb_inputs = json_conv.build_convert_tasks(infiles, outpref, schema, pref["template_fc"], json_conv.SHARD_SIZE, cpu_cnt)
+        pref["index_fields"] = json_conv.INDEX_FIELDS
+    else:
+        inwss = sorted(p for p in glob.glob(os.path.join(infolder, "*")) if os.path.isdir(p))
+        if not national:
+            #都道府県の全市区町村の DBF のフィールド定義をまとめたテンプレート（変換が終わる順に依存しない）
+            arcpy.management.CreateFileGDB(outpref, json_conv.TEMPLATE_GDB, "CURRENT")
+            pref["template_fc"] = shp_conv.create_template_featureclass(os.path.join(outpref, json_conv.TEMPLATE_GDB), _FCNAME, inwss)
+            if pref["template_fc"] is None:
+                arcpy.management.Delete(os.path.join(outpref, json_conv.TEMPLATE_GDB))
+        pref["inwss"] = inwss
+        pref["tasks"], gdb_inputs = shp_conv.build_convert_tasks(inwss, outpref)
+        pref["index_fields"] = _SHP_INDEX_FIELDS
+    pref["outwss"] = list(gdb_inputs)
+    return pref
+
+def __run_prefecture_merges(pool, params :List[Tuple], prefs :List[Dict], cpu_cnt :int, report :RunReport):
+    '''
+    変換とマージを同じプールで実行する（都道府県ごとに FGDB を作成する場合）
+      プールに渡すタスクは常に cpu_cnt 件までにして、マージできる都道府県があれば変換より先に割り当てる
+      （imap_unordered でまとめて渡すと、マージが全ての変換の後ろに並んでしまうため）
+      ワーカーの計測結果は、プールに渡した時刻からの待ち時間と一緒に report に加える
+    '''
+    pref_by_ws = dict((ws, pref) for pref in prefs for ws in pref["outwss"])
+    remaining = dict((pref["name"], len(pref["outwss"])) for pref in prefs)
+    converted = dict((pref["name"], []) for pref in prefs)
+    conversions = deque(params)
+    merges = deque()
+    done = queue.Queue() #プールの結果は別スレッドのコールバックで受け取るので、キューで親プロセスのループへ渡す
+    for pref in prefs:
+        if remaining[pref["name"]] == 0:
+            merges.append(pref)
+    in_flight = 0
+    while conversions or merges or in_flight:
+        while in_flight < cpu_cnt and (conversions or merges):
+            submitted = time.time()
+            if merges:
+                pref = merges.popleft()
+                args = (pref["outfolder"], converted[pref["name"]], pref["template_fc"], pref["index_fields"])
+                pool.apply_async(merge_prefecture, args,
+                                 callback=lambda r, t=submitted: done.put(("merge", r, t)),
+                                 error_callback=lambda e, t=submitted: done.put(("merge", (None, u"    Error：{0}".format(e), False, None), t)))
+            else:
+                task = conversions.popleft()
+                pool.apply_async(run_scheduled_task, (task,),
+                                 callback=lambda r, t=submitted: done.put(("convert", r, t)),
+                                 error_callback=lambda e, ws=task[1][1], t=submitted: done.put(("convert", (ws, u"    Error：{0}".format(e), False, None), t)))
+            in_flight += 1
+        kind, (outws, message, ok, metrics), submitted = done.get()
+        report.add(metrics, submitted, ok)
+        in_flight -= 1
+        if not ok:
+            arcpy.AddWarning(u"{0}".format(message))
+        else:
+            arcpy.AddMessage(u"{0}".format(message))
+        if kind == "convert":
+            pref = pref_by_ws[outws]
+            converted[pref["name"]].append((outws, ok))
+            remaining[pref["name"]] -= 1
+            if remaining[pref["name"]] == 0:
+                arcpy.AddMessage(u"  Merge prefecture:{0}".format(pref["name"]))
+                merges.append(pref)
+
+def exec_national_batch(rootfolder :str, outfolder :str, cpu_cnt :int, national :bool = False):
+    '''
+    マルチプロセスでの処理（全国）：
+      rootfolder : 都道府県フォルダ（GeoJSON 形式・シェープファイル形式）が入ったフォルダ
+      outfolder  : 出力フォルダ（都道府県ごとに "<都道府県フォルダ名>\\<都道府県フォルダ名>.gdb" を作成）
+      national   : True の場合は、全国で1つの FGDB（"<出力フォルダ名>.gdb"）にマージする
+                     ※同じ形式の都道府県フォルダのみ指定できます
+      ※段階ごとの処理時間・件数・メモリ使用量を、outfolder の farmland_run_report.json / .csv に出力する
+    '''
+    report = None
+    try:
+        start = datetime.datetime.now()
+        arcpy.AddMessage(u"-- Strat: MP_Farmland_NationalBatch --:{0}".format(start))
+        report = RunReport("MP_Farmland_NationalBatch")
+
+        #a) 各プロセス用の pythonw.exe を設定（Windows のみ。Linux などでベンチマークを実行する場合は現在の Python のまま）
+        if os.name == "nt":
+            python_path = sys.exec_prefix
+            multiprocessing.set_executable(os.path.join(python_path,'pythonw.exe'))
+            #multiprocessing.set_executable(os.path.join(python_path,'python.exe')) #CMDプロンプトの画面が起動するので'pythonw.exe'を使う
+
+        #b) 都道府県フォルダを列挙して、全都道府県の変換タスクをまとめる
+        folders = list_prefecture_folders(rootfolder)
+        formats = set(fmt for path, fmt in folders)
+        arcpy.AddMessage(u"  Prefectures:{0} ({1})".format(len(folders), u", ".join(sorted(formats))))
+        if not folders:
+            arcpy.AddError(u"都道府県フォルダが見つかりません：{0}".format(rootfolder))
+            return
+        if national and len(formats) > 1:
+            arcpy.AddError(u"全国で1つの FGDB にマージする場合は、同じ形式の都道府県フォルダだけを指定してください")
+            return
+        schema = None
+        if national and formats == set(["json"]):
+            #全国で1つのフィーチャクラスにする場合は、全都道府県のスキーマをまとめたスキーマ（フィールドの長さは最大、型は広い方）で
+            #すべての都道府県を変換する（1つの都道府県のスキーマでは、他の都道府県の長い値が入らない場合があるため）
+            try:
+                schema = json_conv.union_schemas([json_conv.load_farmland_schema(path) for path, fmt in folders])
+            except ValueError as e:
+                arcpy.AddError(u"{0}".format(e))
+                return
+        prefs = [__prepare_prefecture(path, fmt, os.path.join(outfolder, os.path.basename(path)), cpu_cnt, schema, national) for path, fmt in folders]
+        #全都道府県の市区町村をサイズの大きい順に処理する
+        params = schedule_largest_first([task for pref in prefs for task in pref["tasks"]])
+        if len(params) < cpu_cnt: # 処理ファイル数がCPUコアより少ない場合無駄なプロセスを起動不要
+            cpu_cnt = max(1, len(params))
+
+        #c) 1つのプールで全国の市区町村を変換してマージ
+        conv_start = datetime.datetime.now()
+        pool = multiprocessing.Pool(cpu_cnt) # cpu数分プロセス作成
+        if national:
+            #全国で1つの FGDB：書き込めるのは1プロセスだけなので、変換が終わった市区町村から順に親プロセスがマージ
+            foldername = u"{0}.gdb".format(os.path.basename(outfolder))
+            prefws = os.path.join(outfolder, foldername)
+            outfc = os.path.join(prefws, _FCNAME)
+            arcpy.AddMessage(u"  Convert and merge to FeatureClass:{1} in FGDB:{0} ".format(foldername, _FCNAME))
+            arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+            if prefs[0]["template_fc"]:
+                #全都道府県のスキーマをまとめたテンプレート（どの都道府県のテンプレートも同じ）
+                arcpy.management.Copy(prefs[0]["template_fc"], outfc)
+            else:
+                #全都道府県の市区町村の DBF のフィールド定義をまとめて（長さは最大）、変換が終わる順に依存しないフィーチャクラスを作成
+                shp_conv.create_template_featureclass(prefws, _FCNAME, [ws for pref in prefs for ws in pref["inwss"]])
+            results = report.collect(pool.imap_unordered(run_scheduled_task, params, chunksize=1))
+            row_count, merge_elapsed, pending_deletes = merge_as_completed(results, outfc, prefs[0]["index_fields"])
+            pool.close()
+            pool.join()
+            for outws in pending_deletes:
+                arcpy.management.Delete(outws)
+            for pref in prefs:
+                if pref["template_fc"]:
+                    arcpy.management.Delete(os.path.dirname(pref["template_fc"]))
+                if not os.listdir(pref["outfolder"]):
+                    os.rmdir(pref["outfolder"]) #市区町村FGDB の作成用に使った空のフォルダ
+            arcpy.AddMessage(u"  Merge time (writer)   :{0} ({1} rows)".format(merge_elapsed, row_count))
+        else:
+            #都道府県ごとの FGDB：変換し終わった都道府県から、マージもプールのタスクとして並行して実行
+            __run_prefecture_merges(pool, params, prefs, cpu_cnt, report)
+            pool.close()
+            pool.join()
+        conv_elapsed = datetime.datetime.now() - conv_start
+
+        arcpy.AddMessage(u"  Convert and merge time:{0}".format(conv_elapsed))
+        report.summarize()
+        report.write(outfolder)
+        fin = datetime.datetime.now()
+        arcpy.AddMessage(u"-- Finish: MP_Farmland_NationalBatch --:{0}".format(fin))
+        arcpy.AddMessage(u"     Elapsed time:{0}".format(fin-start))
+    except:
+        arcpy.AddError(u"Exception:{0}".format(traceback.format_exc()))
+    finally:
+        #失敗した場合も親プロセスの計測を終了する（ArcGIS Pro のプロセスで、次に実行するツールに計測が残らないように）
+        if report is not None:
+            report.close()
+
+if __name__ == '__main__':
+    '''
+    コマンドプロンプトからの実行パラメータを設定の場合：
+      rootfolder: 都道府県フォルダが入ったフォルダ
+      例）
+        |-farmland_2024
+            |-2024_01
+            |   |-2024_012025.json
+            |   ･････
+            |-2024_02
+            ･････
+
+      outfolder: 出力フォルダ（空のフォルダ）
+      例)
+        |-farmland_2024_filegdb
+            |-2024_01
+            |   |-2024_01.gdb
+            |   |   Farmland
+            |-2024_02
+            ･････
+            |-farmland_2024_filegdb.gdb # 第5引数に national を指定した場合、全国で1つの FGDB にマージ
+            |   Farmland
+
+      cpu_cnt : マルチプロセスでの処理時に起動するプロセス数
+      national: （省略可）national を指定すると、全国で1つの FGDB にマージする
+    '''
+    args = sys.argv
+    if len(args) in (4, 5):
+        rootfolder = args[1]
+        outfolder = args[2]
+        cpu_cnt = int(args[3])
+        national = len(args) == 5 and args[4].lower() == "national"
+        exec_national_batch(rootfolder, outfolder, cpu_cnt, national)
+    else:
+        print("Arguments error")
@@ -0,0 +1,305 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Precision.py
+# Purpose:    サンプルスクリプト - ポリゴンの座標の丸めと頂点の削減（書込み前の WKB に対して実行）
+#               a)座標を grid の間隔の格子に丸める（座標は格子の整数値にして、以降の比較を誤差なしで行う）
+#               b)連続する重複した頂点と、一直線上にある頂点（スパイクを含む）を削除
+#               c)tolerance を指定した場合は、Douglas-Peucker 法で許容距離内の頂点を削除
+#               d)頂点数と WKB のバイト数の削減量を集計
+#               e)公開年度間の変更抽出用に、丸めた頂点からジオメトリの指紋を計算（geometry_fingerprints）
+#             処理はバッチ（複数のフィーチャ）の全リングをまとめた NumPy 配列で行い、リングごとの Python のループをしない
+#             頂点が 3 未満になるリングは、そのリングだけ削減前の頂点に戻す（リングの向き・穴の構成は変えない）
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_ShapefileToFeatureClass.py , MP_Farmland_ChangeDetect.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import struct
+import hashlib
+import numpy as np
+from typing import Tuple,List,Dict
+
+_WKB_HEADER = struct.Struct('<BII')
+_WKB_COUNT = struct.Struct('<I')
+#重複・一直線上の頂点の削除を繰り返す最大回数（削除で新たに重複・一直線になる頂点があるため）
+_MAX_PASSES = 8
+
+def precision_options(grid :float = 0.0, tolerance :float = 0.0) -> Dict:
+    '''
+    座標の丸めと頂点の削減の設定を返す関数（どちらも 0 以下の場合は None ＝ 何もしない）
+      grid      : 座標を丸める格子の間隔（座標系の単位。緯度経度の場合は度。例：1e-7 ≒ 1cm）
+      tolerance : Douglas-Peucker 法の許容距離（座標系の単位。0 の場合は重複・一直線上の頂点だけ削除）
+    '''
+    grid = float(grid or 0.0)
+    tolerance = float(tolerance or 0.0)
+    if grid <= 0 and tolerance <= 0:
+        return None
+    return {"grid": max(grid, 0.0), "tolerance": max(tolerance, 0.0)}
+
+def parse_precision_args(options :List[str]) -> Dict:
+    '''
+    コマンドラインの "grid=<間隔>" / "tolerance=<許容距離>" から precision_options の設定を返す関数
+    '''
+    values = {}
+    for option in options:
+        key, sep, value = option.partition("=")
+        if sep and key.lower() in ("grid", "tolerance"):
+            values[key.lower()] = float(value)
+    return precision_options(values.get("grid", 0.0), values.get("tolerance", 0.0))
+
+def _read_polygon(wkb :bytes, pos :int):
+    #Polygon の WKB を読み、[(座標の開始位置, 頂点数), ...] と次の位置を返す
+    nrings = _WKB_COUNT.unpack_from(wkb, pos + 5)[0]
+    pos += 9
+    rings = []
+    for i in range(nrings):
+        n = _WKB_COUNT.unpack_from(wkb, pos)[0]
+        rings.append((pos + 4, n))
+        pos += 4 + 16 * n
+    return rings, pos
+
+def _read_wkb(wkb :bytes):
+    #Polygon / MultiPolygon（リトルエンディアン、2次元）の WKB をリングの一覧にする（対象外の場合は None）
+    if len(wkb) < 9 or wkb[0] != 1:
+        return None
+    gtype = _WKB_COUNT.unpack_from(wkb, 1)[0]
+    if gtype == 3:
+        rings, pos = _read_polygon(wkb, 0)
+        return [rings]
+    if gtype == 6:
+        polygons = []
+        pos = 9
+        for i in range(_WKB_COUNT.unpack_from(wkb, 5)[0]):
+            if wkb[pos] != 1 or _WKB_COUNT.unpack_from(wkb, pos + 1)[0] != 3:
+                return None
+            rings, pos = _read_polygon(wkb, pos)
+            polygons.append(rings)
+        return polygons
+    return None
+
+def _ring_layout(rid :np.ndarray, nrings :int):
+    #リング番号（昇順）から、リングごとの頂点数と開始位置を返す
+    counts = np.bincount(rid, minlength=nrings)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return counts, starts
+
+def _neighbors(rid :np.ndarray, nrings :int):
+    #リング内で1つ前と1つ後の頂点の位置（リングは閉じた輪として扱う）
+    counts, starts = _ring_layout(rid, nrings)
+    idx = np.arange(len(rid))
+    first = starts[rid]
+    last = first + counts[rid] - 1
+    return np.where(idx == first, last, idx - 1), np.where(idx == last, first, idx + 1)
+
+def _keep_rings(rid :np.ndarray, keep :np.ndarray, nrings :int) -> np.ndarray:
+    #削除した結果、頂点が 3 未満になるリングは削除しない
+    kept = np.bincount(rid[keep], minlength=nrings)
+    return keep | (kept < 3)[rid]
+
+def geometry_fingerprints(wkbs :List, grid :float = 1e-7, digest_size :int = 8) -> List[bytes]:
+    '''
+    WKB のリストから、ジオメトリを比較するための指紋（digest_size バイト）のリストを返す関数
+    座標を grid の間隔の格子に丸め、ジオメトリごとに重複を除いて並べ替えた頂点とリング数から計算する
+    （リングの開始位置・向きや、書込み先の XY 分解能による座標の違いでは変わらない）
+    Polygon / MultiPolygon 以外は WKB そのものから計算する（None の場合は None）
+    '''
+    results = [None] * len(wkbs)
+    pending = {} #Polygon / MultiPolygon ⇒ 指紋を計算する前のバイト列
+    chunks = []
+    owners = []
+    lengths = []
+    for i, wkb in enumerate(wkbs):
+        if wkb is None:
+            continue
+        wkb = bytes(wkb)
+        polygons = _read_wkb(wkb)
+        if polygons is None:
+            results[i] = hashlib.blake2b(wkb, digest_size=digest_size).digest()
+            continue
+        nrings = sum(len(rings) for rings in polygons)
+        pending[i] = [_WKB_COUNT.pack(nrings)] #頂点がない場合はリング数だけから計算
+        for rings in polygons:
+            for off, n in rings:
+                chunks.append(wkb[off:off + 16 * n])
+                owners.append(i)
+                lengths.append(n)
+    if lengths:
+        coords = np.frombuffer(b"".join(chunks), dtype='<f8').reshape(-1, 2)
+        gid = np.repeat(np.array(owners, dtype=np.int64), lengths)
+        q = np.rint(coords / grid).astype('<i8')
+        order = np.lexsort((q[:, 1], q[:, 0], gid))
+        gid, q = gid[order], q[order]
+        keep = np.ones(len(gid), dtype=bool)
+        keep[1:] = (gid[1:] != gid[:-1]) | (q[1:] != q[:-1]).any(axis=1)
+        gid, q = gid[keep], q[keep]
+        starts = np.flatnonzero(np.concatenate(([True], gid[1:] != gid[:-1])))
+        ends = np.concatenate((starts[1:], [len(gid)]))
+        data = q.tobytes()
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            pending[int(gid[start])].append(data[16 * start:16 * end])
+    for i, parts in pending.items():
+        results[i] = hashlib.blake2b(b"".join(parts), digest_size=digest_size).digest()
+    return results
+
+class GeometryReducer():
+    '''
+    WKB のバッチに対して、座標の丸めと頂点の削減を行い、削減量を集計するクラス
+    使い方）
+        reducer = GeometryReducer(**precision)        # precision_options の戻り値
+        wkbs = reducer.reduce(wkbs)                   # bytes 以外（None・Geometry）はそのまま返す
+        arcpy.AddMessage(reducer.summary())
+    '''
+    def __init__(self, grid :float = 0.0, tolerance :float = 0.0):
+        self.grid = grid
+        self.tolerance = tolerance
+        self.vertices_in = 0
+        self.vertices_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        return
+    def __del__(self):
+        return
+
+    #private
+    def __drop_redundant(self, pts :np.ndarray, rid :np.ndarray, nrings :int):
+        #連続する重複した頂点と、一直線上にある頂点を削除（削除する頂点がなくなるまで繰り返す）
+        #（重複した頂点を先に削除する。長さ 0 の辺があると、隣の頂点まで一直線上と判定されるため）
+        for i in range(_MAX_PASSES):
+            prev, nxt = _neighbors(rid, nrings)
+            keep = _keep_rings(rid, np.any(pts != pts[prev], axis=1), nrings)
+            removed = not keep.all()
+            pts, rid = pts[keep], rid[keep]
+            prev, nxt = _neighbors(rid, nrings)
+            d1 = (pts - pts[prev]).astype(np.float64)
+            d2 = (pts[nxt] - pts).astype(np.float64)
+            keep = _keep_rings(rid, (d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0]) != 0, nrings)
+            if keep.all() and not removed:
+                break
+            pts, rid = pts[keep], rid[keep]
+        return pts, rid
+
+    def __douglas_peucker(self, pts :np.ndarray, rid :np.ndarray, nrings :int, tolerance :float):
+        #全リングの区間をまとめて分割していく Douglas-Peucker 法
+        #リングは先頭の頂点を末尾にも加えた折れ線にして、区間（始点, 終点）の中で最も遠い頂点で分割する
+        counts, starts = _ring_layout(rid, nrings)
+        cstarts = starts + np.arange(nrings)
+        open_pos = np.arange(len(pts)) + rid
+        closed = np.empty((len(pts) + nrings, 2), dtype=np.float64)
+        closed[open_pos] = pts
+        closed[cstarts + counts] = pts[starts]
+        keep = np.zeros(len(closed), dtype=bool)
+        keep[cstarts] = True
+        seg_s, seg_e = cstarts, cstarts + counts
+        while len(seg_s):
+            inner = seg_e - seg_s - 1
+            active = inner > 0
+            seg_s, seg_e, inner = seg_s[active], seg_e[active], inner[active]
+            if not len(seg_s):
+                break
+            offsets = np.cumsum(inner) - inner
+            seg_of = np.repeat(np.arange(len(seg_s)), inner)
+            pidx = seg_s[seg_of] + 1 + np.arange(inner.sum()) - offsets[seg_of]
+            a = closed[seg_s[seg_of]]
+            ab = closed[seg_e[seg_of]] - a
+            ap = closed[pidx] - a
+            length = np.hypot(ab[:, 0], ab[:, 1])
+            #始点と終点が同じ区間（リング全体）は、始点からの距離
+            dist = np.where(length > 0, np.abs(ab[:, 0] * ap[:, 1] - ab[:, 1] * ap[:, 0]) / np.where(length > 0, length, 1.0),
+                            np.hypot(ap[:, 0], ap[:, 1]))
+            segmax = np.maximum.reduceat(dist, offsets)
+            candidates = np.flatnonzero(dist == segmax[seg_of])
+            first = np.unique(seg_of[candidates], return_index=True)[1]
+            farthest = pidx[candidates[first]]
+            split = segmax > tolerance
+            keep[farthest[split]] = True
+            seg_s, seg_e = np.concatenate((seg_s[split], farthest[split])), np.concatenate((farthest[split], seg_e[split]))
+        keep = _keep_rings(rid, keep[open_pos], nrings)
+        return pts[keep], rid[keep]
+
+    def __reduce_rings(self, coords :np.ndarray, lengths :np.ndarray):
+        #閉じたリングの座標（リングの順に連結）を削減して、閉じたリングの座標とリングごとの頂点数を返す
+        nrings = len(lengths)
+        rid = np.repeat(np.arange(nrings), lengths)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        last = starts + lengths - 1
+        #終点（始点と同じ）を除いた、開いたリングで処理する
+        is_closed = np.all(coords[last] == coords[starts], axis=1)
+        keep = np.ones(len(coords), dtype=bool)
+        keep[last[is_closed]] = False
+        pts, rid = coords[keep], rid[keep]
+        if self.grid > 0:
+            pts = np.round(pts / self.grid).astype(np.int64)
+        pts, rid = self.__drop_redundant(pts, rid, nrings)
+        if self.tolerance > 0:
+            tolerance = self.tolerance / self.grid if self.grid > 0 else self.tolerance
+            pts, rid = self.__douglas_peucker(pts, rid, nrings, tolerance)
+        values = pts * self.grid if self.grid > 0 else pts.astype(np.float64)
+        counts, starts = _ring_layout(rid, nrings)
+        closed = np.empty((len(values) + nrings, 2), dtype='<f8')
+        closed[np.arange(len(values)) + rid] = values
+        closed[starts + np.arange(nrings) + counts] = values[starts]
+        return closed.tobytes(), counts + 1
+
+    #public
+    def reduce(self, wkbs :List) -> List:
+        '''
+        WKB のリストを削減した WKB のリストにして返す
+        （Polygon / MultiPolygon 以外、頂点が 4 未満のリングを含むジオメトリは変更しない）
+        '''
+        parsed = []
+        chunks = []
+        lengths = []
+        for wkb in wkbs:
+            polygons = None
+            if isinstance(wkb, (bytes, bytearray)):
+                wkb = bytes(wkb)
+                polygons = _read_wkb(wkb)
+                if polygons is not None and any(n < 4 for rings in polygons for off, n in rings):
+                    polygons = None
+            if polygons is None:
+                parsed.append((wkb, None))
+                continue
+            parsed.append((wkb, polygons))
+            for rings in polygons:
+                for off, n in rings:
+                    chunks.append(wkb[off:off + 16 * n])
+                    lengths.append(n)
+        if not lengths:
+            return list(wkbs)
+        coords = np.frombuffer(b"".join(chunks), dtype='<f8').reshape(-1, 2)
+        buf, counts = self.__reduce_rings(coords, np.array(lengths))
+        ring_offsets = np.concatenate(([0], np.cumsum(counts)[:-1])) * 16
+        counts = counts.tolist()
+        ring_offsets = ring_offsets.tolist()
+        results = []
+        r = 0
+        for wkb, polygons in parsed:
+            if polygons is None:
+                results.append(wkb)
+                continue
+            out = []
+            if len(polygons) > 1 or wkb[1:5] == b"\x06\x00\x00\x00":
+                out.append(_WKB_HEADER.pack(1, 6, len(polygons)))
+            for rings in polygons:
+                out.append(_WKB_HEADER.pack(1, 3, len(rings)))
+                for i in range(len(rings)):
+                    out.append(_WKB_COUNT.pack(counts[r]))
+                    out.append(buf[ring_offsets[r]:ring_offsets[r] + 16 * counts[r]])
+                    r += 1
+            new_wkb = b"".join(out)
+            self.vertices_in += sum(n for rings in polygons for off, n in rings)
+            self.vertices_out += sum(counts[r - sum(len(rings) for rings in polygons):r])
+            self.bytes_in += len(wkb)
+            self.bytes_out += len(new_wkb)
+            results.append(new_wkb)
+        return results
+
+    def summary(self) -> str:
+        '''
+        頂点数と WKB のバイト数の削減量を返す
+        '''
+        def rate(before, after):
+            return 100.0 * (before - after) / before if before else 0.0
+        return u"    頂点数：{0} ⇒ {1}（-{2:.1f}%）、WKB：{3} ⇒ {4} bytes（-{5:.1f}%）[grid={6:g}, tolerance={7:g}]".format(
+            self.vertices_in, self.vertices_out, rate(self.vertices_in, self.vertices_out),
+            self.bytes_in, self.bytes_out, rate(self.bytes_in, self.bytes_out), self.grid, self.tolerance)
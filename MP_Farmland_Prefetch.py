@@ -0,0 +1,347 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Prefetch.py
+# Purpose:    サンプルスクリプト - ネットワーク共有・クラウド同期フォルダにある入力ファイルの先読み
+#               a)親プロセスのスレッドで、ワーカーに渡す順（サイズの大きい順）に入力ファイルをローカルのキャッシュへコピー
+#                 （ワーカーはキャッシュのファイルを読むので、ネットワーク越しに読むのは1ファイル1回だけ）
+#               b)キャッシュは合計サイズの上限付き。変換が終わったファイルから、最後に使った時刻の古い順（LRU）に削除
+#               c)コピーしながら SHA-1 を計算（マニフェストの記録でファイルを読み直さない）
+#               d)MAFF からダウンロードした zip ファイルは、展開せずに zip 内の GeoJSON を直接読む
+#                 （"<zipファイル>/<zip内のファイル名>" 形式のパスで扱う）
+#               e)文字コードの判定・分割の境界・スキーマのサンプリングなど、変換の前に入力を読む処理にも
+#                 ローカルのコピーを渡す（local_copy と、ファイル単位のタスクを分割する expand）
+#             ヒット・ミスの件数、読み込んだバイト数、待ち時間を実行レポートに出力
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_Manifest.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import time
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import threading
+import traceback
+import collections
+from typing import Tuple,List,Dict
+from MP_Farmland_Metrics import add_count
+
+ZIP_EXT = ".zip"
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024 #キャッシュの合計サイズの上限（1GB）
+DEFAULT_THREADS = 2 #同時に読み込むファイル数
+
+def split_archive(path :str) -> Tuple[str, str]:
+    '''
+    "<zipファイル>/<zip内のファイル名>" 形式のパスを (zipファイルのパス, zip内のファイル名) に分ける関数
+    zip 内のファイルではない場合は (None, path) を返す
+    '''
+    head, member = path, []
+    while True:
+        head, tail = os.path.split(head)
+        if not tail:
+            return None, path
+        member.insert(0, tail)
+        if head.lower().endswith(ZIP_EXT) and os.path.isfile(head):
+            return head, "/".join(member)
+
+def list_inputs(infolder :str, suffix :str = ".json") -> List[str]:
+    '''
+    フォルダ直下（infolder が zip ファイルの場合は zip 内）の、拡張子が suffix のファイルのパスを名前順に返す関数
+    '''
+    suffix = suffix.lower()
+    if infolder.lower().endswith(ZIP_EXT) and os.path.isfile(infolder):
+        with zipfile.ZipFile(infolder) as zf:
+            names = [i.filename for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith(suffix)]
+        return [os.path.join(infolder, *n.split("/")) for n in sorted(names)]
+    return sorted(os.path.join(infolder, f) for f in os.listdir(infolder)
+                  if f.lower().endswith(suffix) and os.path.isfile(os.path.join(infolder, f)))
+
+def input_stat(path :str) -> Tuple[int, float]:
+    '''
+    入力ファイルの (サイズ, 更新日時) を返す関数（zip 内のファイルは、展開後のサイズと zip ファイルの更新日時）
+    '''
+    archive, member = split_archive(path)
+    if archive is None:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+    with zipfile.ZipFile(archive) as zf:
+        size = zf.getinfo(member).file_size
+    return size, os.stat(archive).st_mtime
+
+def input_size(path :str) -> int:
+    '''
+    入力ファイルのサイズ（zip 内のファイルは展開後のサイズ）を返す関数
+    '''
+    return input_stat(path)[0]
+
+class _ArchiveMember():
+    #zip 内のファイルを閉じるときに、zip ファイルも閉じるためのラッパー
+    def __init__(self, archive, member):
+        self._zf = zipfile.ZipFile(archive)
+        self._fp = self._zf.open(member)
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+    def __iter__(self):
+        return iter(self._fp)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        self._fp.close()
+        self._zf.close()
+
+def open_input(path :str):
+    '''
+    入力ファイルをバイナリで開く関数（zip 内のファイルは展開しながら読む。seek もできる）
+    '''
+    archive, member = split_archive(path)
+    if archive is None:
+        return open(path, 'rb')
+    return _ArchiveMember(archive, member)
+
+def copy_input(source :str, dest :str, chunk_size :int = 1024*1024) -> Tuple[int, str]:
+    '''
+    入力ファイルを dest にコピーし、(バイト数, SHA-1) を返す関数
+    SHA-1 は MP_Farmland_Manifest.input_hash と同じ（ファイル名 + 内容）
+    '''
+    h = hashlib.sha1()
+    h.update(os.path.basename(source).encode('utf-8'))
+    size = 0
+    with open_input(source) as fsrc, open(dest, 'wb') as fdst:
+        for chunk in iter(lambda: fsrc.read(chunk_size), b''):
+            h.update(chunk)
+            fdst.write(chunk)
+            size += len(chunk)
+    return size, h.hexdigest()
+
+class FarmlandPrefetcher():
+    '''
+    入力ファイルをワーカーに渡す前に、ローカルのキャッシュフォルダへ先読みするクラス
+    使い方）
+        prefetcher = FarmlandPrefetcher(cache_bytes)
+        params = prefetcher.prefetch(params)      #タスクの引数の1番目（入力ファイル）をキャッシュのパスに置き換えて返すジェネレーター
+        path = prefetcher.local_copy(source)      #（必要な場合）ワーカーへ渡す前に、親プロセスでキャッシュのファイルを読む
+        results = pool.imap_unordered(run_scheduled_task, params, chunksize=1)
+        results = prefetcher.track(results, gdb_inputs) #結果を受け取ったタスクの入力を、キャッシュから削除できるようにする
+        ...
+        prefetcher.close()                         #キャッシュフォルダを削除して、ヒット・ミスなどを実行レポートに記録
+    ※imap_unordered はタスクを別スレッドで取り出すので、先読みが終わったファイルから順にワーカーへ渡る
+    '''
+    def __init__(self, cache_bytes :int = DEFAULT_CACHE_BYTES, threads :int = DEFAULT_THREADS, cache_root :str = None):
+        self.cache_bytes = cache_bytes
+        self.threads = max(1, threads)
+        self.cache_dir = tempfile.mkdtemp(prefix="farmland_prefetch_", dir=cache_root)
+        self._cond = threading.Condition()
+        self._entries = {}  #入力 ⇒ {"dest", "path", "size", "refs", "ready", "error", "digest"}
+        self._order = []    #先読みする順の入力
+        self._next_read = 0     #次に読み込みを始める入力の番号
+        self._next_reserve = 0  #次にキャッシュの容量を確保する入力の番号（容量は必ずこの順に確保する）
+        self._released = collections.OrderedDict() #変換が終わった入力 ⇒ サイズ（最後に使った順）
+        self._reserved = 0
+        self._stalled = None #容量が足りずに、変換が終わるまでコピーを始められない入力の番号
+        self._closed = False
+        self._workers = []
+        self.stats = {"hits": 0, "misses": 0, "bytes": 0, "files": 0, "evictions": 0, "errors": 0,
+                      "wait": 0.0, "read_time": 0.0, "peak_bytes": 0}
+        return
+    def __del__(self):
+        return
+
+    #private
+    def __evict(self, size :int):
+        #容量が足りない場合は、変換が終わった入力を古い順に削除する（キャッシュが空の場合は上限を超えても入れる）
+        while self._reserved > 0 and self._reserved + size > self.cache_bytes and self._released:
+            source, freed = self._released.popitem(last=False)
+            entry = self._entries[source]
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+            entry["path"] = None
+            self._reserved -= freed
+            self.stats["evictions"] += 1
+        return self._reserved == 0 or self._reserved + size <= self.cache_bytes
+
+    def __read_loop(self):
+        while True:
+            with self._cond:
+                if self._closed or self._next_read >= len(self._order):
+                    return
+                index = self._next_read
+                self._next_read += 1
+            source = self._order[index]
+            entry = self._entries[source]
+            try:
+                size = input_size(source)
+            except Exception:
+                size = 0
+            #先に並んでいる入力が容量を確保できるまで待つ（後ろの入力が容量を使い切ると、先頭のタスクが渡せなくなるため）
+            with self._cond:
+                while not self._closed and (self._next_reserve != index or not self.__evict(size)):
+                    if self._next_reserve == index and self._stalled != index:
+                        self._stalled = index
+                        self._cond.notify_all() #local_copy で待っている場合は、元のファイルを読むように知らせる
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._stalled = None
+                self._reserved += size
+                self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self._reserved)
+                self._next_reserve += 1
+                self._cond.notify_all()
+            path = entry["dest"]
+            start = time.perf_counter()
+            try:
+                copied, digest = copy_input(source, path)
+                error = None
+            except Exception:
+                copied, digest, error = 0, None, traceback.format_exc()
+            with self._cond:
+                self.stats["read_time"] += time.perf_counter() - start
+                self._reserved += copied - size #コピー中にサイズが変わった場合
+                if error is None:
+                    entry.update(path=path, size=copied, digest=digest)
+                    self.stats["bytes"] += copied
+                    self.stats["files"] += 1
+                else:
+                    #読めなかった入力は、ワーカーが元のパスから読む（エラーはワーカーの結果として報告される）
+                    entry.update(path=None, size=0, error=error)
+                    self._reserved -= copied
+                    self.stats["errors"] += 1
+                entry["ready"] = True
+                if entry["refs"] == 0:
+                    self.__release_entry(source)
+                self._cond.notify_all()
+
+    def __release_entry(self, source :str):
+        entry = self._entries[source]
+        if entry["path"]:
+            self._released[source] = entry["size"]
+            self._released.move_to_end(source)
+            self._cond.notify_all()
+
+    def __iter_tasks(self, tasks :List[Tuple], expand=None):
+        for func, args, size, predicted in tasks:
+            source = args[0]
+            entry = self._entries[source]
+            with self._cond:
+                if entry["ready"]:
+                    self.stats["hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+                    start = time.perf_counter()
+                    while not entry["ready"] and not self._closed:
+                        self._cond.wait()
+                    self.stats["wait"] += time.perf_counter() - start
+                path = entry["path"] or source
+            if expand is None:
+                yield func, (path,) + tuple(args[1:]), size, predicted
+                continue
+            #ファイル単位のタスクを、ローカルのコピーを読んで分割したタスクに置き換える（分割した数だけ参照を増やす）
+            expanded = list(expand(source, path))
+            with self._cond:
+                entry["refs"] += len(expanded) - 1
+                if entry["refs"] == 0 and entry["ready"]:
+                    self.__release_entry(source)
+            for task in expanded:
+                yield task
+
+    #public
+    def prefetch(self, tasks :List[Tuple], expand=None):
+        '''
+        schedule_largest_first で並べたタスク（引数の1番目が入力ファイル）の順に先読みを開始し、
+        先読みが終わったタスクから、入力ファイルをキャッシュのパスに置き換えて返すジェネレーターを返す
+        （1つの入力を分割したタスクは、同じキャッシュのファイルを使う）
+        expand : ファイル単位のタスクを渡す場合の、(入力ファイル, キャッシュのパス) ⇒ 置き換えるタスクのリスト を返す関数
+                 （分割の境界など、入力を読んで決める内容はキャッシュのファイルから決める。
+                   先読みに失敗した場合は、キャッシュのパスの代わりに入力ファイルのパスを渡す）
+        ※返すジェネレーターは、ワーカーへ渡すときに初めて進める（local_copy を使う処理は、その前に実行できる）
+        '''
+        tasks = list(tasks)
+        names = set()
+        with self._cond:
+            for task in tasks:
+                source = task[1][0]
+                if source not in self._entries:
+                    #キャッシュでも同じファイル名にする（ワーカーはファイル名から出力するフィーチャクラス名を決めるため）
+                    #ファイル名が重なる場合（zip 内の別のフォルダなど）だけ、番号のサブフォルダに入れる
+                    dest = os.path.join(self.cache_dir, os.path.basename(source))
+                    if dest in names:
+                        dest = os.path.join(self.cache_dir, str(len(self._order)), os.path.basename(source))
+                        os.makedirs(os.path.dirname(dest))
+                    names.add(dest)
+                    self._entries[source] = {"dest": dest, "path": None, "size": 0, "refs": 0, "ready": False, "error": None, "digest": None}
+                    self._order.append(source)
+                self._entries[source]["refs"] += 1
+        for i in range(min(self.threads, len(self._order))):
+            worker = threading.Thread(target=self.__read_loop, name=u"prefetch-{0}".format(i), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self.__iter_tasks(tasks, expand)
+
+    def local_copy(self, source :str) -> str:
+        '''
+        入力のコピーが終わるまで待って、キャッシュのパスを返す（ワーカーへ渡す前に、親プロセスで入力を読む処理に使う）
+        先読みしない入力・コピーに失敗した入力、キャッシュの容量が足りずに変換が終わるまでコピーを始められない入力は None
+        '''
+        with self._cond:
+            entry = self._entries.get(source)
+            if entry is None:
+                return None
+            index = self._order.index(source)
+            while not entry["ready"] and not self._closed:
+                if self._stalled is not None and index >= self._stalled:
+                    return None
+                self._cond.wait()
+            return entry["path"]
+
+    def release(self, source :str):
+        '''
+        入力を使うタスクが1つ終わったことを記録する（すべて終わった入力は、容量が足りないときにキャッシュから削除される）
+        '''
+        with self._cond:
+            entry = self._entries.get(source)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] == 0 and entry["ready"]:
+                self.__release_entry(source)
+
+    def track(self, results, gdb_inputs :Dict[str, str]):
+        '''
+        (出力, ...) を返すイテレーターの結果を受け取るたびに、その出力の入力を release するジェネレーター
+          gdb_inputs : 出力 ⇒ 入力ファイル（build_convert_tasks が返す dict）
+        '''
+        for result in results:
+            self.release(gdb_inputs.get(result[0]))
+            yield result
+
+    def digest(self, source :str) -> str:
+        '''
+        先読みでコピーしながら計算した入力の SHA-1 を返す（先読みしていない場合は None）
+        '''
+        entry = self._entries.get(source)
+        return entry["digest"] if entry else None
+
+    def summary(self) -> str:
+        s = self.stats
+        return u"Prefetch: {0} hits / {1} misses, {2} files {3:.1f} MB read ({4:.1f} sec), wait {5:.1f} sec, {6} evictions, peak cache {7:.1f} MB".format(
+            s["hits"], s["misses"], s["files"], s["bytes"] / 1024.0 / 1024.0, s["read_time"], s["wait"], s["evictions"],
+            s["peak_bytes"] / 1024.0 / 1024.0)
+
+    def close(self):
+        '''
+        先読みを止めてキャッシュフォルダを削除し、ヒット・ミスなどを実行レポート（親プロセスのカウンター）に記録する
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        for name in ("hits", "misses", "bytes", "files", "evictions", "errors"):
+            add_count(u"prefetch_{0}".format(name), self.stats[name])
+        add_count("prefetch_wait_ms", int(self.stats["wait"] * 1000))
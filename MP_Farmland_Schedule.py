@@ -0,0 +1,77 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_Schedule.py
+# Purpose:    サンプルスクリプト - マルチプロセスのプールに渡す処理の順番を決める補助関数
+#               a)入力のサイズ（GeoJSON のファイルサイズ、市区町村フォルダの .shp + .dbf の合計サイズ）を取得
+#               b)サイズの大きい順に並べて、chunksize=1 で1件ずつプロセスに割り当てる
+#                 （大きな市区町村が最後に残って、他のプロセスが待つだけになるのを防ぐ）
+#               c)サイズから予測した処理時間と、実際の処理時間を出力（予測のスループットを調整する目安）
+#               d)タスクごとの計測（MP_Farmland_Metrics）を行い、計測結果を親プロセスへ返す
+#             MP_Farmland_JsonToFeatureClass.py , MP_Farmland_ShapefileToFeatureClass.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import time
+import traceback
+from typing import Tuple,List,Dict
+from MP_Farmland_Metrics import begin_task, end_task, add_count
+
+#処理時間の予測に使うスループット（1秒あたりに変換できる入力のバイト数）
+#実行後に出力される actual の値を見て調整する
+PREDICT_BYTES_PER_SEC = 2 * 1024 * 1024
+
+def folder_size(folder :str, exts :Tuple[str, ...] = (".shp", ".dbf")) -> int:
+    '''
+    フォルダ直下の、指定した拡張子のファイルの合計サイズを返す関数
+    '''
+    total = 0
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in exts:
+                total += entry.stat().st_size
+    return total
+
+def shard_count(size :int, shard_size :int, max_count :int) -> int:
+    '''
+    1ファイルを何個に分割して処理するかを返す関数（shard_size が 0 以下の場合は分割しない）
+    '''
+    if shard_size <= 0 or size <= shard_size:
+        return 1
+    return max(1, min(-(-size // shard_size), max_count))
+
+def schedule_largest_first(tasks :List[Tuple], bytes_per_sec :float = PREDICT_BYTES_PER_SEC) -> List[Tuple]:
+    '''
+    (関数, 引数のタプル, 入力サイズ) のリストを、入力サイズの大きい順に並べて
+    (関数, 引数のタプル, 入力サイズ, 予測した処理時間[秒]) のリストで返す関数
+    '''
+    ordered = sorted(tasks, key=lambda t: t[2], reverse=True)
+    scheduled = [(func, args, size, size / float(bytes_per_sec)) for func, args, size in ordered]
+    total = sum(t[3] for t in scheduled)
+    arcpy.AddMessage(u"  Schedule {0} tasks (largest first): predicted total {1:.1f} sec".format(len(scheduled), total))
+    return scheduled
+
+def run_scheduled_task(task :Tuple) -> Tuple[str, str, bool, Dict]:
+    '''
+    pool.imap_unordered 用のラッパー関数：
+      schedule_largest_first で作成した1件の処理を実行し、(出力したgdb, 処理結果のメッセージ, 成功したか, 計測結果) を返す
+      ※出力したgdb は引数のタプルの2番目
+      例外が発生した場合も他の処理は続けられるように、例外の内容をメッセージにして返す
+      計測結果は MP_Farmland_Metrics.RunReport.collect で取り出す
+    '''
+    func, args, size, predicted = task
+    begin_task(os.path.basename(args[1]))
+    add_count("input_bytes", int(size))
+    start = time.perf_counter()
+    try:
+        message = func(*args)
+        ok = True
+    except Exception:
+        message = u"    Error：{0}\n{1}".format(args[0], traceback.format_exc())
+        ok = False
+    actual = time.perf_counter() - start
+    throughput = size / actual if actual > 0 else 0
+    return args[1], u"{0} (size {1:.1f} MB, predicted {2:.1f} sec / actual {3:.1f} sec, {4:.0f} bytes/sec)".format(
+        message, size / 1024.0 / 1024.0, predicted, actual, throughput), ok, end_task()
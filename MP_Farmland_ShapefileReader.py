@@ -0,0 +1,315 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       MP_Farmland_ShapefileReader.py
+# Purpose:    サンプルスクリプト - 農地筆ポリゴンのシェープファイル（.shp / .shx / .dbf）を直接読み込むリーダー
+#               a).shp / .shx / .dbf をメモリマップして、struct と NumPy でまとめてデコード
+#               b)DBF の文字コードは .cpg ファイル ⇒ LDID（Language driver ID）⇒ 既定値（Shift-JIS）の順に判定
+#                 （ArcGIS Pro のシェープファイルの文字コードの設定に依存しない）
+#               c)ポリゴンは座標をコピーするだけで WKB にして、(WKB のリスト, 属性のリスト) を一定件数ごとに返す
+#             arcpy を使わないので、ArcGIS Pro がない環境でも読込み処理を計測できる
+#             MP_Farmland_ShapefileToFeatureClass.py から利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import mmap
+import struct
+import codecs
+import datetime
+import numpy as np
+from typing import Tuple,List,Dict
+
+#農地筆ポリゴンのシェープファイルは Shift-JIS（.cpg がない場合の既定値）
+DEFAULT_ENCODING = "cp932"
+#DBF ヘッダーの LDID ⇒ 文字コード（日本語の LDID と、よく使われるもの）
+_LDID_ENCODINGS = {
+    0x13: "cp932",   # Japanese Shift-JIS (Windows)
+    0x7B: "cp932",   # Japanese Shift-JIS
+    0x01: "cp437",
+    0x57: "cp1252",
+    0x4D: "gbk",
+    0x4E: "cp949",
+    0x4F: "big5",
+}
+#.cpg に書かれた名前のうち、codecs で直接引けないもの
+_CPG_ALIASES = {
+    "sjis": "cp932",
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "932": "cp932",
+    "ansi 932": "cp932",
+    "65001": "utf-8",
+}
+_SHP_NULL = 0
+_SHP_POLYGON_TYPES = (5, 15, 25) #Polygon / PolygonZ / PolygonM（Z, M は読み飛ばして XY だけ使う）
+_WKB_POLYGON = struct.Struct("<BII")  #byteOrder, wkbType, numRings
+_WKB_COUNT = struct.Struct("<I")
+_SHP_PARTS = struct.Struct("<2i")     #numParts, numPoints
+
+def resolve_dbf_encoding(dbf_path :str, encoding :str = None) -> Tuple[str, str]:
+    '''
+    DBF の文字コードを (文字コード, 判定方法) で返す関数
+      判定方法は "param"（引数で指定）/ "cpg"（.cpg ファイル）/ "ldid"（DBF ヘッダーの LDID）/ "default"
+    '''
+    if encoding:
+        return codecs.lookup(encoding).name, "param"
+    cpg = os.path.splitext(dbf_path)[0] + ".cpg"
+    if os.path.exists(cpg):
+        with open(cpg, "rb") as fp:
+            name = fp.read().decode("ascii", "ignore").strip()
+        name = _CPG_ALIASES.get(name.lower(), name)
+        try:
+            return codecs.lookup(name).name, "cpg"
+        except LookupError:
+            pass
+    with open(dbf_path, "rb") as fp:
+        header = fp.read(32)
+    ldid = header[29] if len(header) > 29 else 0
+    if ldid in _LDID_ENCODINGS:
+        return _LDID_ENCODINGS[ldid], "ldid"
+    return DEFAULT_ENCODING, "default"
+
+def _parse_dbf_date(value :bytes):
+    '''
+    DBF の日付（'D' 型、YYYYMMDD）を datetime に変換する関数（空の値や、日付として正しくない値は None）
+    '''
+    try:
+        return datetime.datetime.strptime(value.decode("ascii"), "%Y%m%d")
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def _parse_dbf_fields(dbf, header_length :int, encoding :str) -> List[Dict]:
+    '''
+    DBF ヘッダーのフィールド記述子を {"name", "type", "length", "decimals"} のリストにする関数
+    '''
+    fields = []
+    pos = 32
+    while pos < header_length - 1 and pos + 32 <= len(dbf) and dbf[pos] != 0x0D:
+        #フィールド名も文字コードを判定した DBF の文字コードでデコードする（日本語のフィールド名があるため）
+        name = bytes(dbf[pos:pos + 11]).split(b"\0")[0].decode(encoding, "replace").strip()
+        fields.append({"name": name, "type": chr(dbf[pos + 11]), "length": dbf[pos + 16], "decimals": dbf[pos + 17]})
+        pos += 32
+    return fields
+
+def read_dbf_fields(shp_path :str, encoding :str = None) -> List[Dict]:
+    '''
+    シェープファイルの DBF のフィールド定義だけを読み込む関数（レコードと .shp は読まない）
+    '''
+    dbf_path = os.path.splitext(shp_path)[0] + ".dbf"
+    encoding = resolve_dbf_encoding(dbf_path, encoding)[0]
+    with open(dbf_path, "rb") as fp:
+        header = fp.read(32)
+        header_length = struct.unpack_from("<H", header, 8)[0] if len(header) >= 32 else 0
+        header += fp.read(max(0, header_length - 32))
+    return _parse_dbf_fields(header, header_length, encoding)
+
+def union_dbf_fields(field_lists :List[List[Dict]]) -> List[Dict]:
+    '''
+    複数のシェープファイルの DBF のフィールド定義を、すべての値が入る1つのフィールド定義にまとめる関数
+    （都道府県・全国で1つのフィーチャクラスにマージする場合に、どの市区町村の値も入るテンプレートを作成するため）
+      - フィールドは最初に現れた順（フィールド名の大文字・小文字は区別しない）
+      - 長さと小数桁は最大。型が異なる場合は、数値どうし（N / F）は N、それ以外は文字列（C）にする
+    '''
+    fields = {}
+    for field_list in field_lists:
+        for field in field_list:
+            merged = fields.get(field["name"].lower())
+            if merged is None:
+                fields[field["name"].lower()] = dict(field)
+                continue
+            if merged["type"] != field["type"]:
+                numeric = merged["type"] in ("N", "F") and field["type"] in ("N", "F")
+                merged["type"] = "N" if numeric else "C"
+            merged["length"] = max(merged["length"], field["length"])
+            merged["decimals"] = max(merged["decimals"], field["decimals"])
+    return list(fields.values())
+
+def dbf_field_descriptions(fields :List[Dict]) -> List[List]:
+    '''
+    DBF のフィールド定義を、arcpy.management.AddFields に渡せる [名前, 型, エイリアス, 長さ] のリストにする関数
+    （数値型は ArcGIS のシェープファイルの読込みと同じく、小数桁なし・9桁以下を LONG、それ以外を DOUBLE）
+    '''
+    out = []
+    for f in fields:
+        if f["type"] == "C":
+            out.append([f["name"], "TEXT", "", max(f["length"], 1)])
+        elif f["type"] in ("N", "F") and f["decimals"] == 0 and f["length"] <= 9:
+            out.append([f["name"], "LONG", "", None])
+        elif f["type"] in ("N", "F"):
+            out.append([f["name"], "DOUBLE", "", None])
+        elif f["type"] == "D":
+            out.append([f["name"], "DATE", "", None])
+        else:
+            out.append([f["name"], "TEXT", "", max(f["length"], 1)])
+    return out
+
+def __signed_area(coords) -> float:
+    #靴ひも公式（シェープファイルの外周は時計回りなので負、穴は反時計回りなので正）
+    x = coords[:, 0]
+    y = coords[:, 1]
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2.0
+
+def polygon_record_to_wkb(buf, offset :int) -> bytes:
+    '''
+    .shp の1レコード（レコードヘッダーの直後 = シェイプタイプの位置）を WKB に変換する関数
+      ・座標（リトルエンディアンの double の XY の並び）は WKB と同じ並びなので、バイト列をそのままコピー
+      ・時計回りのリングごとに新しいポリゴンとして、続く反時計回りのリングをその穴にする
+      ・外周が1つの場合は Polygon、2つ以上の場合は MultiPolygon
+    '''
+    shape_type = struct.unpack_from("<i", buf, offset)[0]
+    if shape_type == _SHP_NULL:
+        return None
+    if shape_type not in _SHP_POLYGON_TYPES:
+        raise ValueError(u"ポリゴン以外のシェイプタイプです：{0}".format(shape_type))
+    num_parts, num_points = _SHP_PARTS.unpack_from(buf, offset + 36)
+    parts_pos = offset + 44
+    points_pos = parts_pos + 4 * num_parts
+    parts = list(struct.unpack_from("<%di" % num_parts, buf, parts_pos)) + [num_points]
+    polygons = []
+    for i in range(num_parts):
+        start, end = parts[i], parts[i + 1]
+        if end - start < 4:
+            continue #リングにならない
+        ring = _WKB_COUNT.pack(end - start) + bytes(buf[points_pos + 16 * start:points_pos + 16 * end])
+        if polygons and num_parts > 1:
+            coords = np.frombuffer(buf, dtype="<f8", count=2 * (end - start), offset=points_pos + 16 * start).reshape(-1, 2)
+            if __signed_area(coords) > 0:
+                polygons[-1].append(ring) #反時計回り：直前の外周の穴
+                continue
+        polygons.append([ring])
+    if not polygons:
+        return None
+    if len(polygons) == 1:
+        return _WKB_POLYGON.pack(1, 3, len(polygons[0])) + b"".join(polygons[0])
+    return _WKB_POLYGON.pack(1, 6, len(polygons)) + b"".join(
+        _WKB_POLYGON.pack(1, 3, len(rings)) + b"".join(rings) for rings in polygons)
+
+class FarmlandShapefileReader():
+    '''
+    ポリゴンのシェープファイルを直接読み込むクラス
+    使い方）
+        with FarmlandShapefileReader(shp) as reader:
+            for wkbs, rows in reader.iter_batches(10000):
+                ･････
+    '''
+    def __init__(self, shp_path :str, encoding :str = None):
+        self.__files = []
+        base = os.path.splitext(shp_path)[0]
+        self.shp_path = base + ".shp"
+        self.shx_path = base + ".shx"
+        self.dbf_path = base + ".dbf"
+        self.prj_path = base + ".prj" if os.path.exists(base + ".prj") else None
+        self.encoding, self.encoding_method = resolve_dbf_encoding(self.dbf_path, encoding)
+        self.__shp = self.__map(self.shp_path)
+        self.__dbf = self.__map(self.dbf_path)
+        self.__read_dbf_header()
+        self.__offsets = self.__record_offsets()
+        return
+    def __del__(self):
+        self.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    #private
+    def __map(self, path):
+        fp = open(path, "rb")
+        self.__files.append(fp)
+        if os.path.getsize(path) == 0:
+            return b""
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__files.append(mm)
+        return mm
+
+    def __read_dbf_header(self):
+        dbf = self.__dbf
+        self.record_count, self.__header_length, self.__record_length = struct.unpack_from("<IHH", dbf, 4)
+        self.fields = _parse_dbf_fields(dbf, self.__header_length, self.encoding)
+        names, formats, offsets = ["_deleted"], ["S1"], [0]
+        field_offset = 1
+        for field in self.fields:
+            names.append(field["name"])
+            formats.append("S{0}".format(field["length"]))
+            offsets.append(field_offset)
+            field_offset += field["length"]
+        #1レコードを各フィールドのバイト列に分ける構造化 dtype（NumPy でまとめて切り出す）
+        self.__dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": self.__record_length})
+
+    def __record_offsets(self):
+        #.shx がある場合は、レコードの位置（16bit ワード単位、ビッグエンディアン）をまとめて読み込む
+        if os.path.exists(self.shx_path) and os.path.getsize(self.shx_path) > 100:
+            with open(self.shx_path, "rb") as fp:
+                index = np.frombuffer(fp.read()[100:], dtype=">i4").reshape(-1, 2)
+            return (index[:, 0].astype(np.int64) * 2 + 8).tolist()
+        #.shx がない場合は、.shp のレコードヘッダーを順にたどる
+        offsets = []
+        pos, size = 100, len(self.__shp)
+        while pos + 8 <= size:
+            content_length = struct.unpack_from(">i", self.__shp, pos + 4)[0] * 2
+            offsets.append(pos + 8)
+            pos += 8 + content_length
+        return offsets
+
+    def __decode_column(self, field :Dict, raw):
+        ftype = field["type"]
+        if ftype == "C":
+            encoding = self.encoding
+            return [v.decode(encoding, "replace").strip() for v in raw.tolist()]
+        stripped = np.char.strip(raw)
+        empty = (stripped == b"") | (np.char.strip(stripped, b"*") == b"")
+        if ftype in ("N", "F"):
+            filled = np.where(empty, b"0", stripped)
+            values = None
+            if ftype == "N" and field["decimals"] == 0 and field["length"] < 19:
+                try:
+                    values = filled.astype(np.int64).tolist()
+                except ValueError:
+                    pass #小数桁なしの定義でも、小数点が入っている場合
+            if values is None:
+                values = filled.astype(np.float64).tolist()
+        elif ftype == "D":
+            values = [_parse_dbf_date(v) if v.strip() else None for v in stripped.tolist()]
+        elif ftype == "L":
+            values = [None if v in (b"?", b"") else v in (b"T", b"t", b"Y", b"y") for v in stripped.tolist()]
+        else:
+            values = [v.decode(self.encoding, "replace") for v in stripped.tolist()]
+        return [None if e else v for v, e in zip(values, empty.tolist())]
+
+    #public
+    def field_descriptions(self) -> List[List]:
+        '''
+        DBF のフィールド定義を、arcpy.management.AddFields に渡せる [名前, 型, エイリアス, 長さ] のリストで返す
+        （dbf_field_descriptions を参照）
+        '''
+        return dbf_field_descriptions(self.fields)
+
+    def iter_batches(self, batch_size :int = 10000):
+        '''
+        (WKB のリスト, 属性のタプルのリスト) を batch_size 件ずつ返すジェネレーター
+        DBF で削除フラグ（'*'）が付いたレコードは読み飛ばす
+        '''
+        count = min(self.record_count, len(self.__offsets))
+        records = np.frombuffer(self.__dbf, dtype=self.__dtype, count=count, offset=self.__header_length)
+        for start in range(0, count, batch_size):
+            chunk = records[start:start + batch_size]
+            columns = [self.__decode_column(f, chunk[f["name"]]) for f in self.fields]
+            keep = (chunk["_deleted"] != b"*").tolist()
+            wkbs = []
+            rows = []
+            for i, row in enumerate(zip(*columns) if columns else ((),) * len(chunk)):
+                if not keep[i]:
+                    continue
+                wkbs.append(polygon_record_to_wkb(self.__shp, self.__offsets[start + i]))
+                rows.append(row)
+            yield wkbs, rows
+
+    def close(self):
+        for f in reversed(self.__files):
+            try:
+                f.close()
+            except (BufferError, ValueError):
+                pass #NumPy の配列がまだメモリマップを参照している場合は、ガベージコレクションに任せる
+        self.__files = []
@@ -17,7 +17,17 @@ import sys
 import multiprocessing
 import datetime
 import traceback
+import itertools
 from typing import Tuple,List,Dict
+from MP_Farmland_Merge import merge_as_completed
+from MP_Farmland_Schedule import schedule_largest_first, run_scheduled_task, folder_size
+from MP_Farmland_Manifest import FarmlandManifest, prepare_incremental, manifest_recorder
+from MP_Farmland_ShapefileReader import FarmlandShapefileReader, read_dbf_fields, union_dbf_fields, dbf_field_descriptions
+from MP_Farmland_Metrics import RunReport, stage, add_count
+from MP_Farmland_Precision import GeometryReducer, parse_precision_args
+
+#座標の丸めと頂点の削減（MP_Farmland_Precision）をまとめて行う件数
+_PRECISION_BATCH_SIZE = 10000
 
 # 
 # 補助関数の定義
@@ -30,15 +40,99 @@ def __split_citycode_cityname(wsname :str) -> Tuple[str, str]:
         02202弘前市2019
     '''
     l = len(wsname)
-    citycode = "'{0}'".format(wsname[:5])    #自治体コードだけを抽出
-    cityname = '"' + "{0}".format(wsname[5:l-4]) + '"' #自治体名だけを抽出
+    citycode = u"{0}".format(wsname[:5])    #自治体コードだけを抽出
+    cityname = u"{0}".format(wsname[5:l-4]) #自治体名だけを抽出
     return citycode, cityname
 
+def __report_precision(reducer :GeometryReducer):
+    '''
+    シェープファイルごとの頂点数と WKB のバイト数の削減量を、メッセージと実行レポートのカウンターに出力する関数
+    '''
+    arcpy.AddMessage(reducer.summary())
+    add_count("vertices_in", reducer.vertices_in)
+    add_count("vertices_out", reducer.vertices_out)
+    add_count("wkb_bytes_in", reducer.bytes_in)
+    add_count("wkb_bytes_out", reducer.bytes_out)
+
+def __copy_features(infc :str, outfc :str, values :List[str], precision :Dict = None) -> int:
+    '''
+    シェープファイルのレコードを SearchCursor で読み込み、InsertCursor でフィーチャクラスに書き込む関数
+    （読込み・書込みは1フィーチャにつき1回。values は各レコードの末尾に追加する CITYCODE, CITYNAME の値）
+    precision を指定した場合は、_PRECISION_BATCH_SIZE 件ごとに WKB の座標の丸めと頂点の削減を行ってから書き込む
+    '''
+    out_names = [f.name.lower() for f in arcpy.ListFields(outfc)]
+    in_fields = [f.name for f in arcpy.ListFields(infc) if f.type not in ["OID", "Geometry"]
+                     and f.name.lower() not in ["shape_area", "shape_length"] and f.name.lower() in out_names]
+    count = 0
+    values = tuple(values)
+    reducer = GeometryReducer(**precision) if precision else None
+    with arcpy.da.SearchCursor(infc, ["SHAPE@WKB"] + in_fields) as scursor, \
+         arcpy.da.InsertCursor(outfc, ["SHAPE@WKB"] + in_fields + ["CITYCODE", "CITYNAME"]) as icursor:
+        if reducer is None:
+            with stage("copy_features"):
+                for row in scursor:
+                    icursor.insertRow(row + values)
+                    count += 1
+        else:
+            while True:
+                with stage("copy_features"):
+                    batch = list(itertools.islice(scursor, _PRECISION_BATCH_SIZE))
+                if not batch:
+                    break
+                with stage("precision"):
+                    wkbs = reducer.reduce([row[0] for row in batch])
+                with stage("copy_features"):
+                    for wkb, row in zip(wkbs, batch):
+                        icursor.insertRow((wkb,) + tuple(row[1:]) + values)
+                count += len(batch)
+    add_count("rows", count)
+    if reducer:
+        __report_precision(reducer)
+    return count
+
+def __copy_features_native(shp :str, outws :str, newfc :str, values :List[str], batch_size :int = 10000, precision :Dict = None) -> int:
+    '''
+    シェープファイルを FarmlandShapefileReader で直接読み込み、InsertCursor（SHAPE@WKB）でフィーチャクラスに書き込む関数
+    （GeoJSON の変換と同じく WKB で書き込む。DBF の文字コードは .cpg / LDID から判定し、ArcGIS Pro の設定に依存しない）
+    precision を指定した場合は、読み込んだバッチごとに WKB の座標の丸めと頂点の削減を行ってから書き込む
+    '''
+    outfc = os.path.join(outws, newfc)
+    count = 0
+    reducer = GeometryReducer(**precision) if precision else None
+    with FarmlandShapefileReader(shp) as reader:
+        arcpy.AddMessage(u"    文字コード：{0}（判定方法：{1}）".format(reader.encoding, reader.encoding_method))
+        if not arcpy.Exists(outfc):
+            #DBF のフィールド定義から、空のフィーチャクラスを作成（座標系は .prj から）
+            sr = arcpy.SpatialReference(reader.prj_path) if reader.prj_path else None
+            arcpy.management.CreateFeatureclass(outws, newfc, "POLYGON", spatial_reference=sr)
+            arcpy.management.AddFields(outfc, reader.field_descriptions() + [["CITYCODE", "TEXT", "", 5], ["CITYNAME", "TEXT", "", 30]])
+        fields = [f["name"] for f in reader.fields]
+        values = tuple(values)
+        with arcpy.da.InsertCursor(outfc, ["SHAPE@WKB"] + fields + ["CITYCODE", "CITYNAME"]) as icursor:
+            batches = reader.iter_batches(batch_size)
+            while True:
+                with stage("read_shapefile"):
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                wkbs, rows = batch
+                if reducer:
+                    with stage("precision"):
+                        wkbs = reducer.reduce(wkbs)
+                with stage("write"):
+                    for wkb, row in zip(wkbs, rows):
+                        icursor.insertRow((wkb,) + row + values)
+                count += len(wkbs)
+    add_count("rows", count)
+    if reducer:
+        __report_precision(reducer)
+    return count
+
 # 
 # マルチプロセスでの処理関連
 # - Python3.3 で追加された pool.starmap は複数の引数に対応しているため、ラッパー関数（ multi_run_batch_convert ）は廃止
 # 
-def batch_convert(inws :str, outws :str) -> str:
+def batch_convert(inws :str, outws :str, native :bool = False, precision :Dict = None) -> str:
     '''
     1プロセスで実行する処理:
       1) FGDBへの書込みは仕様で複数プロセスで書込みできないため
@@ -46,102 +140,163 @@ def batch_convert(inws :str, outws :str) -> str:
            1市区町村のFGDB下のフィーチャクラスに変換
       2) 都道府県単位でフィーチャクラスを統合したとき識別しやすいように
            フォルダ名から市区町村コードと、自治体名を作成しフィールドに値を格納
+    
+    native : True の場合は、arcpy のシェープファイルの読込みを使わずに FarmlandShapefileReader で直接読み込む
+    precision : 座標の丸めと頂点の削減の設定（MP_Farmland_Precision.precision_options。None の場合は行わない）
     '''
     #シェープファイルをインポートする市区町村FGDBの作成
-    if not arcpy.Exists(outws):
-        outfolder = u"{0}".format(os.path.dirname(outws))
-        foldername= u"{0}".format(os.path.basename(outws))
-        arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+    with stage("create_gdb"):
+        if not arcpy.Exists(outws):
+            outfolder = u"{0}".format(os.path.dirname(outws))
+            foldername= u"{0}".format(os.path.basename(outws))
+            arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
     arcpy.env.workspace = inws
     #自治体コートと自治体名を入れるフィールドを追加で定義
     fieldname1 = "CITYCODE"
     fieldname2 = "CITYNAME"
+    wsname = os.path.basename(inws)
+    citycode, cityname = __split_citycode_cityname(wsname) #フォルダ名から自治体コードと自治体名を抽出
     fcs = arcpy.ListFeatureClasses()
     for fc in fcs:
         infc = os.path.splitext(fc)[0]
         newfc = u"c_{0}".format(infc) #シェープファイル名が数値ではじまり、FGDBへそのまま変換できないので接頭にc_を入れる
-        wsname = os.path.basename(inws)
-        citycode, cityname = __split_citycode_cityname(wsname) #フォルダ名から自治体コードと自治体名を抽出
-        #座標系はそのままでフィーチャクラスに変換
-        if arcpy.Exists(os.path.join(outws, newfc)):
-            outfc = os.path.join(outws, newfc)
-            arcpy.management.Append(fc, outfc)
-        else:
-            arcpy.conversion.FeatureClassToFeatureClass(fc, outws, newfc)
-            outfc = os.path.join(outws, newfc)
-            arcpy.management.AddField(outfc, fieldname1, "TEXT", field_length=5)
-            arcpy.management.AddField(outfc, fieldname2, "TEXT", field_length=30)
-        # フィールド演算でcitycode, cityname に値をいれる
-        calfc = os.path.join(outws, newfc) 
-        arcpy.management.CalculateField(calfc, fieldname1, citycode, "PYTHON3", "#")
-        arcpy.management.CalculateField(calfc, fieldname2, cityname, "PYTHON3", "#")
+        outfc = os.path.join(outws, newfc)
+        if native:
+            __copy_features_native(os.path.join(inws, fc), outws, newfc, [citycode, cityname], precision=precision)
+            continue
+        if not arcpy.Exists(outfc):
+            #シェープファイルをテンプレートに、座標系はそのままで空のフィーチャクラスを作成し、自治体コードと自治体名のフィールドを追加
+            with stage("create_fields"):
+                arcpy.management.CreateFeatureclass(outws, newfc, template=os.path.join(inws, fc), spatial_reference=os.path.join(inws, fc))
+                arcpy.management.AddFields(outfc, [[fieldname1, "TEXT", "", 5], [fieldname2, "TEXT", "", 30]])
+        #シェープファイルを1回読み込むだけで、自治体コードと自治体名を入れながら書き込む
+        #（FeatureClassToFeatureClass / Append の後に CalculateField で全レコードを書き直さない）
+        __copy_features(os.path.join(inws, fc), outfc, [citycode, cityname], precision)
     
     del fcs
     return u"  Converted：{0}".format(outws)
 
-def exec_batch_convert(infolder :str, outfolder :str, cpu_cnt :int):
+def create_template_featureclass(ws :str, fcname :str, inwss :List[str]) -> str:
+    '''
+    市区町村フォルダのすべてのシェープファイルの DBF のフィールド定義をまとめて（union_dbf_fields。長さは最大）、
+    統合先のフィーチャクラスを作成する関数。作成したフィーチャクラスを返す（シェープファイルがない場合は None）
+      最初に変換が終わった市区町村をテンプレートにすると、終わる順でフィールドの長さが変わり、
+      他の市区町村の長い値が書き込めない場合があるため。座標系はフォルダ名の順で最初のシェープファイルのもの
+    '''
+    shps = sorted(os.path.join(inws, name) for inws in inwss for name in os.listdir(inws) if name.lower().endswith(".shp"))
+    if not shps:
+        return None
+    fields = union_dbf_fields([read_dbf_fields(shp) for shp in shps])
+    arcpy.management.CreateFeatureclass(ws, fcname, "POLYGON", spatial_reference=shps[0])
+    arcpy.management.AddFields(os.path.join(ws, fcname), dbf_field_descriptions(fields) + [["CITYCODE", "TEXT", "", 5], ["CITYNAME", "TEXT", "", 30]])
+    return os.path.join(ws, fcname)
+
+def build_convert_tasks(inwss :List[str], outfolder :str, native :bool = False, precision :Dict = None) -> Tuple[List[Tuple], Dict[str, str]]:
+    '''
+    各プロセスに渡すパラメータをリスト化する関数：
+      (batch_convert, 引数のタプル, 入力サイズ) のリストと、出力する gdb ⇒ 市区町村フォルダ の dict を返す
+      （exec_batch_convert と MP_Farmland_NationalBatch.py から利用）
+    '''
+    tasks=[]
+    gdb_inputs = {} #出力する gdb ⇒ 市区町村フォルダ（マージ後にマニフェストへ記録するため）
+    for inws in inwss:
+        param1 = inws # 市区町村フォルダ（シェープファイルが入っている）
+        gdbname = u"{0}.gdb".format(os.path.basename(inws))
+        param2 = os.path.join(outfolder, gdbname) # 出力する市区町村ファイルジオデータベース
+        tasks.append((batch_convert, (param1, param2, native, precision), folder_size(inws))) # .shp + .dbf の合計サイズ
+        gdb_inputs[param2] = param1
+    return tasks, gdb_inputs
+
+def exec_batch_convert(infolder :str, outfolder :str, cpu_cnt :int, native :bool = False, precision :Dict = None,
+                       spatial_sort :bool = True, query_check :bool = False):
     '''
     マルチプロセスでの処理：
+      native : True の場合は、シェープファイルを FarmlandShapefileReader で直接読み込む（DBF の文字コードを .cpg / LDID から判定）
+      precision : 座標の丸めと頂点の削減の設定（MP_Farmland_Precision.precision_options。None の場合は行わない）
+                  シェープファイルごとの頂点数と WKB のバイト数の削減量をメッセージと実行レポートに出力する
+      spatial_sort : True の場合は、市区町村ごとに重心（SHAPE@XY）のヒルベルト曲線上の順に並べ替えてマージする
+      query_check  : True の場合は、インデックスの作成前と作成後に同じ空間検索・属性検索を実行して処理時間を出力する
+      ※outfolder に farmland_manifest.json と都道府県のFGDB がある場合は、新しい市区町村と内容が変わった市区町村だけを変換する
+      ※段階ごとの処理時間・件数・メモリ使用量を、outfolder の farmland_run_report.json / .csv に出力する
     '''
+    report = None
     try:
         start = datetime.datetime.now()
         arcpy.AddMessage(u"-- Strat: MP_Farmland_ShapefileToFeatureClass --:{0}".format(start))
+        report = RunReport("MP_Farmland_ShapefileToFeatureClass")
         
-        #a) 各プロセス用の pythonw.exe を設定
-        python_path = sys.exec_prefix
-        multiprocessing.set_executable(os.path.join(python_path, 'pythonw.exe'))
-        #multiprocessing.set_executable(os.path.join(python_path, 'python.exe')) #CMDプロンプトの画面が起動するので'pythonw.exe'を使う
+        #a) 各プロセス用の pythonw.exe を設定（Windows のみ。Linux などでベンチマークを実行する場合は現在の Python のまま）
+        if os.name == "nt":
+            python_path = sys.exec_prefix
+            multiprocessing.set_executable(os.path.join(python_path, 'pythonw.exe'))
+            #multiprocessing.set_executable(os.path.join(python_path, 'python.exe')) #CMDプロンプトの画面が起動するので'pythonw.exe'を使う
         
-        #b) 各プロセスに渡すパラメータをリスト化
-        arcpy.AddMessage(u"  Convert each Shapefiles : multiprocessing")
+        #b) 変換済みの記録（マニフェスト）と比べて、変換する市区町村フォルダを決める
+        foldername = "{0}.gdb".format(os.path.basename(outfolder))
+        fcname = "Farmland" #マージ後のフィーチャクラス名
+        prefws = os.path.join(outfolder, foldername)
+        outfc = os.path.join(prefws, fcname)
         arcpy.env.workspace = infolder
         inwss = arcpy.ListWorkspaces("*", "Folder")
-        params=[]
-        for inws in inwss:
-            param1 = inws # 市区町村フォルダ（シェープファイルが入っている）
-            gdbname = u"{0}.gdb".format(os.path.basename(inws))
-            param2 = os.path.join(outfolder, gdbname) # 出力する市区町村ファイルジオデータベース
-            params.append((param1, param2))
+        manifest = FarmlandManifest(outfolder)
+        incremental = manifest.exists() and arcpy.Exists(prefws)
+        if incremental:
+            #Farmland は最初の市区町村のマージ時に作成するので、まだない場合は削除するレコードもない
+            inwss = prepare_incremental(manifest, inwss, outfc, "CITYCODE") if arcpy.Exists(outfc) else manifest.classify(inwss)[0]
+        
+        #各プロセスに渡すパラメータをリスト化
+        arcpy.AddMessage(u"  Convert each Shapefiles : multiprocessing")
+        tasks, gdb_inputs = build_convert_tasks(inwss, outfolder, native, precision)
+        #サイズの大きい順に処理する
+        params = schedule_largest_first(tasks)
         if len(inwss) < cpu_cnt: # 処理フォルダ数CPUコアより少ない場合無駄なプロセスを起動不要
             cpu_cnt = len(inwss)
-        pool = multiprocessing.Pool(cpu_cnt) # cpu_cnt 数分のプロセスを作成
-        results = pool.starmap(batch_convert, params) # 割り当てプロセスで順次実行される（Python3.3で追加されたstarmapは複数の引数に対応）
-        pool.close()
-        pool.join()
-        
-        # 各プロセスでの処理結果を出力
-        for r in results:
-            arcpy.AddMessage(u"{0}".format(r))
         
-        #c) 各プロセスで変換された市区町村のフィーチャクラスを都道府県のFGDBへマージしたものを作成（"Farmland"）
-        arcpy.env.workspace = outfolder
-        outwss = arcpy.ListWorkspaces("*","FileGDB")
-        foldername = "{0}.gdb".format(os.path.basename(outfolder))
-        fcname = "Farmland" #マージ後のフィーチャクラス名
-        arcpy.AddMessage(u"  Mearge to FeatureClass:{1} in FGDB:{0} ".format(foldername, fcname))
-        arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
-        prefws = os.path.join(outfolder, foldername)
-        for outws in outwss:
-            arcpy.env.workspace = outws
-            fc = arcpy.ListFeatureClasses()[0] #農地筆は1ファイルしかないので固定
-            arcpy.AddMessage(u"    merge: {0} ⇒ {1}".format(fc, fcname))
-            if arcpy.Exists(os.path.join(prefws, fcname)):
-                outfc = os.path.join(prefws, fcname)
-                arcpy.management.Append(fc, outfc)
-            else:
-                arcpy.conversion.FeatureClassToFeatureClass(fc, prefws, fcname)
+        #c) 変換が終わった市区町村から順に、都道府県のFGDBのフィーチャクラス（"Farmland"）へ書き込んで市区町村のFGDBを削除
+        #   （変換とマージを並行して実行。マージ先への書き込みは親プロセスだけが1つの InsertCursor で行い、インデックスは最後に作成）
+        #   マージした市区町村は、マージ先への書込みを確定した後にマニフェストに記録する（途中で止まっても、次回はその続きから変換）
+        arcpy.AddMessage(u"  Convert and merge to FeatureClass:{1} in FGDB:{0} ".format(foldername, fcname))
+        if not incremental:
+            arcpy.management.CreateFileGDB(outfolder, foldername, "CURRENT")
+            manifest.save()
+        def create_out_fc(fc):
+            #変換する全市区町村の DBF のフィールド定義をまとめて（長さは最大）、空のフィーチャクラスを作成
+            #（最初に変換が終わった市区町村をテンプレートにすると、終わる順でフィールドの長さが変わるため）
+            create_template_featureclass(prefws, fcname, inwss)
+        conv_start = datetime.datetime.now()
+        row_count, merge_elapsed, pending_deletes = 0, datetime.timedelta(0), []
+        if params:
+            on_merged = manifest_recorder(manifest, gdb_inputs)
+            pool = multiprocessing.Pool(cpu_cnt) # cpu_cnt 数分のプロセスを作成
+            results = pool.imap_unordered(run_scheduled_task, params, chunksize=1) # 大きい順に1件ずつ割り当て、変換が終わったものから順に結果を受け取る
+            results = report.collect(results) #ワーカーの計測結果を集める
+            row_count, merge_elapsed, pending_deletes = merge_as_completed(results, outfc, ["CITYCODE"], create_out_fc,
+                                                                           key_field="CITYCODE", on_merged=on_merged,
+                                                                           spatial_sort=spatial_sort, query_check=query_check)
+            pool.close()
+            pool.join()
+        conv_elapsed = datetime.datetime.now() - conv_start
         
-        #d) マージが終わったので後片付け 各市区町村のFGDBを削除
-        arcpy.AddMessage(u"  Delete temp FileGDBs")
-        for outws in outwss:
-            arcpy.AddMessage(u"    Delete FGDB:{0}".format(outws))
-            arcpy.management.Delete(outws)
+        #d) 後片付け 削除できなかった市区町村のFGDBを削除
+        with stage("delete"):
+            for outws in pending_deletes:
+                arcpy.AddMessage(u"    Delete FGDB:{0}".format(outws))
+                arcpy.management.Delete(outws)
         
+        arcpy.AddMessage(u"  Convert and merge time:{0}".format(conv_elapsed))
+        arcpy.AddMessage(u"  Merge time (writer)   :{0} ({1} rows)".format(merge_elapsed, row_count))
+        #e) 段階ごとの集計表と実行レポート
+        report.summarize()
+        report.write(outfolder)
         fin = datetime.datetime.now()
         arcpy.AddMessage(u"-- Finish: MP_Farmland_ShapefileToFeatureClass --:{0}".format(fin))
         arcpy.AddMessage(u"     Elapsed time:{0}".format(fin-start))
     except:
-        arcpy.AddError(u"Exception:{0}".format(sys.exc_info()[2]))
+        arcpy.AddError(u"Exception:{0}".format(traceback.format_exc()))
+    finally:
+        #失敗した場合も親プロセスの計測を終了する（ArcGIS Pro のプロセスで、次に実行するツールに計測が残らないように）
+        if report is not None:
+            report.close()
 
 if __name__ == '__main__':
     '''
@@ -172,12 +327,21 @@ if __name__ == '__main__':
             |   Farmland # フィーチャクラス名
       
       cpu_cnt: マルチプロセスでの処理時に起動するプロセス数
+      native : （省略可）native を指定すると、シェープファイルを arcpy を使わずに直接読み込む
+                 （DBF の文字コードは .cpg / LDID から判定するので、*.cpg ファイルの配置は不要）
+               grid=<間隔> / tolerance=<許容距離> を指定すると、座標の丸めと頂点の削減を行う
+               querycheck を指定すると、インデックスの作成前と作成後のクエリ速度を出力する
+               unsorted を指定すると、マージで空間的な並べ替えを行わない（クエリ速度の比較用）
+      例）python.exe MP_Farmland_ShapefileToFeatureClass.py 02青森県2019 02青森県2019_filegdb 4 native grid=1e-7
     '''
     args = sys.argv
-    if len(args) == 4:
+    if len(args) >= 4:
         infolder = args[1]
         outfolder = args[2]
         cpu_cnt = int(args[3])
-        exec_batch_convert(infolder, outfolder, cpu_cnt)
+        options = [a.lower() for a in args[4:]]
+        native = "native" in options
+        exec_batch_convert(infolder, outfolder, cpu_cnt, native, parse_precision_args(options),
+                           spatial_sort="unsorted" not in options, query_check="querycheck" in options)
     else:
         print("Arguments error")
@@ -0,0 +1,257 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy（ベンチマーク用の簡易スタンドイン）
+# Purpose:    ArcGIS Pro がない環境（Linux など）で変換処理を動かして計測するための arcpy の代用品
+#               - 変換スクリプトが利用する関数だけを実装
+#               - ファイル ジオデータベースは「*.gdb フォルダー + フィーチャクラスごとの pickle ファイル」で代用
+#               - 呼び出された関数は環境変数 ARCPY_STANDIN_LOG のファイルへ JSON Lines で記録
+#               - 環境変数 ARCPY_STANDIN_QUIET を設定すると AddMessage を出力しない
+#             benchmarks/bench_pipeline.py が PYTHONPATH に追加して利用（本物の arcpy がある環境では使わない）
+#             ※本物の arcpy の挙動をすべて再現するものではありません
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import pickle
+import fnmatch
+import shutil
+import struct
+
+class ExecuteError(Exception):
+    pass
+
+class _Env(object):
+    def __init__(self):
+        self.workspace = None
+        self.overwriteOutput = False
+
+env = _Env()
+
+#
+# 呼び出しの記録
+#
+_call_log = []
+
+def _record(name, *args):
+    entry = {"t": time.time(), "pid": os.getpid(), "call": name,
+             "args": [a if isinstance(a, (str, int, float, type(None))) else repr(a) for a in args]}
+    _call_log.append(entry)
+    logfile = os.environ.get("ARCPY_STANDIN_LOG")
+    if logfile:
+        with open(logfile, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def GetCallLog():
+    return list(_call_log)
+
+#
+# メッセージ
+#
+def AddMessage(msg):
+    if not os.environ.get("ARCPY_STANDIN_QUIET"):
+        print(msg)
+
+def AddWarning(msg):
+    print(u"WARNING: {0}".format(msg))
+
+def AddError(msg):
+    print(u"ERROR: {0}".format(msg), file=sys.stderr)
+
+def GetMessages(severity=0):
+    return ""
+
+#
+# 空間参照とジオメトリ
+#
+class SpatialReference(object):
+    def __init__(self, code=4326):
+        self.factoryCode = int(code) if code else 0
+        self.name = u"EPSG:{0}".format(self.factoryCode)
+
+class Geometry(object):
+    def __init__(self, wkb):
+        self.WKB = bytes(wkb)
+
+    @property
+    def pointCount(self):
+        return _wkb_point_count(self.WKB)
+
+    @property
+    def extent(self):
+        bounds = _wkb_extent(self.WKB)
+        return Extent(*bounds) if bounds else Extent()
+
+class Extent(object):
+    def __init__(self, XMin=None, YMin=None, XMax=None, YMax=None, *args, **kwargs):
+        self.XMin, self.YMin, self.XMax, self.YMax = XMin, YMin, XMax, YMax
+
+    @property
+    def polygon(self):
+        g = Geometry(_rings_to_wkb([[(self.XMin, self.YMin), (self.XMin, self.YMax), (self.XMax, self.YMax),
+                                     (self.XMax, self.YMin), (self.XMin, self.YMin)]]))
+        return g
+
+def _wkb_extent(wkb):
+    #WKB の全頂点の範囲（xmin, ymin, xmax, ymax）
+    gtype = struct.unpack_from("<I", wkb, 1)[0]
+    parts = [9] if gtype == 3 else []
+    if gtype == 6:
+        pos = 9
+        for _ in range(struct.unpack_from("<I", wkb, 5)[0]):
+            parts.append(pos + 9)
+            nrings = struct.unpack_from("<I", wkb, pos + 5)[0]
+            pos += 9
+            for _ in range(nrings):
+                pos += 4 + struct.unpack_from("<I", wkb, pos)[0] * 16
+    xs, ys = [], []
+    for pos in parts:
+        nrings = struct.unpack_from("<I", wkb, pos - 4)[0]
+        for _ in range(nrings):
+            n = struct.unpack_from("<I", wkb, pos)[0]
+            coords = struct.unpack_from("<%dd" % (n * 2), wkb, pos + 4)
+            xs.extend(coords[0::2])
+            ys.extend(coords[1::2])
+            pos += 4 + n * 16
+    return (min(xs), min(ys), max(xs), max(ys)) if xs else None
+
+def _wkb_point_count(wkb):
+    gtype = struct.unpack_from("<I", wkb, 1)[0]
+    if gtype == 3:
+        nrings = struct.unpack_from("<I", wkb, 5)[0]
+        pos, cnt = 9, 0
+        for _ in range(nrings):
+            n = struct.unpack_from("<I", wkb, pos)[0]
+            cnt += n
+            pos += 4 + n * 16
+        return cnt
+    if gtype == 6:
+        nparts = struct.unpack_from("<I", wkb, 5)[0]
+        pos, cnt = 9, 0
+        for _ in range(nparts):
+            nrings = struct.unpack_from("<I", wkb, pos + 5)[0]
+            pos += 9
+            for _ in range(nrings):
+                n = struct.unpack_from("<I", wkb, pos)[0]
+                cnt += n
+                pos += 4 + n * 16
+        return cnt
+    return 0
+
+def _rings_to_wkb(rings):
+    out = [struct.pack("<BII", 1, 3, len(rings))]
+    for ring in rings:
+        out.append(struct.pack("<I", len(ring)))
+        out.append(struct.pack("<%dd" % (len(ring) * 2), *[c for pt in ring for c in pt[:2]]))
+    return b"".join(out)
+
+def AsShape(geojson, esri_json=False):
+    _record("AsShape")
+    gtype = geojson["type"]
+    coords = geojson["coordinates"]
+    if gtype == "Polygon":
+        return Geometry(_rings_to_wkb(coords))
+    if gtype == "MultiPolygon":
+        parts = [_rings_to_wkb(p) for p in coords]
+        return Geometry(struct.pack("<BII", 1, 6, len(parts)) + b"".join(parts))
+    raise ValueError(u"unsupported geometry type: {0}".format(gtype))
+
+def FromWKB(wkb, spatial_reference=None):
+    return Geometry(wkb)
+
+#
+# ワークスペースとデータの一覧
+#
+def ValidateFieldName(name, workspace=None):
+    out = "".join(c if (c.isalnum() or c == "_") else "_" for c in name)
+    if out[:1].isdigit():
+        out = "_" + out
+    return out
+
+def _fc_file(path):
+    return path + ".fc"
+
+def _is_gdb(path):
+    return path.lower().endswith(".gdb") and os.path.isdir(path)
+
+def _resolve(path):
+    if os.path.isabs(path) or env.workspace is None:
+        return path
+    return os.path.join(env.workspace, path)
+
+def Exists(path):
+    path = _resolve(path)
+    return os.path.exists(path) or os.path.exists(_fc_file(path))
+
+def ListFiles(wild_card="*"):
+    ws = env.workspace
+    return sorted(f for f in os.listdir(ws) if fnmatch.fnmatch(f, wild_card) and os.path.isfile(os.path.join(ws, f)))
+
+def ListWorkspaces(wild_card="*", workspace_type="All"):
+    ws = env.workspace
+    out = []
+    for name in sorted(os.listdir(ws)):
+        full = os.path.join(ws, name)
+        if not os.path.isdir(full) or not fnmatch.fnmatch(name, wild_card):
+            continue
+        is_gdb = name.lower().endswith(".gdb")
+        if workspace_type == "FileGDB" and not is_gdb:
+            continue
+        if workspace_type == "Folder" and is_gdb:
+            continue
+        out.append(full)
+    return out
+
+def ListFeatureClasses(wild_card="*"):
+    ws = env.workspace
+    if _is_gdb(ws):
+        names = [f[:-3] for f in os.listdir(ws) if f.endswith(".fc")]
+    else:
+        names = [f for f in os.listdir(ws) if f.lower().endswith(".shp")]
+    return sorted(n for n in names if fnmatch.fnmatch(n, wild_card))
+
+class Field(object):
+    _TYPE_NAMES = {"TEXT": "String", "LONG": "Integer", "SHORT": "SmallInteger", "DOUBLE": "Double",
+                   "FLOAT": "Single", "DATE": "Date", "BIGINTEGER": "BigInteger", "OID": "OID", "GEOMETRY": "Geometry"}
+
+    def __init__(self, d):
+        self.name = d["name"]
+        self.type = self._TYPE_NAMES.get(d["type"], d["type"])
+        self.length = d.get("length") or 0
+        self.aliasName = d.get("alias") or d["name"]
+        self.domain = d.get("domain") or ""
+
+def ListFields(dataset, wild_card="*"):
+    table = _table.load(_resolve(dataset))
+    return [Field(d) for d in table.all_field_defs() if fnmatch.fnmatch(d["name"], wild_card)]
+
+class _Describe(object):
+    def __init__(self, table):
+        self.shapeType = table.shape_type.capitalize()
+        self.spatialReference = SpatialReference(table.wkid)
+        self.fields = [Field(d) for d in table.all_field_defs()]
+        self.indexes = list(table.indexes)
+        self.hasSpatialIndex = table.spatial_index
+        self.OIDFieldName = "OBJECTID"
+
+def Describe(dataset):
+    return _Describe(_table.load(_resolve(dataset)))
+
+from . import _table  # noqa: E402
+from . import da, management, conversion  # noqa: E402,F401
+
+def AddField_management(*args, **kwargs):
+    return management.AddField(*args, **kwargs)
+
+class Index(object):
+    def __init__(self, name):
+        self.name = name
+
+def ListIndexes(dataset, wild_card="*"):
+    return [Index(n) for n in _table.load(_resolve(dataset)).indexes if fnmatch.fnmatch(n, wild_card)]
+
+def AddFieldDelimiters(datasource, field):
+    return field
@@ -0,0 +1,88 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy/_shapefile.py
+# Purpose:    スタンドイン用：ポリゴンのシェープファイル（.shp / .dbf）を読み込んで Table にする
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import struct
+from . import _table
+
+def _read_dbf(path, encoding):
+    with open(path, "rb") as f:
+        data = f.read()
+    nrec, hsize, rsize = struct.unpack_from("<IHH", data, 4)
+    fields = []
+    pos = 32
+    while data[pos] != 0x0D:
+        name = data[pos:pos + 11].split(b"\0")[0].decode("ascii")
+        ftype = chr(data[pos + 11])
+        flen, fdec = data[pos + 16], data[pos + 17]
+        fields.append((name, ftype, flen, fdec))
+        pos += 32
+    rows = []
+    for i in range(nrec):
+        off = hsize + i * rsize + 1
+        row = []
+        for name, ftype, flen, fdec in fields:
+            raw = data[off:off + flen]
+            off += flen
+            text = raw.decode(encoding, errors="replace").strip()
+            if ftype == "N":
+                row.append(None if text == "" else (float(text) if fdec else int(text)))
+            elif ftype == "F":
+                row.append(None if text == "" else float(text))
+            else:
+                row.append(text)
+        rows.append(row)
+    defs = []
+    for name, ftype, flen, fdec in fields:
+        t = "TEXT" if ftype == "C" else ("DOUBLE" if (ftype == "F" or fdec) else ("LONG" if flen < 10 else "DOUBLE"))
+        defs.append({"name": name, "type": t, "length": flen if t == "TEXT" else None, "alias": name, "domain": ""})
+    return defs, rows
+
+def _read_shp(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 100
+    geoms = []
+    while pos < len(data):
+        clen = struct.unpack_from(">i", data, pos + 4)[0] * 2
+        rec = pos + 8
+        stype = struct.unpack_from("<i", data, rec)[0]
+        if stype == 0:
+            geoms.append(None)
+        else:
+            nparts, npoints = struct.unpack_from("<ii", data, rec + 36)
+            parts = list(struct.unpack_from("<%di" % nparts, data, rec + 44))
+            ppos = rec + 44 + 4 * nparts
+            pts = struct.unpack_from("<%dd" % (npoints * 2), data, ppos)
+            rings = []
+            bounds = parts + [npoints]
+            for i in range(nparts):
+                rings.append(pts[bounds[i] * 2:bounds[i + 1] * 2])
+            out = [struct.pack("<BII", 1, 3, len(rings))]
+            for r in rings:
+                out.append(struct.pack("<I", len(r) // 2))
+                out.append(struct.pack("<%dd" % len(r), *r))
+            geoms.append(b"".join(out))
+        pos = rec + clen
+    return geoms
+
+def load(shp):
+    base = os.path.splitext(shp)[0]
+    encoding = "cp932"
+    if os.path.exists(base + ".cpg"):
+        with open(base + ".cpg") as f:
+            cpg = f.read().strip().lower()
+        encoding = {"utf-8": "utf-8", "utf8": "utf-8"}.get(cpg, "cp932")
+    defs, rows = _read_dbf(base + ".dbf", encoding)
+    geoms = _read_shp(shp)
+    t = _table.Table(base, "POLYGON", 6668, defs)
+    for g, r in zip(geoms, rows):
+        t.rows.append([t.next_oid, g] + r)
+        t.next_oid += 1
+    t.save = lambda: (_ for _ in ()).throw(RuntimeError("shapefile is read-only in the stand-in"))
+    return t
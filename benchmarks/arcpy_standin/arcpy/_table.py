@@ -0,0 +1,54 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy/_table.py
+# Purpose:    スタンドイン用のフィーチャクラス（テーブル）の保存形式：1フィーチャクラス = 1 pickle ファイル
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import pickle
+
+class Table(object):
+    def __init__(self, path, shape_type="POLYGON", wkid=4326, fields=None):
+        self.path = path
+        self.shape_type = shape_type.upper()
+        self.wkid = wkid
+        self.fields = list(fields or [])  # [{"name","type","length","alias","domain"}]
+        self.rows = []                    # [[oid, wkb, attr...]]
+        self.next_oid = 1
+        self.indexes = []
+        self.spatial_index = True
+
+    def field_names(self):
+        return [f["name"] for f in self.fields]
+
+    def all_field_defs(self):
+        defs = [{"name": "OBJECTID", "type": "OID"}, {"name": "Shape", "type": "GEOMETRY"}]
+        defs += self.fields
+        if self.shape_type == "POLYGON":
+            defs += [{"name": "Shape_Length", "type": "DOUBLE"}, {"name": "Shape_Area", "type": "DOUBLE"}]
+        return defs
+
+    def field(self, name):
+        for f in self.fields:
+            if f["name"].lower() == name.lower():
+                return f
+        return None
+
+    def save(self):
+        with open(self.path + ".fc", "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load(path):
+    fc_file = path + ".fc"
+    if os.path.exists(fc_file):
+        with open(fc_file, "rb") as f:
+            return pickle.load(f)
+    if path.lower().endswith(".shp") or os.path.exists(path + ".shp"):
+        from . import _shapefile
+        return _shapefile.load(path if path.lower().endswith(".shp") else path + ".shp")
+    raise RuntimeError(u"ERROR 000732: Dataset {0} does not exist or is not supported".format(path))
+
+def exists(path):
+    return os.path.exists(path + ".fc")
@@ -0,0 +1,21 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy/conversion.py
+# Purpose:    arcpy.conversion のスタンドイン
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import copy
+import arcpy
+from . import _table
+
+def FeatureClassToFeatureClass(in_features, out_path, out_name, where_clause=None, *args, **kwargs):
+    arcpy._record("conversion.FeatureClassToFeatureClass", in_features, out_path, out_name)
+    src = _table.load(arcpy._resolve(in_features))
+    dst = _table.Table(os.path.join(out_path, out_name), src.shape_type, src.wkid, copy.deepcopy(src.fields))
+    for r in src.rows:
+        dst.rows.append([dst.next_oid] + list(r[1:]))
+        dst.next_oid += 1
+    dst.save()
@@ -0,0 +1,218 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy/da.py
+# Purpose:    arcpy.da のスタンドイン（InsertCursor / SearchCursor / UpdateCursor / ListDomains）
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import json
+import arcpy
+from . import _table
+
+_TYPE_CHECK = {
+    "LONG": (int,), "SHORT": (int,), "BIGINTEGER": (int,),
+    "DOUBLE": (int, float), "FLOAT": (int, float), "TEXT": (str,),
+}
+
+def _geom_in(token, value):
+    if value is None:
+        return None
+    if token == "SHAPE@WKB":
+        return bytes(value)
+    if token == "SHAPE@JSON":
+        return arcpy.AsShape(json.loads(value)).WKB
+    if isinstance(value, arcpy.Geometry):
+        return value.WKB
+    raise TypeError(u"cannot insert geometry of type {0}".format(type(value)))
+
+def _geom_out(token, wkb):
+    if wkb is None:
+        return None
+    if token == "SHAPE@WKB":
+        return bytearray(wkb)
+    if token == "SHAPE@XY":
+        bounds = arcpy._wkb_extent(wkb)
+        return None if bounds is None else ((bounds[0] + bounds[2]) / 2.0, (bounds[1] + bounds[3]) / 2.0)
+    return arcpy.Geometry(wkb)
+
+def _is_shape(token):
+    return token.upper().startswith("SHAPE@") and token.upper() not in ("SHAPE@AREA", "SHAPE@LENGTH")
+
+class InsertCursor(object):
+    def __init__(self, in_table, field_names):
+        arcpy._record("da.InsertCursor", in_table)
+        self._table = _table.load(in_table)
+        self._map = []
+        for name in field_names:
+            if _is_shape(name):
+                self._map.append(("geom", name.upper()))
+            else:
+                f = self._table.field(name)
+                if f is None:
+                    raise RuntimeError(u"Cannot find field '{0}'".format(name))
+                self._map.append(("attr", self._table.fields.index(f)))
+
+    def insertRow(self, row):
+        t = self._table
+        new = [t.next_oid, None] + [None] * len(t.fields)
+        for (kind, key), value in zip(self._map, row):
+            if kind == "geom":
+                new[1] = _geom_in(key, value)
+            else:
+                fdef = t.fields[key]
+                if value is not None:
+                    ok = _TYPE_CHECK.get(fdef["type"])
+                    if ok and (not isinstance(value, ok) or isinstance(value, bool)):
+                        if fdef["type"] in ("DOUBLE", "FLOAT") and isinstance(value, str):
+                            value = float(value)
+                        elif fdef["type"] in ("LONG", "SHORT", "BIGINTEGER") and isinstance(value, str):
+                            value = int(value)
+                        elif fdef["type"] == "TEXT":
+                            value = str(value)
+                        else:
+                            raise RuntimeError(u"The value type is incompatible with the field type. [{0}]".format(fdef["name"]))
+                    if fdef["type"] == "TEXT" and len(value) > (fdef.get("length") or 255):
+                        raise RuntimeError(u"The row contains a bad value. [{0}]".format(fdef["name"]))
+                new[2 + key] = value
+        t.rows.append(new)
+        t.next_oid += 1
+        return new[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._flush()
+        return False
+
+    def _flush(self):
+        if self._table is not None:
+            self._table.save()
+            self._table = None
+
+    def __del__(self):
+        self._flush()
+
+class SearchCursor(object):
+    def __init__(self, in_table, field_names, where_clause=None, spatial_reference=None,
+                 explode_to_points=False, sql_clause=(None, None), spatial_filter=None, **kwargs):
+        arcpy._record("da.SearchCursor", in_table)
+        if isinstance(field_names, str):
+            field_names = ["*"] if field_names == "*" else [field_names]
+        self._table = _table.load(in_table)
+        self.fields = tuple(field_names)
+        getters = []
+        for name in field_names:
+            u = name.upper()
+            if _is_shape(u):
+                getters.append(lambda r, u=u: _geom_out(u, r[1]))
+            elif u == "OID@":
+                getters.append(lambda r: r[0])
+            else:
+                f = self._table.field(name)
+                if f is None:
+                    raise RuntimeError(u"Cannot find field '{0}'".format(name))
+                i = 2 + self._table.fields.index(f)
+                getters.append(lambda r, i=i: r[i])
+        self._getters = getters
+        self._filters = []
+        if where_clause:
+            self._filters.append(_parse_where(self._table, where_clause))
+        if spatial_filter is not None:
+            self._filters.append(self._intersects(spatial_filter.extent))
+        self.reset()
+
+    def _intersects(self, extent):
+        def test(r):
+            if r[1] is None:
+                return False
+            bounds = arcpy._wkb_extent(r[1])
+            return bounds is not None and not (bounds[2] < extent.XMin or bounds[0] > extent.XMax or
+                                               bounds[3] < extent.YMin or bounds[1] > extent.YMax)
+        return test
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        r = next(self._rows)
+        return tuple(g(r) for g in self._getters)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def reset(self):
+        self._rows = iter([r for r in self._table.rows if all(f(r) for f in self._filters)])
+
+class Domain(object):
+    def __init__(self, name, d):
+        self.name = name
+        self.description = d.get("description")
+        self.codedValues = d.get("codes", {})
+
+def ListDomains(workspace):
+    from . import management
+    return [Domain(n, d) for n, d in management._domains(workspace).items()]
+
+def _parse_where(table, where_clause):
+    # "field IN ('a', 'b')" と "field = 'a'"（数値も可）だけを解釈する
+    import re
+    if not where_clause:
+        return lambda r: True
+    m = re.match(r"\s*(\w+)\s+IN\s*\((.*)\)\s*$", where_clause, re.I) or re.match(r"\s*(\w+)\s*=\s*(.*?)\s*$", where_clause)
+    if not m:
+        raise RuntimeError(u"unsupported where clause: {0}".format(where_clause))
+    f = table.field(m.group(1))
+    i = 0 if f is None and m.group(1).upper() == "OBJECTID" else 2 + table.fields.index(f)
+    values = set(v.strip().strip("'").replace("''", "'") for v in m.group(2).split(","))
+    return lambda r: r[i] is not None and (str(r[i]) in values or (isinstance(r[i], float) and r[i].is_integer() and str(int(r[i])) in values))
+
+class UpdateCursor(object):
+    def __init__(self, in_table, field_names, where_clause=None, **kwargs):
+        arcpy._record("da.UpdateCursor", in_table)
+        self._table = _table.load(in_table)
+        match = _parse_where(self._table, where_clause)
+        self._rows = [r for r in self._table.rows if match(r)]
+        self._deleted = set()
+        self._pos = -1
+        if isinstance(field_names, str):
+            field_names = [field_names]
+        self._index = []
+        for name in field_names:
+            if name.upper() == "OID@":
+                self._index.append(0)
+                continue
+            f = self._table.field(name)
+            if f is None:
+                raise RuntimeError(u"Cannot find field '{0}'".format(name))
+            self._index.append(2 + self._table.fields.index(f))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._pos += 1
+        if self._pos >= len(self._rows):
+            raise StopIteration
+        return tuple(self._rows[self._pos][i] for i in self._index)
+
+    def updateRow(self, row):
+        # 値はそのまま保存する（型の変換はしない）
+        for i, value in zip(self._index, row):
+            if i > 0:
+                self._rows[self._pos][i] = value
+
+    def deleteRow(self):
+        self._deleted.add(self._rows[self._pos][0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._table.rows = [r for r in self._table.rows if r[0] not in self._deleted]
+        self._table.save()
+        return False
@@ -0,0 +1,202 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       arcpy/management.py
+# Purpose:    arcpy.management のスタンドイン（変換スクリプトが利用するツールのみ）
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import json
+import copy
+import shutil
+import arcpy
+from . import _table
+
+def _load(path):
+    return _table.load(arcpy._resolve(path))
+
+_DOMAINS = "_domains.json"
+
+def CreateFileGDB(out_folder_path, out_name, out_version="CURRENT"):
+    arcpy._record("management.CreateFileGDB", out_folder_path, out_name)
+    name = out_name if out_name.lower().endswith(".gdb") else out_name + ".gdb"
+    path = os.path.join(out_folder_path, name)
+    if os.path.exists(path):
+        raise arcpy.ExecuteError(u"ERROR 000258: Output {0} already exists".format(path))
+    os.makedirs(path)
+
+def CreateFeatureclass(out_path, out_name, geometry_type="POLYGON", template=None, has_m="DISABLED",
+                       has_z="DISABLED", spatial_reference=None, *args, **kwargs):
+    arcpy._record("management.CreateFeatureclass", out_path, out_name, geometry_type)
+    fields = []
+    wkid = 4326
+    if template:
+        tmpl = _load(template)
+        fields = copy.deepcopy(tmpl.fields)
+        wkid = tmpl.wkid
+        geometry_type = geometry_type or tmpl.shape_type
+    if spatial_reference is not None:
+        if isinstance(spatial_reference, str):
+            wkid = _load(spatial_reference).wkid
+        else:
+            wkid = spatial_reference.factoryCode
+    t = _table.Table(os.path.join(out_path, out_name), geometry_type, wkid, fields)
+    t.save()
+
+def _add_field(t, name, ftype, length=None, alias=None, domain=None):
+    if t.field(name) is not None:
+        arcpy.AddWarning(u"WARNING 000012: {0} already exists".format(name))
+        return
+    t.fields.append({"name": name, "type": ftype.upper(), "length": length or (255 if ftype.upper() == "TEXT" else None),
+                     "alias": alias or name, "domain": domain or ""})
+    for r in t.rows:
+        r.append(None)
+
+def AddField(in_table, field_name, field_type, field_precision=None, field_scale=None, field_length=None,
+             field_alias=None, field_is_nullable=None, field_is_required=None, field_domain=None):
+    arcpy._record("management.AddField", in_table, field_name, field_type)
+    t = _load(in_table)
+    _add_field(t, field_name, field_type, field_length, field_alias, field_domain)
+    t.save()
+
+def AddFields(in_table, field_description, template=None):
+    arcpy._record("management.AddFields", in_table, len(field_description))
+    t = _load(in_table)
+    for d in field_description:
+        d = list(d) + [None] * (6 - len(d))
+        _add_field(t, d[0], d[1], d[3], d[2], d[5])
+    t.save()
+
+def AlterField(in_table, field, new_field_name=None, new_field_alias=None, *args, **kwargs):
+    arcpy._record("management.AlterField", in_table, field)
+    t = _load(in_table)
+    f = t.field(field)
+    if new_field_alias:
+        f["alias"] = new_field_alias
+    if new_field_name:
+        f["name"] = new_field_name
+    t.save()
+
+def _domains(ws):
+    p = os.path.join(ws, _DOMAINS)
+    if os.path.exists(p):
+        with open(p, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def _save_domains(ws, d):
+    with open(os.path.join(ws, _DOMAINS), "w", encoding="utf-8") as f:
+        json.dump(d, f, ensure_ascii=False)
+
+def CreateDomain(in_workspace, domain_name, domain_description=None, field_type="SHORT", domain_type="CODED", *args, **kwargs):
+    arcpy._record("management.CreateDomain", in_workspace, domain_name)
+    d = _domains(in_workspace)
+    if domain_name in d:
+        raise arcpy.ExecuteError(u"ERROR 000192: Domain {0} already exists".format(domain_name))
+    d[domain_name] = {"description": domain_description, "type": field_type, "codes": {}}
+    _save_domains(in_workspace, d)
+
+def AddCodedValueToDomain(in_workspace, domain_name, code, code_description):
+    arcpy._record("management.AddCodedValueToDomain", in_workspace, domain_name, code)
+    d = _domains(in_workspace)
+    d[domain_name]["codes"][str(code)] = code_description
+    _save_domains(in_workspace, d)
+
+def AssignDomainToField(in_table, field_name, domain_name, *args):
+    arcpy._record("management.AssignDomainToField", in_table, field_name, domain_name)
+    t = _load(in_table)
+    t.field(field_name)["domain"] = domain_name
+    t.save()
+
+def Append(inputs, target, schema_type="TEST", *args, **kwargs):
+    if isinstance(inputs, str):
+        inputs = inputs.split(";")
+    dst = _load(target)
+    for inp in inputs:
+        arcpy._record("management.Append", inp, target)
+        src = _load(inp)
+        idx = []
+        for f in dst.fields:
+            sf = src.field(f["name"])
+            idx.append(None if sf is None else 2 + src.fields.index(sf))
+        for r in src.rows:
+            dst.rows.append([dst.next_oid, r[1]] + [None if i is None else r[i] for i in idx])
+            dst.next_oid += 1
+    dst.save()
+
+def Merge(inputs, output, *args, **kwargs):
+    arcpy._record("management.Merge", output)
+    if isinstance(inputs, str):
+        inputs = inputs.split(";")
+    first = _load(inputs[0])
+    t = _table.Table(arcpy._resolve(output), first.shape_type, first.wkid, copy.deepcopy(first.fields))
+    t.save()
+    Append(inputs, output)
+
+def Copy(in_data, out_data, *args, **kwargs):
+    arcpy._record("management.Copy", in_data, out_data)
+    src = _load(in_data)
+    src.path = arcpy._resolve(out_data)
+    src.save()
+    ws = os.path.dirname(arcpy._resolve(in_data))
+    dom = _domains(ws)
+    if dom:
+        out_ws = os.path.dirname(arcpy._resolve(out_data))
+        merged = _domains(out_ws)
+        merged.update(dom)
+        _save_domains(out_ws, merged)
+
+def Delete(in_data, *args):
+    arcpy._record("management.Delete", in_data)
+    path = arcpy._resolve(in_data)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path + ".fc"):
+        os.remove(path + ".fc")
+
+def DeleteRows(in_rows):
+    arcpy._record("management.DeleteRows", in_rows)
+    t = _load(in_rows)
+    t.rows = []
+    t.save()
+
+def GetCount(in_rows):
+    return [str(len(_load(in_rows).rows))]
+
+def CalculateField(in_table, field, expression, expression_type="PYTHON3", code_block=None, *args, **kwargs):
+    arcpy._record("management.CalculateField", in_table, field)
+    t = _load(in_table)
+    i = 2 + t.fields.index(t.field(field))
+    value = eval(expression)
+    for r in t.rows:
+        r[i] = value
+    t.save()
+
+def AddSpatialIndex(in_features, *args, **kwargs):
+    arcpy._record("management.AddSpatialIndex", in_features)
+    t = _load(in_features)
+    t.spatial_index = True
+    t.save()
+
+def RemoveSpatialIndex(in_features):
+    arcpy._record("management.RemoveSpatialIndex", in_features)
+    t = _load(in_features)
+    t.spatial_index = False
+    t.save()
+
+def AddIndex(in_table, fields, index_name=None, unique="NON_UNIQUE", ascending="NON_ASCENDING"):
+    arcpy._record("management.AddIndex", in_table, index_name)
+    t = _load(in_table)
+    t.indexes.append(index_name or "_".join(fields if isinstance(fields, list) else [fields]))
+    t.save()
+
+def RemoveIndex(in_table, index_name):
+    arcpy._record("management.RemoveIndex", in_table, index_name)
+    t = _load(in_table)
+    names = index_name if isinstance(index_name, list) else [index_name]
+    t.indexes = [i for i in t.indexes if i not in names]
+    t.save()
+
+def Compact(in_workspace):
+    arcpy._record("management.Compact", in_workspace)
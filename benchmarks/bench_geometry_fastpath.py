@@ -0,0 +1,127 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       bench_geometry_fastpath.py
+# Purpose:    マイクロベンチマーク - GeoJSON から InsertCursor への書込みの比較
+#               a)従来の方法：レコードを dict にフラット化 + arcpy.AsShape + record.setdefault（SHAPE@）
+#               b)高速化した方法：geojson_to_wkb + 事前に対応付けたキーの一覧（SHAPE@WKB）
+#             合成した農地筆ポリゴンの GeoJSON ファイルで、1秒あたりの書込み件数（rows/sec）を出力
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import arcpy
+import os
+import sys
+import json
+import math
+import random
+import tempfile
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MP_Farmland_JsonToFeatureClass import FarmlandGeojsonToFeaturesEx, geojson_to_wkb, create_template_featureclass
+
+def make_farmland_geojson(jsonfile :str, feature_cnt :int, vertex_cnt :int, seed :int = 1,
+                          local_government_cd :str = "022012", issue_year :int = 2024):
+    '''
+    農地筆ポリゴンと同じ属性を持つ、合成した GeoJSON ファイルを作成する関数
+    （公開データと同じく、geometry に座標系（EPSG:6668）の crs を持つ）
+    '''
+    rnd = random.Random(seed)
+    features = []
+    for i in range(feature_cnt):
+        lng = 140.0 + rnd.random()
+        lat = 40.0 + rnd.random()
+        r = 0.0003
+        ring = [[lng + r * math.cos(2 * math.pi * k / vertex_cnt), lat + r * math.sin(2 * math.pi * k / vertex_cnt)] for k in range(vertex_cnt)]
+        ring.append(ring[0])
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring], "crs": {"type": "name", "properties": {"name": "EPSG:6668"}}},
+            "properties": {
+                "polygon_uuid": str(uuid.UUID(int=rnd.getrandbits(128))),
+                "land_type": rnd.choice([100, 200]),
+                "issue_year": issue_year,
+                "edit_year": issue_year - 1,
+                "history": "[]",
+                "last_polygon_uuid": str(uuid.UUID(int=rnd.getrandbits(128))),
+                "prev_last_polygon_uuid": "",
+                "local_government_cd": local_government_cd,
+                "point_lng": lng,
+                "point_lat": lat,
+            }})
+    with open(jsonfile, 'w', encoding='utf-8') as fp:
+        json.dump({"type": "FeatureCollection", "features": features}, fp, ensure_ascii=False)
+
+def old_path(features, icursor, fields):
+    # 従来の geojson_to_features の書込みループと同じ処理
+    for feature in features:
+        record = {"geometry": feature["geometry"], "type": feature["geometry"]["type"]}
+        record.update(feature["properties"])
+        new_row = []
+        for field in fields:
+            if field == "SHAPE@":
+                try:
+                    geom = arcpy.AsShape(record.setdefault("geometry", None))
+                except:
+                    geom = None
+                new_row.append(geom)
+            else:
+                new_row.append(record.setdefault(str(field), None))
+        icursor.insertRow(new_row)
+
+def new_path(features, icursor, keys):
+    for feature in features:
+        try:
+            geom = geojson_to_wkb(feature["geometry"])
+        except:
+            geom = None
+        get = feature["properties"].get
+        icursor.insertRow([geom] + [get(key) for key in keys])
+
+def run(feature_cnt :int, vertex_cnt :int, repeat :int):
+    workdir = tempfile.mkdtemp(prefix="bench_geometry_")
+    jsonfile = os.path.join(workdir, "2024_022012.json")
+    make_farmland_geojson(jsonfile, feature_cnt, vertex_cnt)
+    with open(jsonfile, 'r', encoding='utf-8') as fp:
+        features = json.load(fp)["features"]
+    conv = FarmlandGeojsonToFeaturesEx()
+    schema = conv.infer_schema(conv.iter_records(jsonfile))
+    arcpy.management.CreateFileGDB(workdir, "bench.gdb", "CURRENT")
+    ws = os.path.join(workdir, "bench.gdb")
+    template_fc = create_template_featureclass(ws, "template", schema)
+    field_list = [f["name"] for f in schema["fields"]]
+    keys = [f["key"] for f in schema["fields"]]
+    results = {"old": [], "new": []}
+    for i in range(repeat):
+        for label in ("old", "new"):
+            fc = os.path.join(ws, u"{0}_{1}".format(label, i))
+            arcpy.management.Copy(template_fc, fc)
+            t0 = time.perf_counter()
+            if label == "old":
+                fields = ["SHAPE@"] + field_list
+                with arcpy.da.InsertCursor(fc, fields) as icursor:
+                    old_path(features, icursor, fields)
+            else:
+                with arcpy.da.InsertCursor(fc, ["SHAPE@WKB"] + field_list) as icursor:
+                    new_path(features, icursor, keys)
+            results[label].append(feature_cnt / (time.perf_counter() - t0))
+    print(u"features={0} vertices={1} repeat={2} workdir={3}".format(feature_cnt, vertex_cnt, repeat, workdir))
+    for label in ("old", "new"):
+        print(u"  {0}: {1:12.1f} rows/sec (best of {2})".format(label, max(results[label]), repeat))
+    print(u"  speedup: {0:.2f}x".format(max(results["new"]) / max(results["old"])))
+    return results
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python.exe benchmarks\bench_geometry_fastpath.py --features 20000 --vertices 12 --repeat 3
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.features, args.vertices, args.repeat)
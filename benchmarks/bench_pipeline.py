@@ -0,0 +1,180 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       bench_pipeline.py
+# Purpose:    ベンチマーク - 変換処理全体（マルチプロセスの変換とマージ）のスループット・メモリ・スケーリング
+#               a)合成した都道府県フォルダ（GeoJSON / シェープファイル）を作成（synthetic_farmland.py）
+#               b)cpu_cnt ごとに、変換スクリプトを別プロセスで実行（実行ごとに新しい出力フォルダ）
+#               c)変換スクリプトが出力する実行レポート（farmland_run_report.json）から、
+#                 件数・処理時間・ワーカーと親プロセスのピークのメモリ使用量・段階ごとの処理時間を集計
+#               d)cpu_cnt ごとの rows/sec、1 プロセスに対する速度向上率と効率を出力
+#                 （--out で結果を JSON に保存し、--compare で前回の結果との差を出力）
+#             arcpy がない環境（Linux など）では benchmarks/arcpy_standin の簡易スタンドインで実行する
+#             （スタンドインの FGDB は pickle ファイルなので、ArcGIS Pro での絶対値とは比べられません。同じ環境での実行ごとの比較に使う）
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from collections import Counter
+from typing import Tuple,List,Dict
+
+_BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_DIR = os.path.dirname(_BENCH_DIR)
+_STANDIN_DIR = os.path.join(_BENCH_DIR, "arcpy_standin")
+_SCRIPTS = {
+    "json": "MP_Farmland_JsonToFeatureClass.py",
+    "shp": "MP_Farmland_ShapefileToFeatureClass.py",
+}
+_REPORT_FILE = "farmland_run_report.json"
+
+sys.path.insert(0, _BENCH_DIR)
+from synthetic_farmland import make_json_prefecture, make_shapefile_prefecture
+
+def __child_env(standin :bool, call_log :str = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    paths = [_REPO_DIR] + ([_STANDIN_DIR] if standin else [])
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    env["ARCPY_STANDIN_QUIET"] = "1"
+    if call_log:
+        env["ARCPY_STANDIN_LOG"] = call_log
+    return env
+
+def __count_calls(call_log :str) -> Dict[str, int]:
+    counter = Counter()
+    if os.path.exists(call_log):
+        with open(call_log, encoding="utf-8") as fp:
+            for line in fp:
+                counter[json.loads(line)["call"]] += 1
+    return dict(counter)
+
+def run_once(layout :str, infolder :str, outfolder :str, cpu_cnt :int, extra_args :List[str], standin :bool) -> Dict:
+    '''
+    変換スクリプトを別プロセスで1回実行して、実行レポートと呼び出しの記録から結果の dict を返す関数
+    （別プロセスにするのは、ピークのメモリ使用量が前の実行の影響を受けないようにするため）
+    '''
+    if os.path.exists(outfolder):
+        shutil.rmtree(outfolder)
+    os.makedirs(outfolder)
+    call_log = outfolder + "_calls.jsonl"
+    if os.path.exists(call_log):
+        os.remove(call_log)
+    command = [sys.executable, os.path.join(_REPO_DIR, _SCRIPTS[layout]), infolder, outfolder, str(cpu_cnt)] + extra_args
+    t0 = time.perf_counter()
+    proc = subprocess.run(command, env=__child_env(standin, call_log), cwd=_REPO_DIR, capture_output=True, text=True, encoding="utf-8")
+    wall = time.perf_counter() - t0
+    report_file = os.path.join(outfolder, _REPORT_FILE)
+    if proc.returncode != 0 or not os.path.exists(report_file) or "ERROR" in proc.stderr:
+        raise RuntimeError(u"変換に失敗しました（cpu_cnt={0}）：\n{1}\n{2}".format(cpu_cnt, proc.stdout[-2000:], proc.stderr[-2000:]))
+    with open(report_file, encoding="utf-8") as fp:
+        report = json.load(fp)
+    peaks = list(report["peak_rss_by_pid"].values()) or [0]
+    return {
+        "cpu_cnt": cpu_cnt,
+        "wall": wall,
+        "elapsed": report["elapsed"],
+        "rows": report["counters"].get("rows", 0),
+        "merged_rows": report["parent"]["counters"].get("merged_rows", 0) + report["counters"].get("merged_rows", 0),
+        "rows_per_sec": report["rows_per_sec"],
+        "worker_peak_rss_mb": max(peaks) / 1024.0 / 1024.0,
+        "parent_peak_rss_mb": report["parent"]["peak_rss"] / 1024.0 / 1024.0,
+        "queue_wait": report["queue_wait"],
+        "stages": dict((k, v["seconds"]) for k, v in report["stages"].items()),
+        "parent_stages": dict((k, v["seconds"]) for k, v in report["parent"]["stages"].items()),
+        "calls": __count_calls(call_log),
+    }
+
+def make_dataset(layout :str, workdir :str, cities :int, features :int, skew :float, vertices :int) -> Tuple[str, int]:
+    if layout == "json":
+        if _STANDIN_DIR not in sys.path:
+            sys.path.append(_STANDIN_DIR) #インストール済みの arcpy があればそちらを優先
+        return make_json_prefecture(workdir, city_cnt=cities, feature_cnt=features, skew=skew, vertex_cnt=vertices)
+    return make_shapefile_prefecture(workdir, city_cnt=cities, feature_cnt=features, skew=skew, vertex_cnt=vertices)
+
+def run(layout :str, cpus :List[int], cities :int, features :int, skew :float, vertices :int, repeat :int,
+        extra_args :List[str], standin :bool, workdir :str = None) -> Dict:
+    workdir = workdir or tempfile.mkdtemp(prefix="bench_pipeline_")
+    t0 = time.perf_counter()
+    infolder, count = make_dataset(layout, workdir, cities, features, skew, vertices)
+    print(u"layout={0} cities={1} features={2} skew={3} vertices={4} args={5} arcpy={6}".format(
+        layout, cities, count, skew, vertices, " ".join(extra_args) or "-", "standin" if standin else "installed"))
+    print(u"  dataset: {0} ({1:.1f} sec)".format(infolder, time.perf_counter() - t0))
+    results = []
+    for cpu_cnt in cpus:
+        runs = [run_once(layout, infolder, os.path.join(workdir, u"out_cpu{0}".format(cpu_cnt)), cpu_cnt, extra_args, standin)
+                for i in range(repeat)]
+        best = min(runs, key=lambda r: r["elapsed"])
+        if best["merged_rows"] != count:
+            raise RuntimeError(u"マージした件数が一致しません（cpu_cnt={0}）：{1} / {2}".format(cpu_cnt, best["merged_rows"], count))
+        results.append(best)
+    base = results[0]
+    print(u"  {0:>4} {1:>9} {2:>12} {3:>8} {4:>6} {5:>11} {6:>11} {7:>10}".format(
+        "cpu", "elapsed", "rows/sec", "speedup", "eff", "worker MB", "parent MB", "queue wait"))
+    for r in results:
+        speedup = base["elapsed"] / r["elapsed"] if r["elapsed"] > 0 else 0
+        r["speedup"] = speedup
+        r["efficiency"] = speedup * base["cpu_cnt"] / r["cpu_cnt"]
+        print(u"  {0:>4} {1:>9.2f} {2:>12.1f} {3:>8.2f} {4:>6.2f} {5:>11.1f} {6:>11.1f} {7:>10.2f}".format(
+            r["cpu_cnt"], r["elapsed"], r["rows_per_sec"], speedup, r["efficiency"], r["worker_peak_rss_mb"], r["parent_peak_rss_mb"], r["queue_wait"]))
+    #最も速かった cpu_cnt の段階ごとの処理時間（ワーカーの合計 / 親プロセス）
+    fastest = min(results, key=lambda r: r["elapsed"])
+    stages = sorted(list(fastest["stages"].items()) + [(u"(parent) " + k, v) for k, v in fastest["parent_stages"].items()],
+                    key=lambda s: s[1], reverse=True)
+    print(u"  stages (cpu={0}): ".format(fastest["cpu_cnt"]) + u", ".join(u"{0} {1:.2f}s".format(k, v) for k, v in stages[:8]))
+    calls = sorted(fastest["calls"].items(), key=lambda c: c[1], reverse=True)
+    if calls:
+        print(u"  arcpy calls (cpu={0}): ".format(fastest["cpu_cnt"]) + u", ".join(u"{0} {1}".format(k, v) for k, v in calls[:8]))
+    return {"layout": layout, "cities": cities, "features": count, "skew": skew, "vertices": vertices, "args": extra_args,
+            "arcpy": "standin" if standin else "installed", "workdir": workdir, "results": results}
+
+def compare(current :Dict, previous :Dict):
+    '''
+    前回の結果（--out で保存した JSON）と、cpu_cnt ごとの rows/sec とピークのメモリ使用量を比べて出力する関数
+    '''
+    prev_by_cpu = dict((r["cpu_cnt"], r) for r in previous["results"])
+    print(u"  compare with previous ({0} features, {1}):".format(previous["features"], previous["layout"]))
+    for r in current["results"]:
+        p = prev_by_cpu.get(r["cpu_cnt"])
+        if p is None:
+            continue
+        print(u"  {0:>4} rows/sec {1:>12.1f} ⇒ {2:>12.1f} ({3:+.1f}%)  worker MB {4:.1f} ⇒ {5:.1f}".format(
+            r["cpu_cnt"], p["rows_per_sec"], r["rows_per_sec"], 100.0 * (r["rows_per_sec"] / p["rows_per_sec"] - 1) if p["rows_per_sec"] else 0,
+            p["worker_peak_rss_mb"], r["worker_peak_rss_mb"]))
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python benchmarks/bench_pipeline.py --layout json --cities 20 --features 200000 --skew 1.0 --cpus 1,2,4 --out bench_json.json
+      python benchmarks/bench_pipeline.py --layout shp --cities 20 --features 200000 --cpus 1,2,4 --args native
+      python benchmarks/bench_pipeline.py --layout json --features 200000 --cpus 1,2,4 --compare bench_json.json
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layout", choices=["json", "shp"], default="json")
+    parser.add_argument("--cities", type=int, default=10)
+    parser.add_argument("--features", type=int, default=50000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--cpus", default="1,2,4", help="カンマ区切りの cpu_cnt の一覧")
+    parser.add_argument("--repeat", type=int, default=1, help="cpu_cnt ごとの実行回数（最も速い結果を使う）")
+    parser.add_argument("--args", default="", help="変換スクリプトに渡す追加の引数（例：\"arrow\"、\"native\"）")
+    parser.add_argument("--arcpy", choices=["standin", "installed"], default="standin")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--out", default=None, help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", default=None, help="比べる前回の結果の JSON ファイル")
+    args = parser.parse_args()
+    result = run(args.layout, [int(c) for c in args.cpus.split(",")], args.cities, args.features, args.skew, args.vertices, args.repeat,
+                 args.args.split(), args.arcpy == "standin", args.workdir)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            compare(result, json.load(fp))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=1)
@@ -0,0 +1,157 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       bench_prefetch.py
+# Purpose:    ベンチマーク - 遅いストレージ（ネットワーク共有・クラウド同期フォルダ）からの入力の先読み
+#               a)合成した GeoJSON の都道府県フォルダ（と、その zip ファイル）を作成（synthetic_farmland.py）
+#               b)入力の読込みを、1回の read ごとの待ち時間と帯域を指定した遅い読込みに置き換える（遅いフォルダのスタンドイン）
+#                 （MP_Farmland_Prefetch.open_input を置き換えて、fork したワーカーにも引き継ぐ）
+#               c)先読みなし / 先読みありで exec_batch_convert を実行し、処理時間と遅いストレージから読んだバイト数を出力
+#             arcpy がない環境（Linux など）では benchmarks/arcpy_standin の簡易スタンドインで実行する
+#             ※ワーカーへ置き換えを引き継ぐため、fork できる環境（Linux など）でのみ実行できる
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import argparse
+import multiprocessing
+from typing import Tuple,List,Dict
+
+_BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_DIR = os.path.dirname(_BENCH_DIR)
+sys.path.insert(0, _BENCH_DIR)
+sys.path.insert(0, _REPO_DIR)
+sys.path.append(os.path.join(_BENCH_DIR, "arcpy_standin")) #インストール済みの arcpy があればそちらを優先
+os.environ.setdefault("ARCPY_STANDIN_QUIET", "1")
+
+from synthetic_farmland import make_json_prefecture
+import MP_Farmland_Prefetch
+import MP_Farmland_Manifest
+import MP_Farmland_JsonToFeatureClass as json_conv
+
+_REPORT_FILE = "farmland_run_report.json"
+
+class SlowFile():
+    '''
+    read ごとに latency 秒 + 読んだバイト数 / bandwidth 秒 待つファイル（遅いフォルダのスタンドイン）
+    読んだバイト数と read の回数は、プロセス間で共有する counter に加える
+    '''
+    def __init__(self, fp, latency :float, bandwidth :float, counter):
+        self._fp = fp
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._counter = counter
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self._fp.close()
+    def read(self, size :int = -1) -> bytes:
+        data = self._fp.read(size)
+        time.sleep(self._latency + len(data) / self._bandwidth)
+        with self._counter.get_lock():
+            self._counter[0] += len(data)
+            self._counter[1] += 1
+        return data
+    def read1(self, size :int = -1) -> bytes:
+        return self.read(size)
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def slow_storage(slow_root :str, latency :float, bandwidth :float, counter):
+    '''
+    slow_root 以下の入力だけを SlowFile で開くように、open_input を置き換える関数（元の関数を返す）
+    '''
+    original = MP_Farmland_Prefetch.open_input
+    slow_root = os.path.abspath(slow_root)
+    def open_input(path :str):
+        fp = original(path)
+        if os.path.abspath(path).startswith(slow_root):
+            return SlowFile(fp, latency, bandwidth, counter)
+        return fp
+    for module in (MP_Farmland_Prefetch, MP_Farmland_Manifest, json_conv):
+        module.open_input = open_input
+    return original
+
+def run_once(infolder :str, outfolder :str, cpu_cnt :int, prefetch :int, counter) -> Dict:
+    if os.path.exists(outfolder):
+        shutil.rmtree(outfolder)
+    os.makedirs(outfolder)
+    counter[0], counter[1] = 0, 0
+    t0 = time.perf_counter()
+    json_conv.exec_batch_convert(infolder, outfolder, cpu_cnt, prefetch=prefetch)
+    wall = time.perf_counter() - t0
+    with open(os.path.join(outfolder, _REPORT_FILE), encoding="utf-8") as fp:
+        report = json.load(fp)
+    return {
+        "wall": wall,
+        "merged_rows": report["parent"]["counters"].get("merged_rows", 0) + report["counters"].get("merged_rows", 0),
+        "slow_bytes": counter[0],
+        "slow_reads": counter[1],
+        "prefetch": dict((k, v) for k, v in report["parent"]["counters"].items() if k.startswith("prefetch_")),
+    }
+
+def run(cities :int, features :int, vertices :int, cpu_cnt :int, latency :float, bandwidth :float, cache_mb :float,
+        use_zip :bool, workdir :str = None) -> List[Dict]:
+    workdir = workdir or tempfile.mkdtemp(prefix="bench_prefetch_")
+    slow_root = os.path.join(workdir, "slow")
+    infolder, count = make_json_prefecture(slow_root, city_cnt=cities, feature_cnt=features, vertex_cnt=vertices)
+    if use_zip:
+        archive = infolder + ".zip"
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for f in sorted(os.listdir(infolder)):
+                zf.write(os.path.join(infolder, f), os.path.basename(infolder) + "/" + f)
+        infolder = archive
+    size = sum(MP_Farmland_Prefetch.input_size(f) for f in MP_Farmland_Prefetch.list_inputs(infolder))
+    #スキーマは先に作成しておく（キャッシュ済みのスキーマを使う通常の実行と同じ条件にする）
+    json_conv.load_farmland_schema(infolder)
+    counter = multiprocessing.Array("q", 2)
+    slow_storage(slow_root, latency, bandwidth, counter)
+    print(u"input={0} files={1} size={2:.1f} MB features={3} cpu={4} latency={5:.0f} ms bandwidth={6:.0f} MB/s".format(
+        os.path.basename(infolder), cities, size / 1024.0 / 1024.0, count, cpu_cnt, latency * 1000, bandwidth / 1024.0 / 1024.0))
+    print(u"  {0:<10} {1:>9} {2:>10} {3:>12} {4:>8} {5:>6} {6:>6} {7:>8}".format(
+        "mode", "elapsed", "rows", "slow MB", "reads", "hits", "misses", "wait ms"))
+    results = []
+    for mode, prefetch in (("direct", 0), ("prefetch", int(cache_mb * 1024 * 1024))):
+        r = run_once(infolder, os.path.join(workdir, u"out_{0}".format(mode)), cpu_cnt, prefetch, counter)
+        if r["merged_rows"] != count:
+            raise RuntimeError(u"マージした件数が一致しません（{0}）：{1} / {2}".format(mode, r["merged_rows"], count))
+        r["mode"] = mode
+        p = r["prefetch"]
+        print(u"  {0:<10} {1:>9.2f} {2:>10} {3:>12.1f} {4:>8} {5:>6} {6:>6} {7:>8}".format(
+            mode, r["wall"], r["merged_rows"], r["slow_bytes"] / 1024.0 / 1024.0, r["slow_reads"],
+            p.get("prefetch_hits", "-"), p.get("prefetch_misses", "-"), p.get("prefetch_wait_ms", "-")))
+        results.append(r)
+    return results
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python benchmarks/bench_prefetch.py --cities 10 --features 50000 --latency 20 --bandwidth 50 --cpu 4
+      python benchmarks/bench_prefetch.py --zip --cache-mb 64
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=8)
+    parser.add_argument("--features", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--cpu", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=20.0, help="read ごとの待ち時間（ミリ秒）")
+    parser.add_argument("--bandwidth", type=float, default=50.0, help="帯域（MB/秒）")
+    parser.add_argument("--cache-mb", type=float, default=1024.0, help="先読みのキャッシュの上限（MB）")
+    parser.add_argument("--zip", action="store_true", help="都道府県フォルダを zip にして、展開せずに読む")
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+    if "fork" not in multiprocessing.get_all_start_methods():
+        sys.exit(u"fork できない環境では実行できません（遅い読込みの置き換えをワーカーへ引き継げないため）")
+    multiprocessing.set_start_method("fork")
+    run(args.cities, args.features, args.vertices, args.cpu, args.latency / 1000.0, args.bandwidth * 1024 * 1024, args.cache_mb,
+        args.zip, args.workdir)
@@ -0,0 +1,129 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       bench_shapefile_reader.py
+# Purpose:    マイクロベンチマーク - FarmlandShapefileReader のデコード性能
+#               合成した農地筆ポリゴンのシェープファイル（Shift-JIS の DBF）を作成し、
+#               .shp / .dbf を WKB と属性に変換する1秒あたりの件数（rows/sec）を出力
+#             arcpy を使わないので、ArcGIS Pro がない環境（Linux など）でも実行できる
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import math
+import random
+import struct
+import tempfile
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MP_Farmland_ShapefileReader import FarmlandShapefileReader
+
+#農地筆ポリゴン（シェープファイル形式）と同じ属性のフィールド定義：(名前, 型, 長さ, 小数桁)
+FARMLAND_SHP_FIELDS = [("POLYGON_ID", "C", 36, 0), ("KOCHI_NM", "C", 4, 0), ("ISSUE_YEAR", "N", 4, 0),
+                       ("X", "N", 12, 6), ("Y", "N", 12, 6)]
+
+def write_polygon_shapefile(base :str, polygons, records, fields, encoding :str = "cp932", ldid :int = 0x13):
+    '''
+    ポリゴンのシェープファイル（.shp / .shx / .dbf）を書き出す関数
+      polygons : ポリゴンごとのリングのリスト（外周は時計回り、穴は反時計回り）
+      records  : ポリゴンごとの属性のリスト（fields の順）
+    '''
+    bodies = []
+    allx, ally = [0.0], [0.0]
+    for rings in polygons:
+        points = [p for ring in rings for p in ring]
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        allx += xs
+        ally += ys
+        parts, k = [], 0
+        for ring in rings:
+            parts.append(k)
+            k += len(ring)
+        body = struct.pack("<i4d2i", 5, min(xs), min(ys), max(xs), max(ys), len(rings), len(points))
+        body += struct.pack("<%di" % len(parts), *parts)
+        body += struct.pack("<%dd" % (2 * len(points)), *[c for p in points for c in p])
+        bodies.append(body)
+    def header(length_words):
+        return struct.pack(">7i", 9994, 0, 0, 0, 0, 0, length_words) + \
+               struct.pack("<2i4d4d", 1000, 5, min(allx), min(ally), max(allx), max(ally), 0, 0, 0, 0)
+    shp, shx, offset = [], [], 50
+    for i, body in enumerate(bodies):
+        shx.append(struct.pack(">2i", offset, len(body) // 2))
+        shp.append(struct.pack(">2i", i + 1, len(body) // 2) + body)
+        offset += 4 + len(body) // 2
+    shp = b"".join(shp)
+    shx = b"".join(shx)
+    with open(base + ".shp", "wb") as fp:
+        fp.write(header(50 + len(shp) // 2) + shp)
+    with open(base + ".shx", "wb") as fp:
+        fp.write(header(50 + len(shx) // 2) + shx)
+    record_length = 1 + sum(f[2] for f in fields)
+    header_length = 32 + 32 * len(fields) + 1
+    dbf = bytearray(struct.pack("<4BIHH20x", 3, 124, 1, 1, len(records), header_length, record_length))
+    dbf[29] = ldid
+    for name, ftype, length, decimals in fields:
+        dbf += name.encode("ascii").ljust(11, b"\0") + ftype.encode("ascii") + b"\0" * 4 + bytes([length, decimals]) + b"\0" * 14
+    dbf += b"\x0d"
+    for record in records:
+        dbf += b" "
+        for (name, ftype, length, decimals), value in zip(fields, record):
+            if ftype == "C":
+                dbf += str(value).encode(encoding)[:length].ljust(length, b" ")
+            else:
+                text = ("%.*f" % (decimals, value)) if decimals else str(value)
+                dbf += text.encode("ascii").rjust(length)[:length]
+    dbf += b"\x1a"
+    with open(base + ".dbf", "wb") as fp:
+        fp.write(bytes(dbf))
+
+def make_farmland_shapefile(base :str, feature_cnt :int, vertex_cnt :int, seed :int = 1):
+    '''
+    農地筆ポリゴンと同じ属性を持つ、合成したシェープファイルを作成する関数
+    '''
+    rnd = random.Random(seed)
+    polygons, records = [], []
+    for i in range(feature_cnt):
+        x = 140.0 + rnd.random()
+        y = 40.0 + rnd.random()
+        r = 0.0003
+        #シェープファイルの外周は時計回り
+        ring = [(x + r * math.cos(-2 * math.pi * k / vertex_cnt), y + r * math.sin(-2 * math.pi * k / vertex_cnt)) for k in range(vertex_cnt)]
+        ring.append(ring[0])
+        polygons.append([ring])
+        records.append([str(uuid.UUID(int=rnd.getrandbits(128))), rnd.choice([u"田", u"畑"]), 2019, round(x, 6), round(y, 6)])
+    write_polygon_shapefile(base, polygons, records, FARMLAND_SHP_FIELDS)
+
+def run(feature_cnt :int, vertex_cnt :int, repeat :int, batch_size :int):
+    workdir = tempfile.mkdtemp(prefix="bench_shapefile_")
+    base = os.path.join(workdir, u"02201青森市2019_5")
+    make_farmland_shapefile(base, feature_cnt, vertex_cnt)
+    rates = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        count = 0
+        with FarmlandShapefileReader(base + ".shp") as reader:
+            for wkbs, rows in reader.iter_batches(batch_size):
+                count += len(wkbs)
+        rates.append(count / (time.perf_counter() - t0))
+    print(u"features={0} vertices={1} repeat={2} batch={3} workdir={4}".format(feature_cnt, vertex_cnt, repeat, batch_size, workdir))
+    print(u"  encoding: {0} ({1})".format(reader.encoding, reader.encoding_method))
+    print(u"  read: {0:12.1f} rows/sec (best of {1})".format(max(rates), repeat))
+    return rates
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python.exe benchmarks\bench_shapefile_reader.py --features 100000 --vertices 12 --repeat 3
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", type=int, default=100000)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+    run(args.features, args.vertices, args.repeat, args.batch)
@@ -0,0 +1,103 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       check_change_detect.py
+# Purpose:    確認用スクリプト - 公開年度間の変更抽出（MP_Farmland_ChangeDetect.py）の往復の確認
+#               a)合成した GeoJSON の都道府県フォルダを作成し、exec_batch_convert でフィーチャクラスに変換（synthetic_farmland.py）
+#               b)変換したフィーチャクラスと同じ GeoJSON で変更抽出を実行し、追加・変更・削除が 0 件であることを確認
+#               c)フィーチャクラスの値を、型だけが異なる値（整数 ⇒ 2024.0、NULL ⇔ ""）に書き換えても 0 件であることを確認
+#               d)属性値を1件だけ変えた場合に、変更が 1 件になることを確認
+#             arcpy がない環境（Linux など）では benchmarks/arcpy_standin の簡易スタンドインで実行する
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import json
+import tempfile
+import argparse
+from typing import Tuple,List,Dict
+
+_BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_DIR = os.path.dirname(_BENCH_DIR)
+sys.path.insert(0, _BENCH_DIR)
+sys.path.insert(0, _REPO_DIR)
+sys.path.append(os.path.join(_BENCH_DIR, "arcpy_standin")) #インストール済みの arcpy があればそちらを優先
+os.environ.setdefault("ARCPY_STANDIN_QUIET", "1")
+
+import arcpy
+from synthetic_farmland import make_json_prefecture
+import MP_Farmland_JsonToFeatureClass as json_conv
+import MP_Farmland_ChangeDetect as change_detect
+
+_REPORT_FILE = "farmland_run_report.json"
+
+def detect(old_fc :str, infolder :str, outfolder :str) -> Dict[str, int]:
+    '''
+    変更抽出を実行し、実行レポートから変更の種類ごとの件数を返す
+    '''
+    change_detect.exec_change_detection(old_fc, infolder, outfolder)
+    with open(os.path.join(outfolder, _REPORT_FILE), encoding="utf-8") as fp:
+        report = json.load(fp)
+    counters = dict(report.get("parent", {}).get("counters", {}))
+    counters.update(report.get("counters", {}))
+    return dict((change, counters.get(u"{0}_rows".format(change), 0)) for change in ("added", "modified", "removed", "unchanged"))
+
+def expect(title :str, counts :Dict[str, int], expected :Dict[str, int]):
+    print(u"  {0:<12} {1}".format(title, u", ".join(u"{0}={1}".format(k, v) for k, v in sorted(counts.items()))))
+    if counts != expected:
+        raise AssertionError(u"{0}: 件数が一致しません：{1} / {2}".format(title, counts, expected))
+
+def drift_types(fc :str) -> int:
+    '''
+    値を変えずに型だけを変える（整数 ⇒ float、TEXT の NULL ⇔ ""）。書き換えた値の件数を返す
+    '''
+    fields = [f for f in arcpy.ListFields(fc) if f.type in ("Integer", "SmallInteger", "String") and f.name != change_detect.KEY_FIELD]
+    changed = 0
+    with arcpy.da.UpdateCursor(fc, [f.name for f in fields]) as cursor:
+        for row in cursor:
+            row = list(row)
+            for i, field in enumerate(fields):
+                if field.type == "String":
+                    row[i] = u"" if row[i] is None else (None if row[i] == u"" else row[i])
+                elif row[i] is not None:
+                    row[i] = float(row[i])
+                changed += 1
+            cursor.updateRow(row)
+    return changed
+
+def modify_one(fc :str, field :str = "land_type"):
+    with arcpy.da.UpdateCursor(fc, [field]) as cursor:
+        for row in cursor:
+            cursor.updateRow([(row[0] or 0) + 1])
+            break
+
+def run(cities :int, features :int, workdir :str = None):
+    workdir = workdir or tempfile.mkdtemp(prefix="check_change_detect_")
+    infolder, count = make_json_prefecture(workdir, city_cnt=cities, feature_cnt=features, vertex_cnt=8)
+    outfolder = os.path.join(workdir, u"{0}_filegdb".format(os.path.basename(infolder)))
+    os.makedirs(outfolder, exist_ok=True)
+    json_conv.exec_batch_convert(infolder, outfolder, 1)
+    old_fc = os.path.join(outfolder, u"{0}.gdb".format(os.path.basename(outfolder)), "Farmland")
+    print(u"input={0} features={1}".format(os.path.basename(infolder), count))
+    unchanged = {"added": 0, "modified": 0, "removed": 0, "unchanged": count}
+    expect("round-trip", detect(old_fc, infolder, os.path.join(workdir, "changes_roundtrip")), unchanged)
+    drift_types(old_fc)
+    expect("type drift", detect(old_fc, infolder, os.path.join(workdir, "changes_drift")), unchanged)
+    modify_one(old_fc)
+    expect("modify one", detect(old_fc, infolder, os.path.join(workdir, "changes_modify")),
+           {"added": 0, "modified": 1, "removed": 0, "unchanged": count - 1})
+    print(u"OK")
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python benchmarks/check_change_detect.py
+      python benchmarks/check_change_detect.py --cities 4 --features 5000
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=3)
+    parser.add_argument("--features", type=int, default=1500)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+    run(args.cities, args.features, args.workdir)
@@ -0,0 +1,79 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       check_geojson_reader.py
+# Purpose:    確認用スクリプト - GeoJSON の逐次読込み（FarmlandGeojsonToFeaturesEx.iter_records）の確認
+#               a)合成した GeoJSON ファイルを作成（bench_geometry_fastpath.make_farmland_geojson）
+#               b)ファイル全体と、feature_byte_ranges で分割した範囲ごとの読込みで、同じレコードが同じ順で読めることを確認
+#               c)途中で切れたファイル（Feature の直後の "}," で切れたダウンロードなど）は、
+#                 ファイル全体でも最後の範囲でも ValueError（features 配列が閉じられていません）になることを確認
+#             arcpy がない環境（Linux など）では benchmarks/arcpy_standin の簡易スタンドインで実行する
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import tempfile
+import argparse
+from typing import Tuple,List,Dict
+
+_BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_DIR = os.path.dirname(_BENCH_DIR)
+sys.path.insert(0, _BENCH_DIR)
+sys.path.insert(0, _REPO_DIR)
+sys.path.append(os.path.join(_BENCH_DIR, "arcpy_standin")) #インストール済みの arcpy があればそちらを優先
+os.environ.setdefault("ARCPY_STANDIN_QUIET", "1")
+
+from bench_geometry_fastpath import make_farmland_geojson
+import MP_Farmland_JsonToFeatureClass as json_conv
+
+def read_keys(jsonfile :str, byte_ranges :List = None) -> List[str]:
+    conv = json_conv.FarmlandGeojsonToFeaturesEx()
+    keys = []
+    for byte_range in byte_ranges or [None]:
+        keys += [record["polygon_uuid"] for record in conv.iter_records(jsonfile, "utf-8", byte_range)]
+    return keys
+
+def expect_truncated(title :str, jsonfile :str, byte_ranges :List = None):
+    try:
+        count = len(read_keys(jsonfile, byte_ranges))
+    except ValueError as e:
+        print(u"  {0:<24} ValueError: {1}".format(title, os.path.basename(str(e))))
+        return
+    raise AssertionError(u"{0}: 途中で切れたファイルを {1}件 のレコードとして読み込みました".format(title, count))
+
+def run(features :int, shards :int, workdir :str = None):
+    workdir = workdir or tempfile.mkdtemp(prefix="check_geojson_reader_")
+    jsonfile = os.path.join(workdir, "2024_022012.json")
+    make_farmland_geojson(jsonfile, features, 8)
+    keys = read_keys(jsonfile)
+    if len(keys) != features:
+        raise AssertionError(u"件数が一致しません：{0} / {1}".format(len(keys), features))
+    ranges = json_conv.feature_byte_ranges(jsonfile, shards)
+    if read_keys(jsonfile, ranges) != keys:
+        raise AssertionError(u"範囲ごとに読み込んだレコードが、ファイル全体と一致しません")
+    print(u"features={0} ranges={1}".format(features, len(ranges)))
+    #最後の2件の Feature の手前（"}," の直後）で切れたファイル
+    with open(jsonfile, "rb") as fp:
+        data = fp.read()
+    last = data.rfind(b'"type": "Feature"')
+    cut = data.rfind(b"},", 0, data.rfind(b'"type": "Feature"', 0, last)) + 2
+    truncated = os.path.join(workdir, "2024_022012_truncated.json")
+    with open(truncated, "wb") as fp:
+        fp.write(data[:cut])
+    expect_truncated("truncated (whole file)", truncated)
+    expect_truncated("truncated (byte ranges)", truncated, json_conv.feature_byte_ranges(truncated, shards))
+    print(u"OK")
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python benchmarks/check_geojson_reader.py
+      python benchmarks/check_geojson_reader.py --features 20000 --shards 8
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", type=int, default=3000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+    run(args.features, args.shards, args.workdir)
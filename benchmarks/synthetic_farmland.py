@@ -0,0 +1,94 @@
+#coding:utf-8
+#---------------------------------------------------------------------
+# Name:       synthetic_farmland.py
+# Purpose:    ベンチマーク用 - 合成した都道府県フォルダ（農地筆ポリゴン）の作成
+#               a)GeoJSON 形式    ："<公開年度>_<都道府県コード>\<公開年度>_<地方公共団体コード>.json"
+#               b)シェープファイル形式："<都道府県コード><県名><年度>\<市区町村コード><市区町村名><年度>\*.shp"
+#             市区町村の数・全体の件数・市区町村ごとの件数の偏り（skew）・ポリゴンの頂点数を指定できる
+#             1ファイル分の作成は bench_geometry_fastpath.py / bench_shapefile_reader.py の関数を利用
+# Copyright:   (c) ESRI Japan Corporation
+# ArcGIS Pro Version:   3.3
+# Python Version:   3.9
+#---------------------------------------------------------------------
+import os
+import sys
+import argparse
+from typing import Tuple,List,Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_shapefile_reader import make_farmland_shapefile
+
+def city_sizes(feature_cnt :int, city_cnt :int, skew :float = 1.0) -> List[int]:
+    '''
+    全体の件数を、市区町村ごとの件数に分ける関数（大きい順）
+      skew : 0 の場合は均等、大きいほど先頭の市区町村に集中する（i 番目の重みが 1 / (i + 1) ** skew）
+    '''
+    weights = [1.0 / (i + 1) ** skew for i in range(city_cnt)]
+    total = sum(weights)
+    sizes = [max(1, int(feature_cnt * w / total)) for w in weights]
+    #端数は先頭の市区町村から1件ずつ配る
+    for i in range(max(0, feature_cnt - sum(sizes))):
+        sizes[i % city_cnt] += 1
+    return sizes
+
+def local_government_cd(pref_code :int, city_index :int) -> str:
+    '''
+    都道府県コードと市区町村の番号から、検査数字付きの6桁の地方公共団体コードを返す関数（例：02201 ⇒ "022012"）
+    '''
+    code = u"{0:02d}{1:03d}".format(pref_code, 201 + city_index)
+    check = (11 - sum(int(c) * w for c, w in zip(code, [6, 5, 4, 3, 2])) % 11) % 10
+    return code + str(check)
+
+def make_json_prefecture(rootfolder :str, pref_code :int = 2, year :int = 2024, city_cnt :int = 10, feature_cnt :int = 100000,
+                         skew :float = 1.0, vertex_cnt :int = 12, seed :int = 1) -> Tuple[str, int]:
+    '''
+    GeoJSON 形式の都道府県フォルダを作成し、(フォルダのパス, 作成した件数) を返す関数
+    '''
+    from bench_geometry_fastpath import make_farmland_geojson #arcpy（スタンドイン）をインポートするので、使うときだけ読み込む
+    infolder = os.path.join(rootfolder, u"{0}_{1:02d}".format(year, pref_code))
+    os.makedirs(infolder, exist_ok=True)
+    sizes = city_sizes(feature_cnt, city_cnt, skew)
+    for i, size in enumerate(sizes):
+        code = local_government_cd(pref_code, i)
+        jsonfile = os.path.join(infolder, u"{0}_{1}.json".format(year, code))
+        make_farmland_geojson(jsonfile, size, vertex_cnt, seed + i, local_government_cd=code, issue_year=year)
+    return infolder, sum(sizes)
+
+def make_shapefile_prefecture(rootfolder :str, pref_code :int = 2, year :int = 2019, city_cnt :int = 10, feature_cnt :int = 100000,
+                              skew :float = 1.0, vertex_cnt :int = 12, seed :int = 1) -> Tuple[str, int]:
+    '''
+    シェープファイル形式の都道府県フォルダを作成し、(フォルダのパス, 作成した件数) を返す関数
+    （市区町村フォルダ名の先頭5桁が CITYCODE、末尾4桁が年度、その間が CITYNAME になる）
+    '''
+    infolder = os.path.join(rootfolder, u"{0:02d}合成県{1}".format(pref_code, year))
+    sizes = city_sizes(feature_cnt, city_cnt, skew)
+    for i, size in enumerate(sizes):
+        cityname = u"{0}合成{1}市{2}".format(local_government_cd(pref_code, i)[:5], i + 1, year)
+        cityfolder = os.path.join(infolder, cityname)
+        os.makedirs(cityfolder, exist_ok=True)
+        make_farmland_shapefile(os.path.join(cityfolder, cityname), size, vertex_cnt, seed + i)
+    return infolder, sum(sizes)
+
+if __name__ == '__main__':
+    '''
+    実行例）
+      python.exe benchmarks\synthetic_farmland.py json "your_dir\synthetic" --cities 40 --features 1000000 --skew 1.2
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("layout", choices=["json", "shp"])
+    parser.add_argument("rootfolder")
+    parser.add_argument("--pref", type=int, default=2)
+    parser.add_argument("--year", type=int, default=None)
+    parser.add_argument("--cities", type=int, default=10)
+    parser.add_argument("--features", type=int, default=100000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.layout == "json":
+        #arcpy がない環境では、スタンドインを使う（インストール済みの arcpy があればそちらを優先）
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "arcpy_standin"))
+        folder, count = make_json_prefecture(args.rootfolder, args.pref, args.year or 2024, args.cities, args.features, args.skew, args.vertices, args.seed)
+    else:
+        folder, count = make_shapefile_prefecture(args.rootfolder, args.pref, args.year or 2019, args.cities, args.features, args.skew, args.vertices, args.seed)
+    print(u"{0} ({1} features)".format(folder, count))